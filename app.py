@@ -1,28 +1,45 @@
-from flask import Flask, render_template, request, redirect, url_for, session, jsonify
+from flask import (Flask, Response, get_template_attribute, make_response, render_template, request, redirect,
+                   stream_with_context, url_for, session, jsonify)
 from werkzeug.security import generate_password_hash, check_password_hash
-import sqlite3
+import csv
+import io
+import json
 import os
+import sqlite3
 from functools import wraps
-from datetime import datetime
+from datetime import datetime, timedelta
 import random
 import string
+from database import (DB_NAME, SHARD_DIR, Order, Table, User, busy_stats, get_db, get_order_db, init_app, pool,
+                      query_orders_all, shard_codes, write_transaction)
+from audit_search import COLUMNAS as COLUMNAS_AUDITORIA, Filtros, buscar
+from backup import programador
+from catalog import catalog
+from exports import FORMATOS, Filtros as FiltrosExportacion, Nombres, filas as filas_exportacion, gzip_trozos
+from events import hub
+from inventory import SinStock, inventory
+from metrics import metrics
+from migrations import migrate
+from production import board
+from rollups import DIMENSIONES, rango, registrar_cierre, reporte
+from slowlog import slowlog
+from utils import audit_log, audit_writer
+from versions import versions
 
 app = Flask(__name__)
 app.secret_key = os.getenv("SECRET_KEY", "taqueria-pro-secret-key-2024")
 
-DB_PATH = 'taqueria.db'
+DB_PATH = DB_NAME
+init_app(app)
+metrics.init_app(app)
+versions.init_app(app)
+programador.init_app(app)
+if slowlog:
+    slowlog.init_app(app)
 
-# ============ DATABASE HELPERS ============
-def get_db():
-    db = sqlite3.connect(DB_PATH)
-    db.row_factory = sqlite3.Row
-    return db
-
-def init_db_if_needed():
-    """Inicializa BD si no existe"""
-    if not os.path.exists(DB_PATH):
-        from init_db import init_database
-        init_database()
+# ============ STARTUP ============
+# Esquema y migraciones una sola vez por worker (no en cada request)
+migrate(DB_PATH)
 
 # ============ DECORATORS ============
 def login_required(f):
@@ -48,23 +65,159 @@ def generar_codigo():
     """Genera código único de 6 caracteres"""
     return ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
 
-def audit_log(usuario, accion, detalle=""):
-    """Registra acciones en auditoría"""
-    try:
-        db = get_db()
-        db.execute(
-            'INSERT INTO audit_log (usuario, accion, detalle, timestamp) VALUES (?, ?, ?, ?)',
-            (usuario, accion, detalle, datetime.now().isoformat())
-        )
-        db.commit()
-        db.close()
-    except Exception as e:
-        print(f"Error audit_log: {e}")
+# Cada EVENTOS_PODA eventos se borran los anteriores a los últimos EVENTOS_RETENIDOS
+EVENTOS_PODA = 500
+EVENTOS_RETENIDOS = 5000
+
+def cargar_evento(db, evento, order_id, codigo):
+    """Datos de un evento de orden: la orden con sus items"""
+    order = db.execute('''
+        SELECT o.id, o.codigo_cocina, o.status, o.total, o.created_at, u.username as mesero
+        FROM orders o
+        LEFT JOIN users u ON u.id = o.mesero_id
+        WHERE o.id = ?
+    ''', (order_id,)).fetchone()
+
+    if not order:
+        # Orden cancelada (ya borrada): basta el id para quitarla de pantalla
+        return {'order': {'id': order_id, 'codigo_cocina': codigo, 'status': 'cancelada'}, 'items': []}
+
+    items = db.execute('''
+        SELECT oi.qty, p.name as producto, oi.unit_price, oi.notes,
+               (oi.qty * oi.unit_price) as subtotal
+        FROM order_items oi
+        JOIN products p ON p.id = oi.product_id
+        WHERE oi.order_id = ?
+    ''', (order_id,)).fetchall()
+
+    return {'order': dict(order), 'items': [dict(item) for item in items]}
+
+def registrar_evento(db, evento, order_id, codigo):
+    """Anota el evento dentro de la transacción para los demás workers"""
+    event_id = db.execute(
+        'INSERT INTO order_events (codigo_cocina, event, order_id, pid, created_at) VALUES (?, ?, ?, ?, ?)',
+        (codigo, evento, order_id, os.getpid(), datetime.now().isoformat())
+    ).lastrowid
+    if event_id % EVENTOS_PODA == 0:
+        db.execute('DELETE FROM order_events WHERE id <= ?', (event_id - EVENTOS_RETENIDOS,))
+
+def publicar_orden(evento, order_id, codigo, data=None):
+    """Publica un evento de orden (con items) a las pantallas locales de su cocina"""
+    if not hub.has_subscribers(codigo):
+        return
+    hub.publish(codigo, evento, data or cargar_evento(get_order_db(codigo), evento, order_id, codigo))
+
+def motivo_no_disponible(db, order_id, mesero_id=None):
+    """Por qué una transición no aplicó: (código HTTP, cuerpo del error)"""
+    order = db.execute('SELECT mesero_id, status FROM orders WHERE id = ?', (order_id,)).fetchone()
+    if not order:
+        return 404, {'error': 'Orden no encontrada'}
+    if mesero_id is not None and order['mesero_id'] != mesero_id:
+        return 403, {'error': 'No autorizado'}
+    return 409, {'error': f"Orden en estado {order['status']}", 'status': order['status']}
+
+def orden_no_disponible(db, order_id, mesero_id=None):
+    """Respuesta cuando una transición no aplicó: 404, 403 o 409 según la orden"""
+    codigo, cuerpo = motivo_no_disponible(db, order_id, mesero_id)
+    return jsonify(cuerpo), codigo
+
+def lineas_orden(db, order_id):
+    """(product_id, qty) de los items de una orden, para apartar o devolver stock"""
+    return [(row['product_id'], row['qty'])
+            for row in db.execute('SELECT product_id, qty FROM order_items WHERE order_id = ?', (order_id,))]
+
+def crear_borrador_mesa(db, mesero_id, codigo, table_id=None):
+    """Borrador abierto del mesero en la mesa, o uno nuevo: (order_id, creado).
+
+    Va dentro de la transacción de escritura para que dos workers no creen
+    dos borradores de la misma mesa. Sin mesa siempre crea uno. LookupError
+    si la mesa no existe (con shards la llave foránea no cruza de BD).
+    """
+    if table_id is not None:
+        existente = db.execute('''
+            SELECT o.id FROM table_orders tbl
+            JOIN orders o ON o.id = tbl.order_id
+            WHERE tbl.table_id = ? AND o.mesero_id = ? AND o.status = 'borrador'
+        ''', (table_id, mesero_id)).fetchone()
+        if existente:
+            return existente['id'], False
+        if not db.execute('SELECT 1 FROM tables WHERE id = ?', (table_id,)).fetchone():
+            raise LookupError('Mesa no encontrada')
+    now = datetime.now().isoformat()
+    order_id = db.execute(
+        'INSERT INTO orders (mesero_id, codigo_cocina, status, total, created_at) VALUES (?, ?, ?, ?, ?)',
+        (mesero_id, codigo, 'borrador', 0, now)
+    ).lastrowid
+    if table_id is not None:
+        db.execute('INSERT INTO table_orders (order_id, table_id, created_at) VALUES (?, ?, ?)',
+                   (order_id, table_id, now))
+    return order_id, True
+
+def enviar_con_items(db, reserva, order_id, mesero_id, lineas):
+    """Agrega (product_id, qty, notes) a un borrador y lo envía a cocina.
+
+    Precios del catálogo, total, items, descuento de stock y evento van en
+    la transacción de `db`. Devuelve la orden, o None si no es un borrador
+    del mesero (sin cambios). Lanza SinStock: quien llama deshace.
+    """
+    productos = catalog.get()
+    precios = {product_id: productos.get(product_id)['price'] for product_id, _, _ in lineas}
+    total = sum(qty * precios[product_id] for product_id, qty, _ in lineas)
+    order = Order.transicion(db, order_id, 'pendiente', mesero_id=mesero_id, sumar_total=total)
+    if not order:
+        return None
+    db.executemany(
+        'INSERT INTO order_items (order_id, product_id, qty, unit_price, notes) VALUES (?, ?, ?, ?, ?)',
+        [(order_id, product_id, qty, precios[product_id], notes) for product_id, qty, notes in lineas]
+    )
+    reserva.apartar((product_id, qty) for product_id, qty, _ in lineas)
+    registrar_evento(db, 'order_created', order_id, order['codigo_cocina'])
+    return order
+
+def mensaje_sin_stock(e):
+    productos = catalog.get()
+    nombres = [productos.get(product_id)['name'] for product_id in e.product_ids if productos.get(product_id)]
+    return f"Sin stock suficiente: {', '.join(nombres)}"
+
+def sin_stock(e):
+    return jsonify({'error': mensaje_sin_stock(e), 'product_ids': e.product_ids}), 409
+
+def _version_assets():
+    """Cambia con cada deploy: las plantillas forman parte del HTML con ETag"""
+    marcas = []
+    for carpeta in ('templates', 'static'):
+        for raiz, _, archivos in os.walk(os.path.join(app.root_path, carpeta)):
+            marcas.extend(int(os.path.getmtime(os.path.join(raiz, f))) for f in archivos)
+    return format(max(marcas, default=0), 'x')
 
-# ============ BEFORE/AFTER REQUEST ============
-@app.before_request
-def before_request():
-    init_db_if_needed()
+ASSET_VERSION = _version_assets()
+
+def etag_cocina(codigo, *extra):
+    """ETag fuerte a partir de la versión en memoria de la cocina"""
+    return '-'.join(str(parte) for parte in (codigo, versions.get(codigo), ASSET_VERSION, *extra))
+
+def no_modificado(etag):
+    """304 si el cliente ya tiene esta versión; None si hay que generar la respuesta"""
+    if etag and request.if_none_match.contains(etag):
+        return con_etag(app.response_class(status=304), etag)
+    return None
+
+def con_etag(respuesta, etag):
+    respuesta = make_response(respuesta)
+    if etag:
+        respuesta.set_etag(etag)
+        # Siempre revalidar: el navegador manda If-None-Match en cada carga
+        respuesta.headers['Cache-Control'] = 'no-cache'
+    return respuesta
+
+def codigo_sesion():
+    """Código de cocina del usuario: el enlazado (mesero/caja) o el propio (cocina)"""
+    codigo = session.get('codigo_cocina')
+    if not codigo and session.get('role') == 'cocina':
+        codigo = User.get_cocina_code(session['user_id'])
+    return codigo
+
+hub.start_relay(cargar_evento)
 
 # ============ AUTH ROUTES ============
 @app.route('/')
@@ -93,7 +246,6 @@ def login():
         try:
             db = get_db()
             user = db.execute('SELECT * FROM users WHERE username = ?', (username,)).fetchone()
-            db.close()
             
             if user and check_password_hash(user['password'], password):
                 session.update({
@@ -107,7 +259,6 @@ def login():
                 db.execute('UPDATE users SET last_login = ? WHERE id = ?',
                           (datetime.now().isoformat(), user['id']))
                 db.commit()
-                db.close()
                 
                 audit_log(username, 'Login', 'Ingreso exitoso')
                 
@@ -144,7 +295,6 @@ def register():
             existing = db.execute('SELECT id FROM users WHERE username = ?', (username,)).fetchone()
             
             if existing:
-                db.close()
                 return render_template('register.html', error='Usuario ya existe')
             
             hashed = generate_password_hash(password, method='pbkdf2:sha256')
@@ -153,7 +303,6 @@ def register():
                 (username, hashed, role, 1, datetime.now().isoformat())
             )
             db.commit()
-            db.close()
             
             audit_log(username, 'Registro', f'Registro como {role}')
             return render_template('register.html', success='✅ Cuenta creada! Inicia sesión.')
@@ -173,21 +322,18 @@ def logout():
 @login_required
 @role_required('mesero')
 def mesero_dashboard():
-    db = get_db()
-    
     codigo = session.get('codigo_cocina')
+    db = get_order_db(codigo)
     
+    # Sin GROUP BY: el índice parcial de órdenes activas ya da el orden
     orders = db.execute('''
         SELECT o.id, o.status, o.created_at, o.total,
-               COUNT(oi.id) as items_count
+               (SELECT COUNT(*) FROM order_items oi WHERE oi.order_id = o.id) as items_count
         FROM orders o
-        LEFT JOIN order_items oi ON oi.order_id = o.id
         WHERE o.mesero_id = ? AND o.status != 'cerrada'
-        GROUP BY o.id
         ORDER BY o.created_at DESC
     ''', (session['user_id'],)).fetchall()
     
-    db.close()
     return render_template('mesero.html', codigo_actual=codigo, orders=orders)
 
 @app.route('/mesero/enlazar-cocina', methods=['POST'])
@@ -202,7 +348,6 @@ def enlazar_cocina():
     
     db = get_db()
     cocina = db.execute('SELECT * FROM cocinas WHERE codigo = ?', (codigo,)).fetchone()
-    db.close()
     
     if not cocina:
         return jsonify({'error': 'Código inválido'}), 400
@@ -227,105 +372,400 @@ def crear_orden():
     if not codigo:
         return jsonify({'error': 'No enlazado a cocina'}), 400
     
-    db = get_db()
-    db.execute(
-        'INSERT INTO orders (mesero_id, codigo_cocina, status, total, created_at) VALUES (?, ?, ?, ?, ?)',
-        (session['user_id'], codigo, 'borrador', 0, datetime.now().isoformat())
-    )
-    db.commit()
+    with write_transaction(get_order_db(codigo)) as db:
+        order = db.execute(
+            'INSERT INTO orders (mesero_id, codigo_cocina, status, total, created_at) VALUES (?, ?, ?, ?, ?) '
+            'RETURNING id, status, total, created_at',
+            (session['user_id'], codigo, 'borrador', 0, datetime.now().isoformat())
+        ).fetchone()
     
-    order_id = db.execute('SELECT last_insert_rowid() as id').fetchone()['id']
-    db.close()
+    audit_log(session['username'], 'Orden creada', f'#{order["id"]}')
+    return jsonify({'success': True, 'order_id': order['id'], 'order': dict(order)})
+
+@app.route('/mesero/mesas')
+@login_required
+@role_required('mesero')
+def mesero_mesas():
+    return render_template('mesero_mesas.html', codigo_actual=session.get('codigo_cocina'), mesas=Table.all())
+
+@app.route('/mesero/mesa/<int:table_id>/orden', methods=['POST'])
+@login_required
+@role_required('mesero')
+def mesero_mesa_orden(table_id):
+    """Devuelve el borrador abierto de la mesa o crea uno nuevo"""
+    codigo = session.get('codigo_cocina')
+    if not codigo:
+        return jsonify({'error': 'No enlazado a cocina'}), 400
     
-    audit_log(session['username'], 'Orden creada', f'#{order_id}')
+    try:
+        # La búsqueda va dentro de la transacción: dos workers no crean
+        # dos borradores para la misma mesa
+        with write_transaction(get_order_db(codigo)) as db:
+            order_id, creado = crear_borrador_mesa(db, session['user_id'], codigo, table_id)
+    except LookupError as e:
+        return jsonify({'error': str(e)}), 404
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+    if not creado:
+        return jsonify({'success': True, 'order_id': order_id})
+    
+    audit_log(session['username'], 'Orden creada', f'#{order_id} mesa {table_id}')
     return jsonify({'success': True, 'order_id': order_id})
 
+@app.route('/mesero/orden/<int:order_id>')
+@login_required
+@role_required('mesero')
+def mesero_orden(order_id):
+    """Menú para capturar una orden en borrador (productos desde la caché)"""
+    db = get_order_db(session.get('codigo_cocina'))
+    order = db.execute('SELECT mesero_id, status FROM orders WHERE id = ?', (order_id,)).fetchone()
+    
+    if not order or order['mesero_id'] != session['user_id'] or order['status'] != 'borrador':
+        return redirect(url_for('mesero_dashboard'))
+    
+    return render_template('mesero_orden.html', order_id=order_id, productos=catalog.get().productos,
+                           disponibilidad=inventory.estado())
+
+@app.route('/mesero/orden/<int:order_id>/tarjeta')
+@login_required
+@role_required('mesero')
+def mesero_tarjeta_orden(order_id):
+    """Tarjeta de una orden del panel, para reemplazarla sin recargar la página"""
+    order = get_order_db(session.get('codigo_cocina')).execute('''
+        SELECT o.id, o.status, o.created_at, o.total,
+               (SELECT COUNT(*) FROM order_items oi WHERE oi.order_id = o.id) as items_count
+        FROM orders o
+        WHERE o.id = ? AND o.mesero_id = ? AND o.status != 'cerrada'
+    ''', (order_id, session['user_id'])).fetchone()
+    if not order:
+        return jsonify({'error': 'Orden no encontrada'}), 404
+    return get_template_attribute('fragmentos.html', 'tarjeta_orden_mesero')(order)
+
+@app.route('/api/menu/disponibilidad')
+@login_required
+def api_menu_disponibilidad():
+    """Agotados y con poco stock, desde memoria (sin consultas)"""
+    return jsonify(inventory.estado())
+
 @app.route('/mesero/agregar-item', methods=['POST'])
 @login_required
 @role_required('mesero')
 def agregar_item():
     data = request.get_json()
     
-    db = get_db()
-    product = db.execute('SELECT * FROM products WHERE id = ?', (data['product_id'],)).fetchone()
+    product = catalog.get().get(int(data['product_id']))
     
     if not product:
-        db.close()
         return jsonify({'error': 'Producto no encontrado'}), 404
+    if product['id'] in inventory.estado()['agotados']:
+        return sin_stock(SinStock([product['id']]))
     
     try:
-        db.execute(
-            'INSERT INTO order_items (order_id, product_id, qty, unit_price, notes) VALUES (?, ?, ?, ?, ?)',
-            (data['order_id'], data['product_id'], data['qty'], product['price'], data.get('notes', ''))
-        )
-        db.commit()
-        db.close()
+        with write_transaction(get_order_db(session.get('codigo_cocina'))) as db:
+            # Solo se agregan items a borradores propios
+            order = db.execute(
+                "UPDATE orders SET total = total + ? WHERE id = ? AND mesero_id = ? AND status = 'borrador' RETURNING id",
+                (data['qty'] * product['price'], data['order_id'], session['user_id'])
+            ).fetchone()
+            if not order:
+                return orden_no_disponible(db, data['order_id'], session['user_id'])
+            db.execute(
+                'INSERT INTO order_items (order_id, product_id, qty, unit_price, notes) VALUES (?, ?, ?, ?, ?)',
+                (data['order_id'], data['product_id'], data['qty'], product['price'], data.get('notes', ''))
+            )
         return jsonify({'success': True})
     except Exception as e:
-        db.close()
         return jsonify({'error': str(e)}), 500
 
 @app.route('/mesero/enviar-orden/<int:order_id>', methods=['POST'])
 @login_required
 @role_required('mesero')
 def enviar_orden(order_id):
-    db = get_db()
-    
-    # Calcular total
-    total = db.execute('''
-        SELECT COALESCE(SUM(qty * unit_price), 0) as total
-        FROM order_items WHERE order_id = ?
-    ''', (order_id,)).fetchone()['total']
-    
-    db.execute(
-        'UPDATE orders SET status = ?, total = ?, updated_at = ? WHERE id = ?',
-        ('pendiente', total, datetime.now().isoformat(), order_id)
-    )
-    db.commit()
-    db.close()
+    db = get_order_db(session.get('codigo_cocina'))
+    try:
+        # El stock se descuenta en la transacción del envío: si no alcanza no se envía nada
+        with inventory.reserva(db) as reserva, write_transaction(db):
+            order = Order.transicion(db, order_id, 'pendiente', mesero_id=session['user_id'], recalcular_total=True)
+            if not order:
+                return orden_no_disponible(db, order_id, session['user_id'])
+            reserva.apartar(lineas_orden(db, order_id))
+            registrar_evento(db, 'order_created', order_id, order['codigo_cocina'])
+    except SinStock as e:
+        return sin_stock(e)
     
+    publicar_orden('order_created', order_id, order['codigo_cocina'])
     audit_log(session['username'], 'Orden enviada', f'#{order_id} a cocina')
-    return jsonify({'success': True})
+    return jsonify({'success': True, 'order': dict(order)})
+
+@app.route('/mesero/orden/<int:order_id>/enviar-lote', methods=['POST'])
+@login_required
+@role_required('mesero')
+def enviar_orden_lote(order_id):
+    """Agrega todos los items y envía la orden a cocina en una sola transacción.
+
+    La pantalla del mesero manda lo mismo por /mesero/sync (enviar_orden con
+    items); esta ruta queda para clientes de la API y los benchmarks.
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        lineas = _lineas_de_op(data.get('items') or [])
+    except OperacionRechazada as e:
+        cuerpo = {k: v for k, v in e.resultado.items() if k not in ('ok', 'status_code')}
+        return jsonify(cuerpo), e.resultado['status_code']
+
+    db = get_order_db(session.get('codigo_cocina'))
+    try:
+        with inventory.reserva(db) as reserva, write_transaction(db):
+            order = enviar_con_items(db, reserva, order_id, session['user_id'], lineas)
+            if not order:
+                return orden_no_disponible(db, order_id, session['user_id'])
+    except SinStock as e:
+        return sin_stock(e)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+    publicar_orden('order_created', order_id, order['codigo_cocina'])
+    audit_log(session['username'], 'Orden enviada', f'#{order_id} a cocina ({len(lineas)} items)')
+    return jsonify({'success': True, 'order_id': order_id, 'total': order['total'], 'order': dict(order)})
 
 @app.route('/mesero/cancelar-orden/<int:order_id>', methods=['POST'])
 @login_required
 @role_required('mesero')
 def cancelar_orden(order_id):
-    db = get_db()
-    order = db.execute('SELECT * FROM orders WHERE id = ?', (order_id,)).fetchone()
-    
-    if not order or order['mesero_id'] != session['user_id']:
-        db.close()
-        return jsonify({'error': 'No autorizado'}), 403
+    db = get_order_db(session.get('codigo_cocina'))
+    with inventory.reserva(db) as reserva, write_transaction(db):
+        lineas = lineas_orden(db, order_id)
+        order = Order.cancelar(db, order_id, session['user_id'])
+        if not order:
+            return orden_no_disponible(db, order_id, session['user_id'])
+        
+        # Solo las pendientes están en la pantalla de cocina (y tienen stock descontado)
+        avisar = order['status'] == 'pendiente'
+        if avisar:
+            registrar_evento(db, 'order_cancelled', order_id, order['codigo_cocina'])
+            reserva.reponer(lineas)
     
-    db.execute('DELETE FROM order_items WHERE order_id = ?', (order_id,))
-    db.execute('DELETE FROM orders WHERE id = ?', (order_id,))
-    db.commit()
-    db.close()
+    if avisar:
+        publicar_orden('order_cancelled', order_id, order['codigo_cocina'])
     
     audit_log(session['username'], 'Orden cancelada', f'#{order_id}')
-    return jsonify({'success': True})
+    return jsonify({'success': True, 'order_id': order_id})
+
+# ============ SYNC OFFLINE (MESERO) ============
+# El cliente encola sus acciones sin conexión y las manda en lotes; cada
+# operación trae una llave generada en el navegador
+SYNC_MAX_OPS = 100
+SYNC_RETENCION = timedelta(days=7)
+
+class OperacionRechazada(Exception):
+    """Operación del lote que no aplica: se guarda su resultado y el lote sigue"""
+
+    def __init__(self, status_code, error, **extra):
+        super().__init__(error)
+        self.resultado = {'ok': False, 'status_code': status_code, 'error': error, **extra}
+
+def _rechazo_no_disponible(db, order_id, mesero_id):
+    codigo, cuerpo = motivo_no_disponible(db, order_id, mesero_id)
+    return OperacionRechazada(codigo, cuerpo.pop('error'), **cuerpo)
+
+def _apartar(reserva, lineas):
+    try:
+        reserva.apartar(lineas)
+    except SinStock as e:
+        raise OperacionRechazada(409, mensaje_sin_stock(e), product_ids=e.product_ids)
+
+def _orden_de_op(db, op, mesero_id):
+    """order_id directo o la llave del crear_orden que la creó (en este lote o en uno anterior)"""
+    if op.get('order_ref'):
+        row = db.execute('SELECT order_id FROM sync_ops WHERE mesero_id = ? AND key = ?',
+                         (mesero_id, str(op['order_ref']))).fetchone()
+        if not row or row['order_id'] is None:
+            raise OperacionRechazada(404, 'Orden no sincronizada')
+        return row['order_id']
+    try:
+        return int(op['order_id'])
+    except (KeyError, TypeError, ValueError):
+        raise OperacionRechazada(400, 'Orden inválida')
+
+def _lineas_de_op(items):
+    try:
+        lineas = [(int(item['product_id']), int(item['qty']), item.get('notes', '')) for item in items]
+    except (KeyError, TypeError, ValueError, AttributeError):
+        raise OperacionRechazada(400, 'Items inválidos')
+    if not lineas or any(qty <= 0 for _, qty, _ in lineas):
+        raise OperacionRechazada(400, 'Items inválidos')
+    productos = catalog.get()
+    faltantes = sorted({product_id for product_id, _, _ in lineas if product_id not in productos.by_id})
+    if faltantes:
+        raise OperacionRechazada(404, 'Producto no encontrado', product_ids=faltantes)
+    return lineas
+
+def aplicar_op(db, reserva, op, codigo, efectos):
+    """Aplica una operación dentro de la transacción del lote; efectos se publican tras el commit"""
+    mesero_id = session['user_id']
+    tipo = op.get('op')
+
+    if tipo == 'crear_orden':
+        try:
+            mesa = None if op.get('mesa') is None else int(op['mesa'])
+        except (TypeError, ValueError):
+            raise OperacionRechazada(400, 'Mesa inválida')
+        try:
+            order_id, creado = crear_borrador_mesa(db, mesero_id, codigo, mesa)
+        except LookupError as e:
+            raise OperacionRechazada(404, str(e))
+        if creado:
+            efectos.append({'auditoria': ('Orden creada', f'#{order_id} (sync)')})
+        return {'ok': True, 'order_id': order_id}
+
+    order_id = _orden_de_op(db, op, mesero_id)
+
+    if tipo == 'agregar_item':
+        [(product_id, qty, notes)] = _lineas_de_op([op])
+        if product_id in inventory.estado()['agotados']:
+            raise OperacionRechazada(409, mensaje_sin_stock(SinStock([product_id])), product_ids=[product_id])
+        precio = catalog.get().get(product_id)['price']
+        order = db.execute(
+            "UPDATE orders SET total = total + ? WHERE id = ? AND mesero_id = ? AND status = 'borrador' RETURNING id",
+            (qty * precio, order_id, mesero_id)
+        ).fetchone()
+        if not order:
+            raise _rechazo_no_disponible(db, order_id, mesero_id)
+        db.execute('INSERT INTO order_items (order_id, product_id, qty, unit_price, notes) VALUES (?, ?, ?, ?, ?)',
+                   (order_id, product_id, qty, precio, notes))
+        return {'ok': True, 'order_id': order_id}
+
+    if tipo == 'enviar_orden':
+        if op.get('items'):
+            # Items y envío en la misma operación
+            lineas = _lineas_de_op(op['items'])
+            try:
+                order = enviar_con_items(db, reserva, order_id, mesero_id, lineas)
+            except SinStock as e:
+                raise OperacionRechazada(409, mensaje_sin_stock(e), product_ids=e.product_ids)
+            if not order:
+                raise _rechazo_no_disponible(db, order_id, mesero_id)
+        else:
+            order = Order.transicion(db, order_id, 'pendiente', mesero_id=mesero_id, recalcular_total=True)
+            if not order:
+                raise _rechazo_no_disponible(db, order_id, mesero_id)
+            _apartar(reserva, lineas_orden(db, order_id))
+            registrar_evento(db, 'order_created', order_id, order['codigo_cocina'])
+        efectos.append({'evento': ('order_created', order_id, order['codigo_cocina']),
+                        'auditoria': ('Orden enviada', f'#{order_id} a cocina (sync)')})
+        return {'ok': True, 'order_id': order_id, 'total': order['total']}
+
+    if tipo == 'cancelar_orden':
+        lineas = lineas_orden(db, order_id)
+        order = Order.cancelar(db, order_id, mesero_id)
+        if not order:
+            raise _rechazo_no_disponible(db, order_id, mesero_id)
+        efecto = {'auditoria': ('Orden cancelada', f'#{order_id} (sync)')}
+        if order['status'] == 'pendiente':
+            registrar_evento(db, 'order_cancelled', order_id, order['codigo_cocina'])
+            reserva.reponer(lineas)
+            efecto.update(evento=('order_cancelled', order_id, order['codigo_cocina']))
+        efectos.append(efecto)
+        return {'ok': True, 'order_id': order_id}
+
+    raise OperacionRechazada(400, f'Operación desconocida: {tipo}')
+
+@app.route('/mesero/sync', methods=['POST'])
+@login_required
+@role_required('mesero')
+def mesero_sync():
+    """Aplica en orden un lote de operaciones encoladas por el cliente.
+
+    El resultado de cada llave se guarda en sync_ops en la misma
+    transacción que la operación: reenviar el lote (timeout, reconexión,
+    otra pestaña) devuelve los mismos resultados sin duplicar órdenes ni
+    items. Una operación rechazada no detiene a las siguientes.
+    """
+    data = request.get_json(silent=True) or {}
+    ops = data.get('ops')
+    if not isinstance(ops, list) or not ops:
+        return jsonify({'error': 'Operaciones inválidas'}), 400
+    if len(ops) > SYNC_MAX_OPS:
+        return jsonify({'error': f'Máximo {SYNC_MAX_OPS} operaciones por lote'}), 413
+    if any(not isinstance(op, dict) or not isinstance(op.get('key'), str) or not 0 < len(op['key']) <= 64
+           for op in ops):
+        return jsonify({'error': 'Cada operación necesita una llave'}), 400
+
+    codigo = session.get('codigo_cocina')
+    if not codigo:
+        return jsonify({'error': 'No enlazado a cocina'}), 400
+
+    mesero_id = session['user_id']
+    resultados, efectos = [], []
+    try:
+        db = get_order_db(codigo)
+        with inventory.reserva(db) as reserva, write_transaction(db):
+            now = datetime.now()
+            db.execute('DELETE FROM sync_ops WHERE mesero_id = ? AND created_at < ?',
+                       (mesero_id, (now - SYNC_RETENCION).isoformat()))
+            for op in ops:
+                previo = db.execute('SELECT resultado FROM sync_ops WHERE mesero_id = ? AND key = ?',
+                                    (mesero_id, op['key'])).fetchone()
+                if previo:
+                    resultados.append(dict(json.loads(previo['resultado']), key=op['key'], repetida=True))
+                    continue
+
+                # Cada operación en su savepoint: si se rechaza solo se deshace ella
+                db.execute('SAVEPOINT sync_op')
+                try:
+                    resultado = aplicar_op(db, reserva, op, codigo, efectos)
+                except OperacionRechazada as e:
+                    resultado = e.resultado
+                except sqlite3.IntegrityError as e:
+                    resultado = OperacionRechazada(400, str(e)).resultado
+                if not resultado['ok']:
+                    db.execute('ROLLBACK TO sync_op')
+                db.execute('RELEASE sync_op')
+                db.execute(
+                    'INSERT INTO sync_ops (mesero_id, key, order_id, resultado, created_at) VALUES (?, ?, ?, ?, ?)',
+                    (mesero_id, op['key'], resultado.get('order_id'), json.dumps(resultado), now.isoformat())
+                )
+                resultados.append(dict(resultado, key=op['key']))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+    for efecto in efectos:
+        if 'evento' in efecto:
+            publicar_orden(*efecto['evento'])
+        audit_log(session['username'], *efecto['auditoria'])
+    return jsonify({'success': True, 'results': resultados})
 
 # ============ COCINA ROUTES ============
 @app.route('/cocina')
 @login_required
 @role_required('cocina')
 def cocina_dashboard():
+    codigo = session.get('codigo_cocina')
+    etag = codigo and etag_cocina(codigo, session['user_id'])
+    respuesta = no_modificado(etag)
+    if respuesta is not None:
+        return respuesta
+    
     db = get_db()
     
     # Get or create cocina code
     cocina = db.execute('SELECT codigo FROM cocinas WHERE user_id = ?', (session['user_id'],)).fetchone()
-    codigo = cocina['codigo'] if cocina else generar_codigo()
     
     if not cocina:
-        db.execute(
-            'INSERT INTO cocinas (user_id, codigo, created_at) VALUES (?, ?, ?)',
-            (session['user_id'], codigo, datetime.now().isoformat())
-        )
-        db.commit()
+        with write_transaction(db):
+            # Otro worker pudo crearlo entre la lectura y el candado
+            cocina = db.execute('SELECT codigo FROM cocinas WHERE user_id = ?', (session['user_id'],)).fetchone()
+            if not cocina:
+                db.execute(
+                    'INSERT INTO cocinas (user_id, codigo, created_at) VALUES (?, ?, ?)',
+                    (session['user_id'], generar_codigo(), datetime.now().isoformat())
+                )
+                cocina = db.execute('SELECT codigo FROM cocinas WHERE user_id = ?', (session['user_id'],)).fetchone()
+    codigo = cocina['codigo']
+    session['codigo_cocina'] = codigo
     
     # Get pending orders
-    ordenes = db.execute('''
+    ordenes = get_order_db(codigo).execute('''
         SELECT o.id, o.created_at, u.username as mesero
         FROM orders o
         LEFT JOIN users u ON u.id = o.mesero_id
@@ -333,13 +773,66 @@ def cocina_dashboard():
         ORDER BY o.created_at ASC
     ''', (codigo,)).fetchall()
     
-    db.close()
-    return render_template('cocina_mesas.html', mi_codigo=codigo, ordenes=ordenes)
+    etag = etag_cocina(codigo, session['user_id'])
+    return con_etag(render_template('cocina_mesas.html', mi_codigo=codigo, ordenes=ordenes), etag)
+
+@app.route('/cocina/stream')
+@login_required
+@role_required('cocina')
+def cocina_stream():
+    """Canal SSE con los cambios de órdenes de esta cocina"""
+    db = get_db()
+    cocina = db.execute('SELECT codigo FROM cocinas WHERE user_id = ?', (session['user_id'],)).fetchone()
+    if not cocina:
+        return jsonify({'error': 'Sin código de cocina'}), 404
+
+    sub = hub.subscribe(cocina['codigo'])
+    if sub is None:
+        # Sin threads libres para otro stream: la pantalla sondea con ETag
+        return jsonify({'error': 'Demasiadas conexiones'}), 503, {'Retry-After': '60'}
+
+    return Response(hub.stream(sub), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+
+@app.route('/cocina/produccion')
+@login_required
+@role_required('cocina')
+def cocina_produccion():
+    """Tablero "a cocinar ahora": totales por producto de lo pendiente"""
+    codigo = codigo_sesion()
+    if not codigo:
+        return redirect(url_for('cocina_dashboard'))
+    return render_template('cocina_produccion.html', mi_codigo=codigo)
+
+@app.route('/api/cocina/produccion')
+@login_required
+@role_required('cocina')
+def api_cocina_produccion():
+    codigo = codigo_sesion()
+    if not codigo:
+        return jsonify({'error': 'Sin código de cocina'}), 404
+    # Los nombres y categorías vienen del catálogo: su versión también cuenta
+    etag = etag_cocina(codigo, catalog.get().version)
+    respuesta = no_modificado(etag)
+    if respuesta is not None:
+        return respuesta
+    return con_etag(jsonify(board.get(codigo)), etag)
 
 @app.route('/api/orden/<int:order_id>/items')
 @login_required
 def api_order_items(order_id):
-    db = get_db()
+    db = get_order_db(codigo_sesion())
+    # El ETag sigue la versión de la cocina dueña de la orden (puede no ser la
+    # de la sesión); los nombres de producto vienen del catálogo: su versión también cuenta
+    orden = db.execute('SELECT codigo_cocina FROM orders WHERE id = ?', (order_id,)).fetchone()
+    codigo = orden and orden['codigo_cocina']
+    etag = codigo and etag_cocina(codigo, catalog.get().version)
+    respuesta = no_modificado(etag)
+    if respuesta is not None:
+        return respuesta
+    
     items = db.execute('''
         SELECT oi.qty, p.name as producto, oi.unit_price, oi.notes,
                (oi.qty * oi.unit_price) as subtotal
@@ -347,34 +840,104 @@ def api_order_items(order_id):
         JOIN products p ON p.id = oi.product_id
         WHERE oi.order_id = ?
     ''', (order_id,)).fetchall()
-    db.close()
     
-    return jsonify([dict(item) for item in items])
+    return con_etag(jsonify([dict(item) for item in items]), etag)
+
+MAX_ORDENES_POR_CONSULTA = 200
+
+@app.route('/api/ordenes/items')
+@login_required
+def api_ordenes_items():
+    """Items de varias órdenes agrupados por orden, en una sola consulta.
+
+    Acepta ?ids=1,2,3 o ?codigo=ABC123&status=pendiente. Con shards los ids
+    solo son únicos dentro de una cocina: se buscan en la de ?codigo o en la
+    de la sesión.
+    """
+    ids_param = request.args.get('ids', '').strip()
+    codigo = request.args.get('codigo', '').strip().upper()
+    status = request.args.get('status', 'pendiente')
+
+    if ids_param:
+        try:
+            ids = sorted({int(order_id) for order_id in ids_param.split(',') if order_id})
+        except ValueError:
+            return jsonify({'error': 'IDs inválidos'}), 400
+        if len(ids) > MAX_ORDENES_POR_CONSULTA:
+            return jsonify({'error': 'Demasiadas órdenes'}), 400
+        where = f"oi.order_id IN ({','.join('?' * len(ids))})"
+        params = ids
+    elif codigo:
+        ids = []
+        where = 'o.codigo_cocina = ? AND o.status = ?'
+        params = (codigo, status)
+    else:
+        return jsonify({'error': 'Se requiere ids o codigo'}), 400
+
+    try:
+        db = get_order_db(codigo or codigo_sesion())
+        if ids_param:
+            # Sin shards las órdenes pedidas pueden ser de varias cocinas: el
+            # ETag sigue la versión de cada cocina dueña
+            filas = db.execute(f"SELECT codigo_cocina FROM orders WHERE id IN ({','.join('?' * len(ids))})",
+                                ids).fetchall()
+            cocinas = sorted({row['codigo_cocina'] for row in filas})
+        else:
+            cocinas = [codigo]
+        version = catalog.get().version
+        etag = '.'.join(etag_cocina(cocina, version) for cocina in cocinas) or None
+    except LookupError:
+        return jsonify({'error': 'Código inválido'}), 400
+    respuesta = no_modificado(etag)
+    if respuesta is not None:
+        return respuesta
+    # El orden se resuelve en Python para no forzar un B-tree temporal
+    rows = db.execute(f'''
+        SELECT oi.order_id, oi.id, oi.qty, p.name as producto, oi.unit_price, oi.notes,
+               (oi.qty * oi.unit_price) as subtotal
+        FROM order_items oi
+        JOIN orders o ON o.id = oi.order_id
+        JOIN products p ON p.id = oi.product_id
+        WHERE {where}
+    ''', params).fetchall()
+
+    # Las órdenes pedidas sin items también aparecen, con lista vacía
+    agrupados = {str(order_id): [] for order_id in ids}
+    for row in sorted(rows, key=lambda r: (r['order_id'], r['id'])):
+        item = dict(row)
+        del item['id']
+        agrupados.setdefault(str(item.pop('order_id')), []).append(item)
+
+    return con_etag(jsonify(agrupados), etag)
 
 @app.route('/api/orden/<int:order_id>/servir', methods=['POST'])
 @login_required
 @role_required('cocina')
 def api_servir(order_id):
-    db = get_db()
-    db.execute('UPDATE orders SET status = ?, updated_at = ? WHERE id = ?',
-               ('servida', datetime.now().isoformat(), order_id))
-    db.commit()
-    db.close()
+    with write_transaction(get_order_db(codigo_sesion())) as db:
+        order = Order.transicion(db, order_id, 'servida')
+        if not order:
+            return orden_no_disponible(db, order_id)
+        registrar_evento(db, 'order_served', order_id, order['codigo_cocina'])
     
+    publicar_orden('order_served', order_id, order['codigo_cocina'])
     audit_log(session['username'], 'Orden servida', f'#{order_id}')
-    return jsonify({'success': True})
+    return jsonify({'success': True, 'order': dict(order)})
 
 # ============ CAJA ROUTES ============
 @app.route('/caja')
 @login_required
 @role_required('caja')
 def caja_dashboard():
-    db = get_db()
     codigo = session.get('codigo_cocina')
+    etag = codigo and etag_cocina(codigo, session['user_id'])
+    respuesta = no_modificado(etag)
+    if respuesta is not None:
+        return respuesta
     ordenes = []
     
     if codigo:
-        ordenes = db.execute('''
+        ordenes = get_order_db(codigo).execute('''
             SELECT o.id, o.created_at, o.total, u.username as mesero
             FROM orders o
             LEFT JOIN users u ON u.id = o.mesero_id
@@ -382,8 +945,7 @@ def caja_dashboard():
             ORDER BY o.created_at DESC
         ''', (codigo,)).fetchall()
     
-    db.close()
-    return render_template('caja.html', ordenes=ordenes, codigo_actual=codigo)
+    return con_etag(render_template('caja.html', ordenes=ordenes, codigo_actual=codigo), etag)
 
 @app.route('/caja/enlazar-cocina', methods=['POST'])
 @login_required
@@ -394,7 +956,6 @@ def caja_enlazar_cocina():
     
     db = get_db()
     cocina = db.execute('SELECT * FROM cocinas WHERE codigo = ?', (codigo,)).fetchone()
-    db.close()
     
     if not cocina:
         return jsonify({'error': 'Código inválido'}), 400
@@ -413,14 +974,18 @@ def caja_desenlazar_cocina():
 @login_required
 @role_required('caja')
 def caja_cerrar(order_id):
-    db = get_db()
-    db.execute('UPDATE orders SET status = ?, closed_at = ? WHERE id = ?',
-               ('cerrada', datetime.now().isoformat(), order_id))
-    db.commit()
-    db.close()
+    with write_transaction(get_order_db(session.get('codigo_cocina'))) as db:
+        # Dos cajas cerrando la misma orden: solo una encuentra status = 'servida'
+        order = Order.transicion(db, order_id, 'cerrada')
+        if not order:
+            return orden_no_disponible(db, order_id)
+        registrar_evento(db, 'order_closed', order_id, order['codigo_cocina'])
+        # Los reportes ven la venta en cuanto se confirma el pago
+        registrar_cierre(db, order_id)
     
+    publicar_orden('order_closed', order_id, order['codigo_cocina'])
     audit_log(session['username'], 'Orden cerrada', f'#{order_id}')
-    return jsonify({'success': True})
+    return jsonify({'success': True, 'order': dict(order)})
 
 # ============ ADMIN ROUTES ============
 @app.route('/admin')
@@ -429,11 +994,11 @@ def caja_cerrar(order_id):
 def admin_dashboard():
     db = get_db()
     users = db.execute('SELECT * FROM users ORDER BY id').fetchall()
-    products = db.execute('SELECT * FROM products ORDER BY category, name').fetchall()
+    products = catalog.get().productos
     tables = db.execute('SELECT * FROM tables ORDER BY id').fetchall()
-    db.close()
     
-    return render_template('admin.html', users=users, products=products, mesas=tables)
+    return render_template('admin.html', users=users, products=products, mesas=tables,
+                           stock=inventory.disponibles())
 
 @app.route('/admin/api/<entity_type>/<int:entity_id>')
 @login_required
@@ -448,11 +1013,8 @@ def admin_get_entity(entity_type, entity_id):
     elif entity_type == 'tables':
         row = db.execute('SELECT id, name FROM tables WHERE id = ?', (entity_id,)).fetchone()
     else:
-        db.close()
         return jsonify({'error': 'Invalid type'}), 400
     
-    db.close()
-    
     if not row:
         return jsonify({'error': 'Not found'}), 404
     
@@ -467,22 +1029,28 @@ def admin_update_entity(entity_type, entity_id):
     
     try:
         if entity_type == 'users':
-            db.execute('UPDATE users SET username = ?, role = ? WHERE id = ?',
-                      (data['username'], data['role'], entity_id))
+            row = db.execute('UPDATE users SET username = ?, role = ? WHERE id = ? RETURNING id, username, role',
+                             (data['username'], data['role'], entity_id)).fetchone()
         elif entity_type == 'products':
-            db.execute('UPDATE products SET name = ?, category = ?, price = ?, stock = ? WHERE id = ?',
-                      (data['name'], data['category'], data['price'], data.get('stock'), entity_id))
+            row = db.execute(
+                'UPDATE products SET name = ?, category = ?, price = ?, stock = ? WHERE id = ? '
+                'RETURNING id, name, category, price, stock',
+                (data['name'], data['category'], data['price'], data.get('stock'), entity_id)
+            ).fetchone()
         elif entity_type == 'tables':
-            db.execute('UPDATE tables SET name = ? WHERE id = ?', (data['name'], entity_id))
+            row = db.execute('UPDATE tables SET name = ? WHERE id = ? RETURNING id, name',
+                             (data['name'], entity_id)).fetchone()
         else:
-            db.close()
             return jsonify({'error': 'Invalid type'}), 400
         
         db.commit()
-        db.close()
-        return jsonify({'success': True})
+        if not row:
+            return jsonify({'error': 'Not found'}), 404
+        if entity_type == 'products':
+            catalog.invalidate()
+            inventory.invalidar()
+        return jsonify({'success': True, 'entity': dict(row)})
     except Exception as e:
-        db.close()
         return jsonify({'error': str(e)}), 500
 
 @app.route('/admin/<entity_type>/delete/<int:entity_id>', methods=['POST'])
@@ -494,7 +1062,6 @@ def admin_delete_entity(entity_type, entity_id):
     try:
         if entity_type == 'users':
             if entity_id == 1:
-                db.close()
                 return jsonify({'error': 'Cannot delete main admin'}), 400
             db.execute('DELETE FROM users WHERE id = ?', (entity_id,))
         elif entity_type == 'products':
@@ -502,16 +1069,247 @@ def admin_delete_entity(entity_type, entity_id):
         elif entity_type == 'tables':
             db.execute('DELETE FROM tables WHERE id = ?', (entity_id,))
         else:
-            db.close()
             return jsonify({'error': 'Invalid type'}), 400
         
         db.commit()
-        db.close()
-        return jsonify({'success': True})
+        if entity_type == 'products':
+            catalog.invalidate()
+            inventory.invalidar()
+        return jsonify({'success': True, 'id': entity_id})
+    except sqlite3.IntegrityError:
+        # foreign_keys=ON: el historial de órdenes no se puede dejar huérfano
+        db.rollback()
+        nombre = {'users': 'El usuario', 'products': 'El producto', 'tables': 'La mesa'}[entity_type]
+        return jsonify({'error': f'{nombre} tiene órdenes registradas y no se puede eliminar'}), 409
     except Exception as e:
-        db.close()
         return jsonify({'error': str(e)}), 500
 
+@app.route('/admin/fragmento/<entity_type>/<int:entity_id>')
+@login_required
+@role_required('admin')
+def admin_fragmento(entity_type, entity_id):
+    """Fila de la tabla del panel tras editar, sin recargar la página"""
+    if entity_type == 'users':
+        row = get_db().execute('SELECT * FROM users WHERE id = ?', (entity_id,)).fetchone()
+        args = (row,)
+        macro = 'fila_usuario'
+    elif entity_type == 'products':
+        row = catalog.get().get(entity_id)
+        args = (row, row and inventory.disponibles().get(entity_id, row['stock']))
+        macro = 'fila_producto'
+    elif entity_type == 'tables':
+        row = get_db().execute('SELECT * FROM tables WHERE id = ?', (entity_id,)).fetchone()
+        args = (row,)
+        macro = 'fila_mesa'
+    else:
+        return jsonify({'error': 'Invalid type'}), 400
+    
+    if not row:
+        return jsonify({'error': 'Not found'}), 404
+    return get_template_attribute('fragmentos.html', macro)(*args)
+
+@app.route('/admin/api/db-pool')
+@login_required
+@role_required('admin')
+def admin_db_pool():
+    return jsonify(pool.stats())
+
+@app.route('/admin/api/slow-queries')
+@login_required
+@role_required('admin')
+def admin_slow_queries():
+    """Sentencias lentas agrupadas; se activa con SLOW_QUERY_MS"""
+    if not slowlog:
+        return jsonify({'enabled': False, 'queries': []})
+    limit = request.args.get('limit', 50, type=int)
+    return jsonify({
+        'enabled': True,
+        'threshold_ms': slowlog.threshold * 1000,
+        'queries': slowlog.report(limit),
+    })
+
+@app.route('/admin/api/slow-queries/reset', methods=['POST'])
+@login_required
+@role_required('admin')
+def admin_slow_queries_reset():
+    if slowlog:
+        slowlog.reset()
+    return jsonify({'success': True})
+
+ORDENES_ACTIVAS_SQL = '''
+    SELECT codigo_cocina, status, COUNT(*) as n
+    FROM {s}.orders
+    WHERE status IN ('borrador', 'pendiente', 'servida')
+    GROUP BY codigo_cocina, status
+'''
+
+def ordenes_activas():
+    """Órdenes abiertas por cocina y estado, de todos los shards"""
+    return query_orders_all(ORDENES_ACTIVAS_SQL)
+
+@app.route('/admin/api/cocinas/resumen')
+@login_required
+@role_required('admin')
+def admin_resumen_cocinas():
+    """Órdenes abiertas por cocina (adjunta los shards si están activos)"""
+    resumen = {}
+    for row in ordenes_activas():
+        resumen.setdefault(row['codigo_cocina'], {})[row['status']] = row['n']
+    return jsonify({'sharded': bool(SHARD_DIR), 'shards': shard_codes(), 'cocinas': resumen})
+
+@app.route('/admin/api/reportes/<dimension>')
+@login_required
+@role_required('admin')
+def admin_reporte(dimension):
+    """Ventas por día, hora, producto, mesero o cocina; lee solo los acumulados"""
+    if dimension not in DIMENSIONES:
+        return jsonify({'error': f'Reporte inválido; opciones: {", ".join(DIMENSIONES)}'}), 400
+    try:
+        desde, hasta = rango(request.args.get('desde'), request.args.get('hasta'))
+    except ValueError:
+        return jsonify({'error': 'Fechas inválidas (YYYY-MM-DD)'}), 400
+    codigo = request.args.get('codigo', '').strip().upper() or None
+    
+    filas = reporte(dimension, desde, hasta, codigo)
+    if dimension == 'producto':
+        productos = catalog.get()
+        for fila in filas:
+            producto = productos.get(fila['producto'])
+            fila['nombre'] = producto['name'] if producto else f'Producto #{fila["producto"]}'
+    elif dimension == 'mesero' and filas:
+        ids = [fila['mesero'] for fila in filas]
+        nombres = dict(get_db().execute(
+            f'SELECT id, username FROM users WHERE id IN ({", ".join("?" * len(ids))})', ids
+        ).fetchall())
+        for fila in filas:
+            fila['nombre'] = nombres.get(fila['mesero'], f'Mesero #{fila["mesero"]}')
+    
+    totales = {}
+    for fila in filas:
+        for metrica, valor in fila.items():
+            if metrica in ('ordenes', 'items', 'qty', 'total'):
+                totales[metrica] = totales.get(metrica, 0) + valor
+    if 'total' in totales:
+        totales['total'] = round(totales['total'], 2)
+    return jsonify({'dimension': dimension, 'desde': desde, 'hasta': hasta, 'codigo': codigo,
+                    'filas': filas, 'totales': totales})
+
+def filtros_auditoria():
+    """Filtros de auditoría de la query string; ValueError si las fechas no son válidas"""
+    return Filtros(
+        usuario=request.args.get('usuario', '').strip(),
+        accion=request.args.get('accion', '').strip(),
+        texto=request.args.get('q', ''),
+        desde=request.args.get('desde') or None,
+        hasta=request.args.get('hasta') or None,
+    )
+
+@app.route('/admin/api/auditoria')
+@login_required
+@role_required('admin')
+def admin_auditoria():
+    """Auditoría filtrada por usuario, acción, texto y fechas; paginada con ?cursor="""
+    try:
+        filtros = filtros_auditoria()
+        entradas, siguiente = buscar(filtros, request.args.get('cursor') or None,
+                                     request.args.get('limite', 50, type=int))
+    except ValueError:
+        return jsonify({'error': 'Fechas (YYYY-MM-DD) o cursor inválidos'}), 400
+    return jsonify({'entradas': entradas, 'siguiente': siguiente})
+
+@app.route('/admin/api/auditoria.csv')
+@login_required
+@role_required('admin')
+def admin_auditoria_csv():
+    """Exporta la auditoría filtrada en CSV, página por página sin cargarla completa"""
+    try:
+        filtros = filtros_auditoria()
+    except ValueError:
+        return jsonify({'error': 'Fechas inválidas (YYYY-MM-DD)'}), 400
+    columnas = ('fuente',) + COLUMNAS_AUDITORIA
+
+    def filas():
+        buffer = io.StringIO()
+        escritor = csv.writer(buffer)
+        escritor.writerow(columnas)
+        cursor = None
+        while True:
+            entradas, cursor = buscar(filtros, cursor, limite=500)
+            escritor.writerows([entrada[c] for c in columnas] for entrada in entradas)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            if not cursor:
+                break
+
+    nombre = f'auditoria_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
+    return Response(stream_with_context(filas()), mimetype='text/csv',
+                    headers={'Content-Disposition': f'attachment; filename={nombre}'})
+
+@app.route('/admin/api/exportar/ordenes.<formato>')
+@login_required
+@role_required('admin')
+def admin_exportar_ordenes(formato):
+    """Órdenes cerradas con items en CSV o JSONL, en streaming; ?gzip=1 comprime al vuelo"""
+    if formato not in FORMATOS:
+        return jsonify({'error': f'Formato inválido; opciones: {", ".join(FORMATOS)}'}), 400
+    try:
+        filtros = FiltrosExportacion(request.args.get('desde'), request.args.get('hasta'),
+                                     request.args.get('codigo', '').strip().upper(),
+                                     request.args.get('mesero', type=int))
+    except ValueError:
+        return jsonify({'error': 'Fechas inválidas (YYYY-MM-DD)'}), 400
+    try:
+        filas = filas_exportacion(filtros)
+    except LookupError:
+        return jsonify({'error': 'Cocina no encontrada'}), 404
+    mimetype, escribir = FORMATOS[formato]
+    trozos = escribir(filas, Nombres())
+    nombre = filtros.nombre(formato)
+    if request.args.get('gzip') in ('1', 'true'):
+        trozos, mimetype, nombre = gzip_trozos(trozos), 'application/gzip', f'{nombre}.gz'
+    return Response(stream_with_context(trozos), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={nombre}'})
+
+@app.route('/admin/metrics')
+@login_required
+@role_required('admin')
+def admin_metrics():
+    """Métricas en formato de texto de Prometheus"""
+    activas = ordenes_activas()
+
+    gauges = [
+        ('taqueria_open_orders', 'Órdenes abiertas por cocina y estado',
+         [({'codigo': row['codigo_cocina'], 'status': row['status']}, row['n']) for row in activas]),
+        ('taqueria_db_pool', 'Estado del pool de conexiones',
+         [({'stat': k}, v) for k, v in pool.stats().items()]),
+        ('taqueria_audit_writer', 'Cola de auditoría',
+         [({'stat': k}, v) for k, v in audit_writer.stats().items()]),
+        ('taqueria_sse_subscribers', 'Pantallas de cocina conectadas',
+         [({}, hub.subscriber_count())]),
+        ('taqueria_sse_rejected', 'Streams rechazados por el tope del worker (sondean)',
+         [({}, hub.rejected)]),
+        ('taqueria_sse_relayed', 'Eventos recibidos de otros workers',
+         [({}, hub.relayed)]),
+        ('taqueria_sqlite_busy', 'Reintentos y fallas por SQLITE_BUSY',
+         [({'stat': k}, v) for k, v in busy_stats.items()]),
+        ('taqueria_catalog_reloads', 'Recargas del catálogo en memoria',
+         [({}, catalog.reloads)]),
+        ('taqueria_inventory', 'Descuentos, rechazos y devoluciones de stock',
+         [({'stat': k}, v) for k, v in inventory.stats.items()]),
+        ('taqueria_production_rebuilds', 'Reconstrucciones completas del tablero de producción',
+         [({}, board.rebuilds)]),
+        ('taqueria_backups', 'Respaldos automáticos de este worker',
+         [({'stat': k}, v) for k, v in programador.stats.items()]),
+    ]
+    return Response(metrics.render(gauges), mimetype='text/plain; version=0.0.4')
+
+@app.route('/admin/api/audit-writer')
+@login_required
+@role_required('admin')
+def admin_audit_writer():
+    return jsonify(audit_writer.stats())
+
 # ============ ERROR HANDLERS ============
 @app.errorhandler(404)
 def not_found(e):
@@ -0,0 +1,169 @@
+"""Archivo histórico: órdenes cerradas viejas y auditoría fuera de la BD viva.
+
+Cada BD de órdenes (la global y cada shard) tiene su archivo con el mismo
+nombre dentro de ARCHIVE_DIR. `python archive.py` mueve por lotes las
+órdenes cerradas hace más de ARCHIVE_DAYS días (con sus items y mesa) y la
+auditoría más vieja que ARCHIVE_AUDIT_DAYS. Así la BD viva, sus índices y
+los dashboards cargan solo lo reciente; las páginas liberadas se reutilizan
+y el archivo vivo deja de crecer.
+
+Las consultas de historial adjuntan el archivo en solo lectura y leen
+ambas BDs con historial(tabla, alias).
+"""
+import argparse
+import os
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from database import DB_NAME, connect, connect_orders, order_db_path, shard_codes, write_transaction
+
+ARCHIVE_DIR = os.getenv('ARCHIVE_DIR') or os.path.join(os.path.dirname(os.path.abspath(DB_NAME)), 'archivo')
+ARCHIVE_DAYS = int(os.getenv('ARCHIVE_DAYS', 30))
+ARCHIVE_AUDIT_DAYS = int(os.getenv('ARCHIVE_AUDIT_DAYS', 90))
+
+# Columnas que se copian (order_items.subtotal es generada y se recalcula)
+COLUMNAS = {
+    'orders': ('id', 'mesero_id', 'codigo_cocina', 'status', 'total', 'notas_generales',
+               'created_at', 'updated_at', 'closed_at'),
+    'order_items': ('id', 'order_id', 'product_id', 'qty', 'unit_price', 'notes', 'created_at'),
+    'table_orders': ('order_id', 'table_id', 'created_at'),
+    'audit_log': ('id', 'usuario', 'accion', 'detalle', 'ip_address', 'timestamp', 'entity_type', 'entity_id'),
+}
+
+# Columna que liga cada tabla con su orden
+_ORDEN = {'orders': 'id', 'order_items': 'order_id', 'table_orders': 'order_id'}
+
+def archive_path(path):
+    """Archivo histórico de una BD de órdenes"""
+    return os.path.join(ARCHIVE_DIR, os.path.basename(path))
+
+def historial(tabla, archivo=None, s='main'):
+    """Fuente para FROM con las filas vivas y las archivadas de `tabla`.
+
+    Mientras un lote se mueve, una orden puede estar un instante en las dos
+    BDs: del archivo solo se toman las que ya no están vivas.
+    """
+    if archivo is None:
+        return f'{s}.{tabla}'
+    if tabla == 'audit_log':
+        filtro = f'NOT EXISTS (SELECT 1 FROM {s}.audit_log v WHERE v.id = a.id)'
+    else:
+        filtro = f'NOT EXISTS (SELECT 1 FROM {s}.orders v WHERE v.id = a.{_ORDEN[tabla]})'
+    return f'(SELECT * FROM {s}.{tabla} UNION ALL SELECT * FROM {archivo}.{tabla} a WHERE {filtro})'
+
+@contextmanager
+def con_archivo(conn, path=DB_NAME, alias='archivo'):
+    """Adjunta en solo lectura el archivo de `path`; da el alias, o None si aún no hay archivo"""
+    ruta = archive_path(path)
+    if not os.path.exists(ruta):
+        yield None
+        return
+    conn.execute('ATTACH DATABASE ? AS ?', (f'file:{os.path.abspath(ruta)}?mode=ro', alias))
+    try:
+        yield alias
+    finally:
+        if conn.in_transaction:
+            conn.commit()
+        conn.execute(f'DETACH DATABASE {alias}')
+
+# ============ MOVER AL ARCHIVO ============
+def _copiar(conn, tabla, filtro, ids):
+    columnas = ', '.join(COLUMNAS[tabla])
+    marcas = ', '.join('?' * len(ids))
+    conn.execute(
+        f'INSERT OR IGNORE INTO archivo.{tabla} ({columnas}) '
+        f'SELECT {columnas} FROM main.{tabla} WHERE {filtro} IN ({marcas})',
+        ids
+    )
+
+def _mover(conn, seleccion, params, tablas, lote):
+    """Un lote: copia al archivo y luego borra de la viva solo lo que ya quedó copiado.
+
+    Son dos transacciones a propósito: con WAL un commit que toca dos
+    archivos no es atómico ante una caída, y así lo peor es una fila
+    repetida que el siguiente lote limpia, nunca una perdida.
+    """
+    # La copia solo escribe en el archivo: lectura diferida sobre la viva
+    conn.execute('BEGIN')
+    try:
+        ids = [row[0] for row in conn.execute(seleccion, (*params, lote))]
+        for tabla, filtro in tablas:
+            if ids:
+                _copiar(conn, tabla, filtro, ids)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    if not ids:
+        return 0
+
+    principal, filtro = tablas[0]
+    marcas = ', '.join('?' * len(ids))
+    # Items y mesa se van por ON DELETE CASCADE
+    with write_transaction(conn):
+        borradas = conn.execute(
+            f'DELETE FROM main.{principal} WHERE {filtro} IN '
+            f'(SELECT {filtro} FROM archivo.{principal} WHERE {filtro} IN ({marcas}))',
+            ids
+        ).rowcount
+    return borradas
+
+ORDENES_VIEJAS_SQL = '''
+    SELECT id FROM main.orders
+    WHERE status = 'cerrada' AND closed_at < ?
+    ORDER BY closed_at LIMIT ?
+'''
+AUDITORIA_VIEJA_SQL = 'SELECT id FROM main.audit_log WHERE timestamp < ? ORDER BY timestamp LIMIT ?'
+
+def archivar(conn, path, dias=ARCHIVE_DAYS, audit_dias=ARCHIVE_AUDIT_DAYS, lote=500, pausa=0.05):
+    """Mueve al archivo lo viejo de la BD de órdenes `path` abierta en `conn`.
+
+    Lotes de `lote` órdenes o entradas de auditoría; cada lote toma el
+    candado de escritura solo unos milisegundos y entre lotes se duerme
+    `pausa` segundos para que el servicio escriba. Devuelve lo movido.
+    """
+    from migrations import ARCHIVE_MIGRATIONS, migrate
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    migrate(archive_path(path), ARCHIVE_MIGRATIONS)
+
+    ahora = datetime.now()
+    trabajos = {
+        'orders': (ORDENES_VIEJAS_SQL, ((ahora - timedelta(days=dias)).isoformat(),),
+                   [('orders', 'id'), ('order_items', 'order_id'), ('table_orders', 'order_id')]),
+        'audit_log': (AUDITORIA_VIEJA_SQL, ((ahora - timedelta(days=audit_dias)).isoformat(),),
+                      [('audit_log', 'id')]),
+    }
+    movidas = dict.fromkeys(trabajos, 0)
+    conn.execute('ATTACH DATABASE ? AS archivo', (os.path.abspath(archive_path(path)),))
+    try:
+        for nombre, (seleccion, params, tablas) in trabajos.items():
+            while True:
+                n = _mover(conn, seleccion, params, tablas, lote)
+                movidas[nombre] += n
+                if n < lote:
+                    break
+                time.sleep(pausa)
+    finally:
+        conn.execute('DETACH DATABASE archivo')
+    return movidas
+
+def main():
+    parser = argparse.ArgumentParser(description='Mueve órdenes cerradas y auditoría viejas al archivo histórico')
+    parser.add_argument('--dias', type=int, default=ARCHIVE_DAYS, help='edad mínima de las órdenes cerradas')
+    parser.add_argument('--audit-dias', type=int, default=ARCHIVE_AUDIT_DAYS, help='edad mínima de la auditoría')
+    parser.add_argument('--lote', type=int, default=500, help='filas por transacción')
+    parser.add_argument('--pausa', type=float, default=0.05, help='segundos entre lotes')
+    args = parser.parse_args()
+
+    bds = [(DB_NAME, None)] + [(order_db_path(codigo), codigo) for codigo in shard_codes()]
+    for path, codigo in bds:
+        conn = connect_orders(codigo) if codigo else connect()
+        try:
+            movidas = archivar(conn, path, args.dias, args.audit_dias, args.lote, args.pausa)
+        finally:
+            conn.close()
+        print(f'✅ {path}: {movidas["orders"]} órdenes y {movidas["audit_log"]} entradas de auditoría '
+              f'archivadas en {archive_path(path)}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+"""Búsqueda en la auditoría: filtros, texto completo y paginación por llave.
+
+La auditoría vive en la BD global, en cada shard y en sus archivos
+históricos. Cada página pide a cada fuente las `limite` entradas que siguen
+al cursor en orden (timestamp, fuente, id) descendente y las mezcla en
+Python; ninguna consulta usa OFFSET, así que la página 1000 cuesta lo mismo
+que la primera.
+
+Con texto se elige por fuente cómo buscar. Si hay pocas coincidencias se
+parte del índice FTS5 y se ordenan (costo acotado por el umbral). Si hay
+muchas se recorre el índice por timestamp y se prueba cada fila contra el
+FTS, deteniéndose al llenar la página.
+"""
+import re
+from datetime import date, timedelta
+from math import isqrt
+from archive import con_archivo
+from database import DB_NAME, SHARD_DIR, get_db, get_order_db, order_db_path, shard_codes
+
+COLUMNAS = ('id', 'usuario', 'accion', 'detalle', 'ip_address', 'timestamp', 'entity_type', 'entity_id')
+LIMITE_MAX = 500
+
+# Costo de probar una fila contra el FTS dividido entre el de ordenar una
+# coincidencia (~100µs contra ~1.7µs, medido con 4M entradas). Con él, el
+# umbral entre estrategias es sqrt(limite * filas * SONDEO)
+SONDEO = 60
+
+_PALABRA = re.compile(r'(\w+)(\*?)')
+_SIN_LIMITE = 2 ** 63 - 1
+
+def consulta_fts(texto):
+    """Expresión MATCH segura: cada palabra entre comillas (AND); `palabra*` busca por prefijo"""
+    palabras = [f'"{palabra}"{prefijo}' for palabra, prefijo in _PALABRA.findall(texto or '')]
+    return ' '.join(palabras) or None
+
+def rango_fechas(desde=None, hasta=None):
+    """Límites de timestamp para fechas AAAA-MM-DD inclusivas; ValueError si no son fechas"""
+    inicio = date.fromisoformat(desde).isoformat() if desde else None
+    fin = (date.fromisoformat(hasta) + timedelta(days=1)).isoformat() if hasta else None
+    if inicio and fin and inicio >= fin:
+        raise ValueError('desde es posterior a hasta')
+    return inicio, fin
+
+def cursor_de(entrada):
+    return f'{entrada["timestamp"]}~{entrada["fuente"]}~{entrada["id"]}'
+
+def leer_cursor(cursor):
+    """(timestamp, fuente, id) de un cursor; ValueError si está mal formado"""
+    timestamp, fuente, entrada_id = cursor.rsplit('~', 2)
+    return timestamp, fuente, int(entrada_id)
+
+class Filtros:
+    def __init__(self, usuario=None, accion=None, texto=None, desde=None, hasta=None):
+        self.usuario = usuario or None
+        self.accion = accion or None
+        self.match = consulta_fts(texto)
+        self.inicio, self.fin = rango_fechas(desde, hasta)
+
+    def where(self, despues):
+        """Condiciones y parámetros sobre `a`; `despues` es (timestamp, id límite) del cursor"""
+        condiciones, params = [], []
+        for columna, valor in (('usuario', self.usuario), ('accion', self.accion)):
+            if valor:
+                condiciones.append(f'a.{columna} = ?')
+                params.append(valor)
+        if self.inicio:
+            condiciones.append('a.timestamp >= ?')
+            params.append(self.inicio)
+        if self.fin:
+            condiciones.append('a.timestamp < ?')
+            params.append(self.fin)
+        if despues:
+            # Forma que usa el índice como rango sobre timestamp
+            timestamp, entrada_id = despues
+            condiciones.append('a.timestamp <= ? AND (a.timestamp < ? OR a.id < ?)')
+            params.extend((timestamp, timestamp, entrada_id))
+        return condiciones, params
+
+def _pocas_coincidencias(db, s, match, limite):
+    """True si conviene partir del FTS: menos coincidencias que el umbral de la fuente"""
+    # Por separado: MIN y MAX juntos recorren toda la tabla
+    minimo, maximo = db.execute(
+        f'SELECT (SELECT MIN(id) FROM {s}.audit_log), (SELECT MAX(id) FROM {s}.audit_log)'
+    ).fetchone()
+    filas = (maximo - minimo + 1) if minimo is not None else 0
+    umbral = max(5000, isqrt(limite * filas * SONDEO))
+    n = db.execute(f'SELECT COUNT(*) FROM (SELECT 1 FROM {s}.audit_fts WHERE audit_fts MATCH ? LIMIT ?)',
+                   (match, umbral)).fetchone()[0]
+    return n < umbral
+
+def _pagina_esquema(db, s, filtros, despues, limite):
+    condiciones, params = filtros.where(despues)
+    columnas = ', '.join(f'a.{c}' for c in COLUMNAS)
+    if filtros.match and _pocas_coincidencias(db, s, filtros.match, limite):
+        origen = f'{s}.audit_fts f JOIN {s}.audit_log a ON a.id = f.rowid'
+        condiciones.insert(0, 'f.audit_fts MATCH ?')
+        params.insert(0, filtros.match)
+    else:
+        origen = f'{s}.audit_log a'
+        if filtros.match:
+            condiciones.append(f'EXISTS (SELECT 1 FROM {s}.audit_fts WHERE audit_fts MATCH ? AND rowid = a.id)')
+            params.append(filtros.match)
+    where = f'WHERE {" AND ".join(condiciones)}' if condiciones else ''
+    return db.execute(
+        f'SELECT {columnas} FROM {origen} {where} ORDER BY a.timestamp DESC, a.id DESC LIMIT ?',
+        (*params, limite)
+    ).fetchall()
+
+def _pagina_fuente(db, path, filtros, despues, limite):
+    """Página de una BD de auditoría y su archivo; las que están en ambas cuentan una vez"""
+    filas = _pagina_esquema(db, 'main', filtros, despues, limite)
+    with con_archivo(db, path) as archivo:
+        if archivo:
+            vivas = {row['id'] for row in filas}
+            filas = filas + [row for row in _pagina_esquema(db, archivo, filtros, despues, limite)
+                             if row['id'] not in vivas]
+            filas.sort(key=lambda row: (row['timestamp'], row['id']), reverse=True)
+    return filas[:limite]
+
+def fuentes():
+    """(fuente, conexión, ruta) de cada BD con auditoría; la global es la fuente ''"""
+    yield '', get_db(), DB_NAME
+    for codigo in shard_codes() if SHARD_DIR else ():
+        yield codigo, get_order_db(codigo), order_db_path(codigo)
+
+def buscar(filtros, cursor=None, limite=50):
+    """Entradas más recientes que el cursor; devuelve (entradas, siguiente cursor o None)"""
+    limite = max(1, min(limite, LIMITE_MAX))
+    posicion = leer_cursor(cursor) if cursor else None
+    entradas = []
+    for fuente, db, path in fuentes():
+        despues = None
+        if posicion:
+            timestamp, fuente_cursor, entrada_id = posicion
+            # Con el mismo timestamp, las fuentes menores van después en el orden descendente
+            if fuente < fuente_cursor:
+                despues = (timestamp, _SIN_LIMITE)
+            elif fuente == fuente_cursor:
+                despues = (timestamp, entrada_id)
+            else:
+                despues = (timestamp, 0)
+        for row in _pagina_fuente(db, path, filtros, despues, limite):
+            entradas.append({**dict(row), 'fuente': fuente})
+    entradas.sort(key=lambda e: (e['timestamp'], e['fuente'], e['id']), reverse=True)
+    pagina = entradas[:limite]
+    siguiente = cursor_de(pagina[-1]) if len(pagina) == limite else None
+    return pagina, siguiente
@@ -0,0 +1,333 @@
+"""Respaldos en línea de las BDs con la API de backup de SQLite.
+
+Cada respaldo es un directorio BACKUP_DIR/AAAAMMDD-HHMMSS con la BD global,
+cada shard (shards/) y cada archivo histórico (archivo/) comprimidos con
+gzip, más un SHA256SUMS compatible con `sha256sum -c`. Se conservan los
+últimos BACKUP_KEEP.
+
+La copia avanza de BACKUP_PAGES páginas por paso con una pausa de
+BACKUP_PAUSA segundos entre pasos. La conexión origen mantiene abierta una
+transacción de lectura: con WAL eso no bloquea a nadie y fija la foto de la
+BD, así el backup no se reinicia cada vez que el servicio escribe (sin ella
+una BD con escrituras continuas nunca termina de copiarse). Cada archivo es
+consistente por sí mismo; la global y los shards se copian uno tras otro.
+
+    python backup.py respaldar
+    python backup.py listar
+    python backup.py verificar [AAAAMMDD-HHMMSS]
+    python backup.py restaurar [AAAAMMDD-HHMMSS] [--destino DIR]
+"""
+import argparse
+import fcntl
+import gzip
+import hashlib
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime
+from archive import ARCHIVE_DIR, archive_path
+from database import DB_NAME, SHARD_DIR, order_db_path, shard_codes
+
+BACKUP_DIR = os.getenv('BACKUP_DIR') or os.path.join(os.path.dirname(os.path.abspath(DB_NAME)), 'respaldos')
+BACKUP_INTERVAL = int(os.getenv('BACKUP_INTERVAL', 0))     # segundos; 0 = sin respaldos automáticos
+BACKUP_KEEP = int(os.getenv('BACKUP_KEEP', 14))
+BACKUP_PAGES = int(os.getenv('BACKUP_PAGES', 100))
+BACKUP_PAUSA = float(os.getenv('BACKUP_PAUSA', 0.01))
+
+SUMAS = 'SHA256SUMS'
+_NOMBRE = re.compile(r'\d{8}-\d{6}')
+
+def bases():
+    """(ruta viva, ruta relativa dentro del respaldo) de cada BD existente"""
+    vivas = [(DB_NAME, os.path.basename(DB_NAME))]
+    vivas += [(order_db_path(codigo), os.path.join('shards', os.path.basename(order_db_path(codigo))))
+              for codigo in shard_codes()]
+    archivos = [(archive_path(path), os.path.join('archivo', os.path.basename(path))) for path, _ in vivas]
+    return [(path, rel) for path, rel in vivas + archivos if os.path.exists(path)]
+
+def destino_vivo(rel):
+    """Ruta viva que corresponde a una ruta relativa del respaldo"""
+    carpeta, nombre = os.path.split(rel)
+    if carpeta == 'shards':
+        if not SHARD_DIR:
+            raise SystemExit(f'❌ El respaldo trae shards ({rel}) pero SHARD_DIR no está configurado')
+        return os.path.join(SHARD_DIR, nombre)
+    if carpeta == 'archivo':
+        return os.path.join(ARCHIVE_DIR, nombre)
+    return DB_NAME
+
+# ============ COPIA ============
+def copiar(origen, destino, pages=BACKUP_PAGES, pausa=BACKUP_PAUSA):
+    """Copia en línea `origen` a `destino` por pasos; devuelve los pasos dados"""
+    src = sqlite3.connect(origen, isolation_level=None, timeout=5)
+    dst = sqlite3.connect(destino)
+    pasos = 0
+
+    def progreso(status, remaining, total):
+        nonlocal pasos
+        pasos += 1
+        if remaining:
+            time.sleep(pausa)
+
+    try:
+        # Fija la foto: en WAL la lectura no bloquea a los que escriben
+        src.execute('BEGIN')
+        src.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+        src.backup(dst, pages=pages, progress=progreso)
+        src.execute('COMMIT')
+        estado = dst.execute('PRAGMA quick_check').fetchone()[0]
+        if estado != 'ok':
+            raise sqlite3.DatabaseError(f'{origen}: la copia no pasó quick_check ({estado})')
+    finally:
+        dst.close()
+        src.close()
+    return pasos
+
+def _comprimir(origen, destino):
+    """gzip de `origen` en `destino`; devuelve el sha256 del .gz"""
+    sha = hashlib.sha256()
+    with open(origen, 'rb') as entrada, open(destino, 'wb') as crudo:
+        with gzip.GzipFile(fileobj=_Hasheado(crudo, sha), mode='wb', compresslevel=6, mtime=0) as salida:
+            shutil.copyfileobj(entrada, salida, 1024 * 1024)
+    return sha.hexdigest()
+
+class _Hasheado:
+    """Archivo de salida que va calculando el hash de lo escrito"""
+
+    def __init__(self, archivo, sha):
+        self._archivo = archivo
+        self._sha = sha
+
+    def write(self, datos):
+        self._sha.update(datos)
+        return self._archivo.write(datos)
+
+    def flush(self):
+        self._archivo.flush()
+
+def _sha256(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for bloque in iter(lambda: f.read(1024 * 1024), b''):
+            sha.update(bloque)
+    return sha.hexdigest()
+
+def respaldar(directorio=BACKUP_DIR, keep=BACKUP_KEEP, pages=BACKUP_PAGES, pausa=BACKUP_PAUSA):
+    """Respaldo completo en un directorio nuevo; devuelve su ruta.
+
+    Se arma en un directorio temporal y se renombra al final, así un
+    respaldo a medias nunca aparece en listar/restaurar.
+    """
+    os.makedirs(directorio, exist_ok=True)
+    nombre = datetime.now().strftime('%Y%m%d-%H%M%S')
+    final = os.path.join(directorio, nombre)
+    if os.path.exists(final):
+        raise FileExistsError(f'Ya existe el respaldo {nombre}')
+    temporal = tempfile.mkdtemp(prefix=f'.{nombre}-', dir=directorio)
+    try:
+        sumas = []
+        for path, rel in bases():
+            os.makedirs(os.path.join(temporal, os.path.dirname(rel)), exist_ok=True)
+            copia = os.path.join(temporal, rel)
+            copiar(path, copia, pages, pausa)
+            sumas.append((_comprimir(copia, copia + '.gz'), rel + '.gz'))
+            os.remove(copia)
+        with open(os.path.join(temporal, SUMAS), 'w') as f:
+            f.writelines(f'{sha}  {rel}\n' for sha, rel in sumas)
+        os.replace(temporal, final)
+    except BaseException:
+        shutil.rmtree(temporal, ignore_errors=True)
+        raise
+    rotar(directorio, keep)
+    return final
+
+def respaldos(directorio=BACKUP_DIR):
+    """Nombres de los respaldos completos, del más viejo al más nuevo"""
+    if not os.path.isdir(directorio):
+        return []
+    return sorted(n for n in os.listdir(directorio) if _NOMBRE.fullmatch(n))
+
+def rotar(directorio=BACKUP_DIR, keep=BACKUP_KEEP):
+    """Borra los respaldos más viejos que los últimos `keep`"""
+    for nombre in respaldos(directorio)[:-keep] if keep > 0 else []:
+        shutil.rmtree(os.path.join(directorio, nombre))
+
+# ============ VERIFICAR / RESTAURAR ============
+def _sumas(carpeta):
+    with open(os.path.join(carpeta, SUMAS)) as f:
+        return [linea.rstrip('\n').split('  ', 1)[::-1] for linea in f if linea.strip()]
+
+def _descomprimir(origen, destino):
+    with gzip.open(origen, 'rb') as entrada, open(destino, 'wb') as salida:
+        shutil.copyfileobj(entrada, salida, 1024 * 1024)
+
+def verificar(carpeta):
+    """Revisa checksums e integrity_check de cada BD del respaldo; devuelve los errores"""
+    errores = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for rel, sha in _sumas(carpeta):
+            path = os.path.join(carpeta, rel)
+            if not os.path.exists(path):
+                errores.append(f'{rel}: no existe')
+                continue
+            if _sha256(path) != sha:
+                errores.append(f'{rel}: checksum distinto')
+                continue
+            copia = os.path.join(tmp, 'verificar.db')
+            _descomprimir(path, copia)
+            conn = sqlite3.connect(copia)
+            try:
+                estado = conn.execute('PRAGMA integrity_check').fetchone()[0]
+            finally:
+                conn.close()
+            os.remove(copia)
+            if estado != 'ok':
+                errores.append(f'{rel}: integrity_check {estado}')
+    return errores
+
+def restaurar(carpeta, destino=None):
+    """Reemplaza las BDs con las del respaldo (con el servicio detenido).
+
+    Con `destino` las escribe ahí con la estructura del respaldo en vez de
+    sobre las vivas. Devuelve las rutas escritas.
+    """
+    errores = verificar(carpeta)
+    if errores:
+        raise ValueError('Respaldo inválido: ' + '; '.join(errores))
+    escritas = []
+    for rel, _ in _sumas(carpeta):
+        rel = rel[:-len('.gz')]
+        path = os.path.join(destino, rel) if destino else destino_vivo(rel)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        _descomprimir(os.path.join(carpeta, rel + '.gz'), path + '.restaurando')
+        # El WAL viejo no corresponde a la BD restaurada
+        for sufijo in ('-wal', '-shm'):
+            if os.path.exists(path + sufijo):
+                os.remove(path + sufijo)
+        os.replace(path + '.restaurando', path)
+        escritas.append(path)
+    return escritas
+
+# ============ PROGRAMADOR ============
+class Programador:
+    """Respaldos automáticos cada BACKUP_INTERVAL segundos desde la app.
+
+    Cada worker tiene un thread que revisa la edad del último respaldo; un
+    candado de archivo (flock) hace que solo uno respalde a la vez, y como
+    la edad se lee del disco no se duplican respaldos entre workers ni tras
+    reinicios.
+    """
+
+    def __init__(self, intervalo=BACKUP_INTERVAL, directorio=BACKUP_DIR):
+        self.intervalo = intervalo
+        self.directorio = directorio
+        self.stats = {'respaldos': 0, 'errores': 0, 'ultimo': 0, 'segundos': 0.0}
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def init_app(self, app):
+        if self.intervalo > 0:
+            app.before_request(self._ensure_started)
+
+    def _ensure_started(self):
+        # Tras un fork (gunicorn) el thread del padre no existe en el hijo
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            threading.Thread(target=self._run, name='backup-scheduler', daemon=True).start()
+            self._pid = os.getpid()
+
+    def _run(self):
+        while True:
+            time.sleep(min(self.intervalo, 60))
+            try:
+                self.tick()
+            except Exception as e:
+                self.stats['errores'] += 1
+                print(f"Error en respaldo: {e}")
+
+    def _edad(self):
+        existentes = respaldos(self.directorio)
+        if not existentes:
+            return None
+        return time.time() - os.path.getmtime(os.path.join(self.directorio, existentes[-1]))
+
+    def tick(self):
+        """Respalda si ya toca y ningún otro proceso está respaldando; devuelve la ruta o None"""
+        edad = self._edad()
+        if edad is not None and edad < self.intervalo:
+            return None
+        os.makedirs(self.directorio, exist_ok=True)
+        with open(os.path.join(self.directorio, '.lock'), 'w') as candado:
+            try:
+                fcntl.flock(candado, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return None
+            # Otro worker pudo terminar uno mientras se esperaba el candado
+            edad = self._edad()
+            if edad is not None and edad < self.intervalo:
+                return None
+            inicio = time.perf_counter()
+            path = respaldar(self.directorio)
+            self.stats['segundos'] = round(time.perf_counter() - inicio, 3)
+            self.stats['respaldos'] += 1
+            self.stats['ultimo'] = int(time.time())
+            return path
+
+programador = Programador()
+
+def main():
+    parser = argparse.ArgumentParser(description='Respaldos en línea de las BDs de la taquería')
+    parser.add_argument('--dir', default=BACKUP_DIR, help='directorio de respaldos')
+    sub = parser.add_subparsers(dest='comando', required=True)
+    p = sub.add_parser('respaldar', help='hace un respaldo ahora (con el servicio corriendo)')
+    p.add_argument('--keep', type=int, default=BACKUP_KEEP, help='respaldos que se conservan')
+    p.add_argument('--pages', type=int, default=BACKUP_PAGES, help='páginas por paso')
+    p.add_argument('--pausa', type=float, default=BACKUP_PAUSA, help='segundos entre pasos')
+    sub.add_parser('listar', help='respaldos disponibles')
+    p = sub.add_parser('verificar', help='checksums e integrity_check (por omisión el último)')
+    p.add_argument('respaldo', nargs='?')
+    p = sub.add_parser('restaurar', help='restaura un respaldo (detener el servicio antes)')
+    p.add_argument('respaldo', nargs='?')
+    p.add_argument('--destino', help='directorio donde escribir en vez de reemplazar las BDs vivas')
+    args = parser.parse_args()
+
+    if args.comando == 'respaldar':
+        inicio = time.perf_counter()
+        path = respaldar(args.dir, args.keep, args.pages, args.pausa)
+        print(f'✅ Respaldo en {path} ({time.perf_counter() - inicio:.1f}s)')
+        return
+    existentes = respaldos(args.dir)
+    if args.comando == 'listar':
+        for nombre in existentes:
+            carpeta = os.path.join(args.dir, nombre)
+            tamano = sum(os.path.getsize(os.path.join(r, f)) for r, _, fs in os.walk(carpeta) for f in fs)
+            print(f'{nombre}  {len(_sumas(carpeta))} BDs  {tamano / 1024 / 1024:.1f} MB')
+        return
+    nombre = args.respaldo or (existentes[-1] if existentes else None)
+    if nombre not in existentes:
+        raise SystemExit(f'❌ No existe el respaldo {nombre!r} en {args.dir}')
+    carpeta = os.path.join(args.dir, nombre)
+    if args.comando == 'verificar':
+        errores = verificar(carpeta)
+        for error in errores:
+            print(f'❌ {error}')
+        if errores:
+            raise SystemExit(1)
+        print(f'✅ {nombre}: {len(_sumas(carpeta))} BDs íntegras')
+    else:
+        try:
+            escritas = restaurar(carpeta, args.destino)
+        except ValueError as e:
+            raise SystemExit(f'❌ {e}')
+        for path in escritas:
+            print(f'✅ {path}')
+
+if __name__ == '__main__':
+    main()
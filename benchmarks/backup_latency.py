@@ -0,0 +1,138 @@
+"""Latencia de escritura de órdenes mientras corre un respaldo.
+
+Llena una BD nueva con `--ordenes` órdenes cerradas y pone `--writers`
+threads a crear órdenes con items (la misma transacción que /mesero/crear-orden
+y el envío) durante cada fase: sin respaldo, respaldo por pasos (como el
+programador) y respaldo de un solo paso. Reporta p50/p95/p99/máximo de la
+escritura por fase, la duración del respaldo y los pasos dados en JSON.
+
+    python benchmarks/backup_latency.py --ordenes 200000 --writers 4
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+from shift_sim import percentil
+
+def llenar(connect, ordenes, lote=5000):
+    conn = connect()
+    inicio = datetime.now() - timedelta(days=60)
+    with conn:
+        mesero = conn.execute("SELECT id FROM users WHERE role = 'admin'").fetchone()[0]
+        for base in range(0, ordenes, lote):
+            n = min(lote, ordenes - base)
+            filas = [(mesero, 'cerrada', 90.0, (inicio + timedelta(seconds=30 * (base + i))).isoformat())
+                     for i in range(n)]
+            conn.executemany(
+                'INSERT INTO orders (mesero_id, codigo_cocina, status, total, created_at, closed_at) '
+                'VALUES (?, NULL, ?, ?, ?, ?4)', filas)
+            conn.execute(
+                'INSERT INTO order_items (order_id, product_id, qty, unit_price, notes) '
+                'SELECT id, 1 + id % 5, 3, 30.0, NULL FROM orders WHERE id > ?',
+                (base,))
+    conn.close()
+
+def escritor(connect, write_transaction, mesero, detener, latencias, pausa):
+    conn = connect()
+    rnd = random.Random(threading.get_ident())
+    while not detener.is_set():
+        inicio = time.perf_counter()
+        with write_transaction(conn) as db:
+            order_id = db.execute(
+                'INSERT INTO orders (mesero_id, codigo_cocina, status, total, created_at) VALUES (?, ?, ?, ?, ?) '
+                'RETURNING id', (mesero, None, 'pendiente', 0, datetime.now().isoformat())
+            ).fetchone()[0]
+            db.executemany(
+                'INSERT INTO order_items (order_id, product_id, qty, unit_price, notes) VALUES (?, ?, ?, ?, ?)',
+                [(order_id, rnd.randint(1, 5), rnd.randint(1, 4), 30.0, None) for _ in range(3)])
+        latencias.append((time.perf_counter() - inicio) * 1000)
+        time.sleep(pausa)
+    conn.close()
+
+def fase(nombre, connect, write_transaction, args, trabajo=None):
+    """Corre los escritores `args.segundos` o mientras dure `trabajo`"""
+    conn = connect()
+    mesero = conn.execute("SELECT id FROM users WHERE role = 'admin'").fetchone()[0]
+    conn.close()
+    detener = threading.Event()
+    latencias = []
+    hilos = [threading.Thread(target=escritor, args=(connect, write_transaction, mesero, detener, latencias, args.pausa))
+             for _ in range(args.writers)]
+    for h in hilos:
+        h.start()
+    time.sleep(0.5)
+    latencias.clear()
+    resultado = {'fase': nombre}
+    inicio = time.perf_counter()
+    if trabajo:
+        resultado.update(trabajo())
+    else:
+        time.sleep(args.segundos)
+    resultado['segundos'] = round(time.perf_counter() - inicio, 2)
+    detener.set()
+    for h in hilos:
+        h.join()
+    resultado.update({
+        'escrituras': len(latencias),
+        'p50_ms': round(percentil(latencias, 50), 2),
+        'p95_ms': round(percentil(latencias, 95), 2),
+        'p99_ms': round(percentil(latencias, 99), 2),
+        'max_ms': round(max(latencias, default=0), 2),
+    })
+    return resultado
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--ordenes', type=int, default=200000, help='órdenes históricas para engordar la BD')
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--pausa', type=float, default=0.005, help='segundos entre escrituras de cada thread')
+    parser.add_argument('--segundos', type=float, default=5, help='duración de la fase sin respaldo')
+    parser.add_argument('--pages', type=int, default=100, help='páginas por paso del respaldo')
+    parser.add_argument('--pausa-backup', type=float, default=0.01, help='segundos entre pasos del respaldo')
+    parser.add_argument('--output', help='guardar el resultado en JSON')
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix='backup_bench_')
+    os.environ['DATABASE_PATH'] = os.path.join(tmp, 'taqueria.db')
+    os.environ['BACKUP_DIR'] = os.path.join(tmp, 'respaldos')
+    sys.path.insert(0, ROOT)
+    import backup
+    from database import DB_NAME, connect, write_transaction
+    from migrations import migrate
+
+    migrate(DB_NAME)
+    llenar(connect, args.ordenes)
+    tamano = os.path.getsize(DB_NAME) / 1024 / 1024
+
+    def por_pasos():
+        path = backup.respaldar(keep=100, pages=args.pages, pausa=args.pausa_backup)
+        return {'respaldo': path}
+
+    def un_paso():
+        destino = os.path.join(tmp, 'completo.db')
+        pasos = backup.copiar(DB_NAME, destino, pages=-1, pausa=0)
+        return {'pasos': pasos}
+
+    fases = [
+        fase('sin_respaldo', connect, write_transaction, args),
+        fase('respaldo_por_pasos', connect, write_transaction, args, por_pasos),
+        fase('respaldo_un_paso', connect, write_transaction, args, un_paso),
+    ]
+    resultado = {'bd_mb': round(tamano, 1), 'writers': args.writers, 'pages': args.pages,
+                 'pausa_backup': args.pausa_backup, 'fases': fases}
+    texto = json.dumps(resultado, indent=2, ensure_ascii=False)
+    print(texto)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(texto)
+
+if __name__ == '__main__':
+    main()
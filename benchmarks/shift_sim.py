@@ -0,0 +1,277 @@
+"""Simulación de un turno completo contra la app en proceso.
+
+Registra y loguea meseros, cocinas y cajas, enlaza cada mesero/caja a una
+cocina y durante `--duration` segundos ejecuta el ciclo real de servicio:
+el mesero abre la orden de una mesa y manda items, envíos y cancelaciones
+en lotes a /mesero/sync (como la cola del navegador, con algún reenvío),
+la cocina sirve y la caja cierra, más el polling de fondo de los dashboards. Reporta throughput, p50/p95/p99 por endpoint,
+errores de SQLite busy/locked y crecimiento de la BD en JSON.
+
+    python benchmarks/shift_sim.py --meseros 8 --cocinas 2 --cajas 2 --duration 30
+    python benchmarks/shift_sim.py --output actual.json --baseline base.json
+"""
+import argparse
+import contextlib
+import itertools
+import json
+import os
+import random
+import re
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Endpoints con menos muestras no se comparan contra el baseline (ruido)
+MIN_MUESTRAS = 20
+# Lotes de sync que el navegador reenvía (timeout, reconexión); vuelven como repetidos
+REENVIOS = 0.05
+
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    idx = min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))
+    return ordenados[idx]
+
+def tamano_bd(path):
+    return sum(os.path.getsize(f) for f in (path, path + '-wal') if os.path.exists(f))
+
+class Recorder:
+    """Latencias y errores por endpoint, compartido entre threads"""
+
+    def __init__(self):
+        self.latencias = defaultdict(list)
+        self.errores = defaultdict(int)
+        self.busy = 0
+        self._lock = threading.Lock()
+
+    def llamar(self, client, method, url, endpoint, **kwargs):
+        inicio = time.perf_counter()
+        error = busy = False
+        try:
+            resp = getattr(client, method)(url, **kwargs)
+            error = resp.status_code >= 400
+            busy = error and (b'locked' in resp.data or b'busy' in resp.data)
+        except sqlite3.OperationalError as e:
+            resp = None
+            error = True
+            busy = 'locked' in str(e) or 'busy' in str(e)
+        ms = (time.perf_counter() - inicio) * 1000
+        with self._lock:
+            self.latencias[endpoint].append(ms)
+            if error:
+                self.errores[endpoint] += 1
+            if busy:
+                self.busy += 1
+        return resp
+
+class Turno:
+    def __init__(self, app, args, rec):
+        self.app = app
+        self.args = args
+        self.rec = rec
+        self.deadline = None
+        self.productos = list(range(1, 20))
+        # Llaves únicas aunque se reutilice la BD (--db) con los mismos usuarios
+        self.corrida = uuid.uuid4().hex[:8]
+
+    def pausa(self):
+        time.sleep(random.uniform(0, self.args.think_ms * 2) / 1000)
+
+    def cliente(self, username, role):
+        c = self.app.test_client()
+        self.rec.llamar(c, 'post', '/register', 'register',
+                        data={'username': username, 'password': 'x', 'role': role})
+        self.rec.llamar(c, 'post', '/login', 'login',
+                        data={'username': username, 'password': 'x'})
+        return c
+
+    def preparar(self):
+        self.cocinas = []
+        for i in range(self.args.cocinas):
+            c = self.cliente(f'bench_cocina_{i}', 'cocina')
+            html = self.rec.llamar(c, 'get', '/cocina', 'cocina_dashboard').get_data(as_text=True)
+            codigo = re.search(r'letter-spacing: 8px;">\s*(\w{6})', html).group(1)
+            self.cocinas.append((c, codigo))
+        self.meseros = []
+        for i in range(self.args.meseros):
+            c = self.cliente(f'bench_mesero_{i}', 'mesero')
+            codigo = self.cocinas[i % len(self.cocinas)][1]
+            self.rec.llamar(c, 'post', '/mesero/enlazar-cocina', 'enlazar_cocina', json={'codigo': codigo})
+            self.meseros.append(c)
+        self.cajas = []
+        for i in range(self.args.cajas):
+            c = self.cliente(f'bench_caja_{i}', 'caja')
+            codigo = self.cocinas[i % len(self.cocinas)][1]
+            self.rec.llamar(c, 'post', '/caja/enlazar-cocina', 'caja_enlazar_cocina', json={'codigo': codigo})
+            self.cajas.append((c, codigo))
+
+    def sync(self, c, ops):
+        """Un lote de la cola del mesero; a veces se reenvía completo"""
+        self.rec.llamar(c, 'post', '/mesero/sync', 'mesero_sync', json={'ops': ops})
+        if random.random() < REENVIOS:
+            self.rec.llamar(c, 'post', '/mesero/sync', 'mesero_sync', json={'ops': ops})
+
+    def mesero(self, c, n):
+        llamar = self.rec.llamar
+        llaves = itertools.count()
+        def op(tipo, **campos):
+            return dict(campos, key=f'{self.corrida}-{n}-{next(llaves)}', op=tipo)
+
+        while time.monotonic() < self.deadline:
+            items = [{'product_id': random.choice(self.productos), 'qty': random.randint(1, 4)}
+                     for _ in range(random.randint(1, 6))]
+            if random.random() < 0.5:
+                # Mapa de mesas: abre la orden de la mesa y la pantalla de la
+                # orden encola items y envío en una sola operación
+                mesa = random.randint(1, 14)
+                resp = llamar(c, 'post', f'/mesero/mesa/{mesa}/orden', 'mesero_mesa_orden')
+                order_id = resp and resp.status_code == 200 and resp.get_json().get('order_id')
+                if not order_id:
+                    self.pausa()
+                    continue
+                ops = [op('enviar_orden', order_id=order_id, items=items)]
+                if random.random() < 0.05:
+                    ops.append(op('cancelar_orden', order_id=order_id))
+            else:
+                # Panel del mesero: la cola junta crear, agregar y enviar (o
+                # cancelar) de una orden nueva en el mismo lote
+                crear = op('crear_orden')
+                ops = [crear]
+                if random.random() < 0.05:
+                    ops.append(op('cancelar_orden', order_ref=crear['key']))
+                else:
+                    ops += [op('agregar_item', order_ref=crear['key'], **item) for item in items]
+                    ops.append(op('enviar_orden', order_ref=crear['key']))
+            self.sync(c, ops)
+            llamar(c, 'get', '/mesero', 'mesero_dashboard')
+            self.pausa()
+
+    def cocina(self, c, codigo):
+        llamar = self.rec.llamar
+        while time.monotonic() < self.deadline:
+            resp = llamar(c, 'get', f'/api/ordenes/items?codigo={codigo}&status=pendiente', 'api_ordenes_items')
+            pendientes = sorted(int(k) for k in resp.get_json()) if resp and resp.status_code == 200 else []
+            for order_id in pendientes[:3]:
+                llamar(c, 'post', f'/api/orden/{order_id}/servir', 'api_servir')
+            if random.random() < 0.1:
+                llamar(c, 'get', '/cocina', 'cocina_dashboard')
+            time.sleep(self.args.poll_ms / 1000)
+
+    def caja(self, c, codigo):
+        llamar = self.rec.llamar
+        while time.monotonic() < self.deadline:
+            llamar(c, 'get', '/caja', 'caja_dashboard')
+            resp = llamar(c, 'get', f'/api/ordenes/items?codigo={codigo}&status=servida', 'api_ordenes_items')
+            servidas = sorted(int(k) for k in resp.get_json()) if resp and resp.status_code == 200 else []
+            for order_id in servidas[:2]:
+                llamar(c, 'post', f'/caja/cerrar/{order_id}', 'caja_cerrar')
+            time.sleep(self.args.poll_ms / 1000)
+
+    def correr(self):
+        self.preparar()
+        hilos = [threading.Thread(target=self.mesero, args=(c, n)) for n, c in enumerate(self.meseros)]
+        hilos += [threading.Thread(target=self.cocina, args=cc) for cc in self.cocinas]
+        hilos += [threading.Thread(target=self.caja, args=cc) for cc in self.cajas]
+        inicio = time.monotonic()
+        self.deadline = inicio + self.args.duration
+        for h in hilos:
+            h.start()
+        for h in hilos:
+            h.join()
+        return time.monotonic() - inicio
+
+def reporte(rec, duracion, args, tamano_antes, tamano_despues):
+    total = sum(len(v) for v in rec.latencias.values())
+    endpoints = {}
+    for nombre, valores in sorted(rec.latencias.items()):
+        endpoints[nombre] = {
+            'count': len(valores),
+            'errors': rec.errores.get(nombre, 0),
+            'p50_ms': round(percentil(valores, 50), 3),
+            'p95_ms': round(percentil(valores, 95), 3),
+            'p99_ms': round(percentil(valores, 99), 3),
+            'max_ms': round(max(valores), 3),
+        }
+    return {
+        'config': {k: getattr(args, k) for k in ('meseros', 'cocinas', 'cajas', 'duration', 'think_ms', 'poll_ms', 'seed')},
+        'duration_s': round(duracion, 3),
+        'requests': total,
+        'throughput_rps': round(total / duracion, 2) if duracion else 0,
+        'errors': sum(rec.errores.values()),
+        'sqlite_busy_errors': rec.busy,
+        'db_size_bytes': {'before': tamano_antes, 'after': tamano_despues, 'growth': tamano_despues - tamano_antes},
+        'endpoints': endpoints,
+    }
+
+def comparar(actual, base, tolerancia):
+    """Regresiones contra un baseline: p95 por endpoint y throughput"""
+    regresiones = []
+    if actual['throughput_rps'] < base['throughput_rps'] * (1 - tolerancia):
+        regresiones.append(f"throughput {actual['throughput_rps']} < {base['throughput_rps']}")
+    for nombre, b in base['endpoints'].items():
+        a = actual['endpoints'].get(nombre)
+        if not a or min(a['count'], b['count']) < MIN_MUESTRAS:
+            continue
+        if a['p95_ms'] > b['p95_ms'] * (1 + tolerancia):
+            regresiones.append(f"{nombre} p95 {a['p95_ms']}ms > {b['p95_ms']}ms")
+    return regresiones
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--meseros', type=int, default=6)
+    parser.add_argument('--cocinas', type=int, default=2)
+    parser.add_argument('--cajas', type=int, default=2)
+    parser.add_argument('--duration', type=float, default=20, help='duración del turno en segundos')
+    parser.add_argument('--think-ms', type=float, default=50, help='pausa media entre acciones del mesero')
+    parser.add_argument('--poll-ms', type=float, default=500, help='intervalo de polling de cocina/caja')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--db', help='archivo SQLite (por defecto uno temporal)')
+    parser.add_argument('--output', help='escribe el reporte JSON en este archivo')
+    parser.add_argument('--baseline', help='reporte JSON previo para comparar')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    args = parser.parse_args(argv)
+
+    random.seed(args.seed)
+    db_path = args.db or os.path.join(tempfile.mkdtemp(), 'bench.db')
+    os.environ['DATABASE_PATH'] = db_path
+    sys.path.insert(0, ROOT)
+
+    # La migración inicial imprime mensajes; stdout queda solo para el JSON
+    with contextlib.redirect_stdout(sys.stderr):
+        from app import app
+    from database import connect
+    from utils import audit_writer
+    app.config['PROPAGATE_EXCEPTIONS'] = True
+    # Stock amplio: el turno ejercita las reservas sin agotar el menú
+    with connect() as conn:
+        conn.execute('UPDATE products SET stock = 1000000 WHERE stock IS NOT NULL')
+
+    rec = Recorder()
+    tamano_antes = tamano_bd(db_path)
+    duracion = Turno(app, args, rec).correr()
+    audit_writer.wait_idle()
+    resultado = reporte(rec, duracion, args, tamano_antes, tamano_bd(db_path))
+
+    salida = json.dumps(resultado, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(salida)
+    print(salida)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regresiones = comparar(resultado, json.load(f), args.tolerance)
+        for r in regresiones:
+            print(f'REGRESIÓN: {r}', file=sys.stderr)
+        return 1 if regresiones else 0
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
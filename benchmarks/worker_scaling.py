@@ -0,0 +1,192 @@
+"""Escalamiento de throughput con 1, 2 y 4 workers de gunicorn.
+
+Para cada número de workers levanta gunicorn (gthread) sobre una BD nueva y
+la carga por HTTP real desde procesos cliente independientes: cada cliente
+es un par mesero/cocina que crea órdenes por mesa, las envía en lote, las
+sirve y consulta los dashboards. Reporta throughput, p50/p95, errores y
+errores de SQLite busy/locked por configuración, más el speedup contra 1
+worker. Solo tiene sentido en una máquina con varios núcleos.
+
+    python benchmarks/worker_scaling.py --workers 1 2 4 --clients 8 --duration 20
+"""
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import random
+import re
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import urlencode
+
+from shift_sim import percentil
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class Cliente:
+    """Conexión keep-alive con la cookie de sesión de Flask"""
+
+    def __init__(self, port):
+        self.conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        self.cookie = None
+
+    def pedir(self, method, url, form=None, json_body=None):
+        headers = {}
+        body = None
+        if form is not None:
+            body = urlencode(form)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        elif json_body is not None:
+            body = json.dumps(json_body)
+            headers['Content-Type'] = 'application/json'
+        if self.cookie:
+            headers['Cookie'] = self.cookie
+        try:
+            self.conn.request(method, url, body=body, headers=headers)
+            resp = self.conn.getresponse()
+        except (http.client.RemoteDisconnected, ConnectionError):
+            # gunicorn cierra las conexiones keep-alive inactivas
+            self.conn.close()
+            self.conn.request(method, url, body=body, headers=headers)
+            resp = self.conn.getresponse()
+        data = resp.read()
+        cookie = resp.getheader('Set-Cookie')
+        if cookie:
+            self.cookie = cookie.split(';', 1)[0]
+        return resp.status, data
+
+def sesion(port, username, role):
+    c = Cliente(port)
+    c.pedir('POST', '/register', form={'username': username, 'password': 'x', 'role': role})
+    c.pedir('POST', '/login', form={'username': username, 'password': 'x'})
+    return c
+
+def cliente_carga(idx, port, listos, inicio, duracion, resultados):
+    random.seed(idx)
+    cocina = sesion(port, f'scale_cocina_{idx}', 'cocina')
+    _, html = cocina.pedir('GET', '/cocina')
+    codigo = re.search(rb'letter-spacing: 8px;">\s*(\w{6})', html).group(1).decode()
+    mesero = sesion(port, f'scale_mesero_{idx}', 'mesero')
+    mesero.pedir('POST', '/mesero/enlazar-cocina', json_body={'codigo': codigo})
+    listos.put(idx)
+    inicio.wait()
+
+    latencias, errores, busy = [], 0, 0
+
+    def llamar(c, method, url, **kwargs):
+        nonlocal errores, busy
+        t = time.perf_counter()
+        status, data = c.pedir(method, url, **kwargs)
+        latencias.append((time.perf_counter() - t) * 1000)
+        if status >= 400:
+            errores += 1
+            busy += b'locked' in data or b'busy' in data
+        return status, data
+
+    deadline = time.monotonic() + duracion
+    while time.monotonic() < deadline:
+        status, data = llamar(mesero, 'POST', f'/mesero/mesa/{random.randint(1, 14)}/orden')
+        if status == 200:
+            order_id = json.loads(data)['order_id']
+            items = [{'product_id': random.randint(1, 19), 'qty': random.randint(1, 3)}
+                     for _ in range(random.randint(1, 5))]
+            llamar(mesero, 'POST', f'/mesero/orden/{order_id}/enviar-lote', json_body={'items': items})
+        llamar(mesero, 'GET', '/mesero')
+        status, data = llamar(cocina, 'GET', f'/api/ordenes/items?codigo={codigo}&status=pendiente')
+        if status == 200:
+            for order_id in sorted(json.loads(data), key=int)[:2]:
+                llamar(cocina, 'POST', f'/api/orden/{order_id}/servir')
+
+    resultados.put({'latencias': latencias, 'errores': errores, 'busy': busy})
+
+def puerto_libre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def esperar_servidor(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            status, _ = Cliente(port).pedir('GET', '/login')
+            if status == 200:
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('gunicorn no respondió')
+
+def correr(workers, args):
+    db_path = os.path.join(tempfile.mkdtemp(), 'scale.db')
+    env = dict(os.environ, DATABASE_PATH=db_path)
+    port = puerto_libre()
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', 'app:app', '--bind', f'127.0.0.1:{port}',
+         '--workers', str(workers), '--threads', str(args.threads), '--worker-class', 'gthread',
+         '--log-level', 'warning'],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL,
+    )
+    try:
+        esperar_servidor(port)
+        # Stock amplio: la carga ejercita las reservas sin agotar el menú
+        with sqlite3.connect(db_path) as conn:
+            conn.execute('UPDATE products SET stock = 1000000 WHERE stock IS NOT NULL')
+        listos, resultados = multiprocessing.Queue(), multiprocessing.Queue()
+        inicio = multiprocessing.Event()
+        procesos = [multiprocessing.Process(target=cliente_carga,
+                                            args=(i, port, listos, inicio, args.duration, resultados))
+                    for i in range(args.clients)]
+        for p in procesos:
+            p.start()
+        for _ in procesos:
+            listos.get(timeout=60)
+        t = time.monotonic()
+        inicio.set()
+        parciales = [resultados.get(timeout=args.duration + 60) for _ in procesos]
+        duracion = time.monotonic() - t
+        for p in procesos:
+            p.join()
+    finally:
+        server.terminate()
+        server.wait()
+
+    latencias = [ms for r in parciales for ms in r['latencias']]
+    return {
+        'workers': workers,
+        'requests': len(latencias),
+        'throughput_rps': round(len(latencias) / duracion, 2),
+        'p50_ms': round(percentil(latencias, 50), 3),
+        'p95_ms': round(percentil(latencias, 95), 3),
+        'errors': sum(r['errores'] for r in parciales),
+        'sqlite_busy_errors': sum(r['busy'] for r in parciales),
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--clients', type=int, default=8, help='procesos cliente (par mesero/cocina cada uno)')
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--output', help='escribe el reporte JSON en este archivo')
+    args = parser.parse_args(argv)
+
+    resultados = [correr(n, args) for n in args.workers]
+    base = resultados[0]['throughput_rps'] or 1
+    for r in resultados:
+        r['speedup'] = round(r['throughput_rps'] / base, 2)
+
+    reporte = {'cpu_count': os.cpu_count(), 'threads': args.threads, 'clients': args.clients,
+               'duration_s': args.duration, 'results': resultados}
+    salida = json.dumps(reporte, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(salida)
+    print(salida)
+    return 1 if any(r['sqlite_busy_errors'] for r in resultados) else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
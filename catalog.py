@@ -0,0 +1,67 @@
+import os
+import threading
+import time
+from types import MappingProxyType
+from database import connect
+
+class Catalog:
+    """Snapshot inmutable de productos: por id y ordenado por categoría"""
+
+    def __init__(self, version, rows):
+        self.version = version
+        self.productos = tuple(MappingProxyType(dict(row)) for row in rows)
+        self.by_id = MappingProxyType({p['id']: p for p in self.productos})
+
+    def get(self, product_id):
+        return self.by_id.get(product_id)
+
+class CatalogCache:
+    """Catálogo de productos en memoria.
+
+    Se invalida localmente en cada escritura del admin y detecta cambios de
+    otros procesos con PRAGMA data_version + el contador catalog_version,
+    revisándolos como máximo una vez cada `check_interval` segundos.
+    """
+
+    def __init__(self, check_interval=1.0):
+        self.check_interval = check_interval
+        self.reloads = 0
+        self._snapshot = None
+        self._last_check = 0.0
+        self._data_version = None
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+
+    def _connection(self):
+        if self._pid != os.getpid():
+            self._conn = connect()
+            self._pid = os.getpid()
+            self._data_version = None
+        return self._conn
+
+    def get(self):
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() - self._last_check < self.check_interval:
+            return snapshot
+
+        with self._lock:
+            conn = self._connection()
+            data_version = conn.execute('PRAGMA data_version').fetchone()[0]
+            snapshot = self._snapshot
+            if snapshot is None or data_version != self._data_version:
+                version = conn.execute('SELECT version FROM catalog_version WHERE id = 1').fetchone()
+                version = version[0] if version else 0
+                if snapshot is None or version != snapshot.version:
+                    rows = conn.execute('SELECT * FROM products ORDER BY category, name').fetchall()
+                    snapshot = self._snapshot = Catalog(version, rows)
+                    self.reloads += 1
+                self._data_version = data_version
+            self._last_check = time.monotonic()
+            return snapshot
+
+    def invalidate(self):
+        with self._lock:
+            self._snapshot = None
+
+catalog = CatalogCache()
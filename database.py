@@ -1,16 +1,369 @@
+import glob
+import os
+import random
+import re
 import sqlite3
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
+from flask import g, has_app_context
 
-DB_NAME = 'taqueria.db'
+DB_NAME = os.getenv('DATABASE_PATH', 'taqueria.db')
+
+# Modo por cocina (opcional): órdenes, items y auditoría de cada código de
+# cocina en su propio archivo dentro de SHARD_DIR; usuarios, productos y
+# cocinas se quedan en DB_NAME
+SHARD_DIR = os.getenv('SHARD_DIR')
+
+# PRAGMAs aplicados una sola vez al abrir cada conexión
+PRAGMAS = (
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('busy_timeout', 5000),
+    ('cache_size', -8000),          # ~8 MB por conexión
+    ('mmap_size', 64 * 1024 * 1024),
+    ('foreign_keys', 'ON'),
+)
+
+# Funciones llamadas con cada conexión nueva (instrumentación, perfiles)
+connect_hooks = []
+
+# Funciones llamadas tras cada commit de write_transaction: fn(db)
+commit_hooks = []
+
+# Observadores de consultas: fn(sql, params, segundos, conexión); params es
+# None en executemany. Los segundos incluyen traer las filas: se avisa una vez
+# por sentencia, al leer la última fila o al cerrar/descartar el cursor. Sin
+# observadores execute() no mide nada.
+query_observers = []
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor que suma a su sentencia el tiempo de los fetch"""
+    _sql = None
+
+    def _medir(self, sql, params, elapsed):
+        self._sql, self._params, self._elapsed = sql, params, elapsed
+        if self.description is None:
+            # Sin filas que leer (INSERT/UPDATE sin RETURNING, PRAGMA de escritura)
+            self._reportar()
+
+    def _reportar(self):
+        sql, self._sql = self._sql, None
+        if sql is not None:
+            for observer in query_observers:
+                observer(sql, self._params, self._elapsed, self.connection)
+
+    def _leer(self, metodo, *args):
+        if self._sql is None:
+            return metodo(self, *args)
+        inicio = time.perf_counter()
+        try:
+            return metodo(self, *args)
+        finally:
+            self._elapsed += time.perf_counter() - inicio
+
+    def fetchone(self):
+        row = self._leer(sqlite3.Cursor.fetchone)
+        if row is None:
+            self._reportar()
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        rows = self._leer(sqlite3.Cursor.fetchmany, size)
+        if len(rows) < size:
+            self._reportar()
+        return rows
+
+    def fetchall(self):
+        rows = self._leer(sqlite3.Cursor.fetchall)
+        self._reportar()
+        return rows
+
+    def __next__(self):
+        try:
+            return self._leer(sqlite3.Cursor.__next__)
+        except StopIteration:
+            self._reportar()
+            raise
+
+    def close(self):
+        self._reportar()
+        super().close()
+
+    def __del__(self):
+        # p. ej. execute(...).fetchone() sin leer hasta el final
+        self._reportar()
+
+class TimedConnection(sqlite3.Connection):
+    """Conexión que reporta la duración de cada sentencia (execute + fetch) a query_observers"""
+
+    def execute(self, sql, parameters=()):
+        if not query_observers:
+            return super().execute(sql, parameters)
+        cursor = self.cursor(TimedCursor)
+        inicio = time.perf_counter()
+        try:
+            cursor.execute(sql, parameters)
+        except BaseException:
+            elapsed = time.perf_counter() - inicio
+            for observer in query_observers:
+                observer(sql, parameters, elapsed, self)
+            raise
+        cursor._medir(sql, parameters, time.perf_counter() - inicio)
+        return cursor
+
+    def executemany(self, sql, seq_of_parameters):
+        if not query_observers:
+            return super().executemany(sql, seq_of_parameters)
+        inicio = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            elapsed = time.perf_counter() - inicio
+            for observer in query_observers:
+                observer(sql, None, elapsed, self)
+
+# ============ CONNECTION POOL ============
+def connect(path=None, attach=()):
+    """Abre una conexión nueva con los PRAGMAs de rendimiento.
+
+    attach: pares (alias, ruta) que se adjuntan en solo lectura.
+    """
+    conn = sqlite3.connect(path or DB_NAME, check_same_thread=False, factory=TimedConnection, uri=True)
+    conn.row_factory = sqlite3.Row
+    for pragma, value in PRAGMAS:
+        conn.execute(f'PRAGMA {pragma} = {value}')
+    for alias, ruta in attach:
+        conn.execute('ATTACH DATABASE ? AS ?', (f'file:{os.path.abspath(ruta)}?mode=ro', alias))
+    for hook in connect_hooks:
+        hook(conn)
+    return conn
+
+class ConnectionPool:
+    """Pool de conexiones reutilizables compartido por los threads del worker"""
+
+    def __init__(self, path=None, max_idle=8, attach=()):
+        self.path = path
+        self.max_idle = max_idle
+        self.attach = attach
+        self._idle = []
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.in_use = 0
+
+    def acquire(self):
+        with self._lock:
+            self.in_use += 1
+            if self._idle:
+                self.hits += 1
+                return self._idle.pop()
+            self.misses += 1
+        return connect(self.path, self.attach)
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            self.in_use -= 1
+            if len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'idle': len(self._idle),
+                'in_use': self.in_use,
+            }
+
+pool = ConnectionPool()
 
 def get_db():
-    db = sqlite3.connect(DB_NAME)
-    db.row_factory = sqlite3.Row
-    return db
+    """Conexión del request actual, del pool; se devuelve al terminar el request.
+
+    Fuera de Flask no hay quién la cierre: scripts y threads usan
+    `with conexion() as db:`.
+    """
+    if not has_app_context():
+        raise RuntimeError('get_db() fuera de un contexto de app; usa `with conexion() as db:`')
+    if 'db' not in g:
+        g.db = pool.acquire()
+    return g.db
+
+def close_db(exc=None):
+    """Devuelve las conexiones del request a sus pools"""
+    db = g.pop('db', None)
+    if db is not None:
+        pool.release(db)
+    for codigo, conn in g.pop('shard_dbs', {}).items():
+        shard_pool(codigo).release(conn)
+
+def init_app(app):
+    app.teardown_appcontext(close_db)
 
-def close_db():
-    db = sqlite3.connect(DB_NAME)
-    db.close()
+# ============ TRANSACCIONES DE ESCRITURA ============
+# Con varios workers, una transacción diferida que lee y luego escribe puede
+# fallar con SQLITE_BUSY al promoverse a escritura aunque haya busy_timeout.
+# BEGIN IMMEDIATE toma el candado de escritura desde el inicio.
+BUSY_RETRIES = 5
+BUSY_BACKOFF = 0.05     # segundos; se duplica en cada intento
+
+busy_stats = {'retries': 0, 'failures': 0}
+
+def is_busy(exc):
+    mensaje = str(exc)
+    return isinstance(exc, sqlite3.OperationalError) and ('locked' in mensaje or 'busy' in mensaje)
+
+def begin_immediate(db):
+    """BEGIN IMMEDIATE con reintentos y backoff exponencial con jitter"""
+    for intento in range(BUSY_RETRIES):
+        try:
+            db.execute('BEGIN IMMEDIATE')
+            return
+        except sqlite3.OperationalError as e:
+            if not is_busy(e):
+                raise
+            if intento == BUSY_RETRIES - 1:
+                busy_stats['failures'] += 1
+                raise
+            busy_stats['retries'] += 1
+            time.sleep(random.uniform(0, BUSY_BACKOFF * 2 ** intento))
+
+@contextmanager
+def write_transaction(db=None):
+    """Transacción de escritura: commit al salir, rollback si hay excepción.
+
+    Las lecturas que deciden la escritura (existe, estado actual) van
+    dentro del bloque para que ningún otro worker cambie los datos entre
+    la lectura y el commit.
+    """
+    db = db or get_db()
+    begin_immediate(db)
+    try:
+        yield db
+    except BaseException:
+        if db.in_transaction:
+            db.rollback()
+        raise
+    if db.in_transaction:
+        db.commit()
+    for hook in commit_hooks:
+        hook(db)
+
+# ============ SHARDS POR COCINA ============
+# La conexión de un shard tiene su archivo como main y la BD global
+# adjunta en solo lectura como "global": las consultas existentes resuelven
+# orders/order_items en el shard y users/products/tables en la global sin
+# cambiar el SQL. Al ser de solo lectura, BEGIN IMMEDIATE solo bloquea el
+# shard, así que cada cocina escribe sin esperar a las demás.
+_CODIGO = re.compile(r'[A-Z0-9]{6}')
+_shard_pools = {}
+_shard_lock = threading.Lock()
+
+def shard_path(codigo):
+    if not _CODIGO.fullmatch(codigo or ''):
+        raise LookupError(f'Código de cocina inválido: {codigo!r}')
+    return os.path.join(SHARD_DIR, f'cocina_{codigo}.db')
+
+def order_db_path(codigo):
+    """Archivo donde viven las órdenes de esa cocina"""
+    return shard_path(codigo) if SHARD_DIR and codigo else DB_NAME
+
+def shard_pool(codigo):
+    """Pool del shard; la primera vez en el proceso valida el código y migra el archivo"""
+    shard = _shard_pools.get(codigo)
+    if shard is not None:
+        return shard
+    with _shard_lock:
+        shard = _shard_pools.get(codigo)
+        if shard is None:
+            path = shard_path(codigo)
+            conn = connect()
+            try:
+                existe = conn.execute('SELECT 1 FROM cocinas WHERE codigo = ?', (codigo,)).fetchone()
+            finally:
+                conn.close()
+            if not existe:
+                raise LookupError(f'Código de cocina inválido: {codigo!r}')
+            from migrations import SHARD_MIGRATIONS, migrate
+            os.makedirs(SHARD_DIR, exist_ok=True)
+            migrate(path, SHARD_MIGRATIONS)
+            shard = _shard_pools[codigo] = ConnectionPool(path, attach=(('global', DB_NAME),))
+    return shard
+
+def get_order_db(codigo):
+    """Conexión para las órdenes de una cocina (la global si no hay shards)"""
+    if not SHARD_DIR or not codigo:
+        return get_db()
+    if not has_app_context():
+        raise RuntimeError('get_order_db() fuera de un contexto de app; usa `with conexion(codigo) as db:`')
+    shard_dbs = g.setdefault('shard_dbs', {})
+    if codigo not in shard_dbs:
+        shard_dbs[codigo] = shard_pool(codigo).acquire()
+    return shard_dbs[codigo]
+
+def connect_orders(codigo):
+    """Conexión propia (fuera de requests) a las órdenes de una cocina"""
+    if not SHARD_DIR or not codigo:
+        return connect()
+    shard_pool(codigo)
+    return connect(shard_path(codigo), (('global', DB_NAME),))
+
+@contextmanager
+def conexion(codigo=None):
+    """Conexión propia (global o de la cocina) que se cierra al salir del bloque"""
+    conn = connect_orders(codigo)
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+def shard_codes():
+    """Códigos de cocina con shard creado"""
+    if not SHARD_DIR:
+        return []
+    archivos = glob.glob(os.path.join(SHARD_DIR, 'cocina_*.db'))
+    return sorted(os.path.basename(f)[len('cocina_'):-len('.db')] for f in archivos)
+
+def query_orders_all(sql, params=()):
+    """Reporte sobre las órdenes de todas las cocinas.
+
+    `sql` usa {s} como esquema (FROM {s}.orders). Se ejecuta sobre la BD
+    global y sobre cada shard, adjuntando los shards en lotes a una sola
+    conexión de lectura; devuelve las filas concatenadas.
+    """
+    conn = connect()
+    try:
+        filas = conn.execute(sql.format(s='main'), params).fetchall()
+        codigos = shard_codes()
+        lote = conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)
+        for inicio in range(0, len(codigos), lote):
+            adjuntos = []
+            for i, codigo in enumerate(codigos[inicio:inicio + lote]):
+                alias = f'k{i}'
+                conn.execute('ATTACH DATABASE ? AS ?', (f'file:{os.path.abspath(shard_path(codigo))}?mode=ro', alias))
+                adjuntos.append(alias)
+            try:
+                for alias in adjuntos:
+                    filas.extend(conn.execute(sql.format(s=alias), params).fetchall())
+            finally:
+                for alias in adjuntos:
+                    conn.execute(f'DETACH DATABASE {alias}')
+        return filas
+    finally:
+        conn.close()
 
 class User:
     @staticmethod
@@ -31,22 +384,70 @@ class User:
                    (user_id, codigo, datetime.utcnow().isoformat()))
         db.commit()
 
+# ============ MÁQUINA DE ESTADOS DE ÓRDENES ============
+# borrador -> pendiente -> servida -> cerrada; borrador/pendiente se cancelan.
+# Cada transición es un solo UPDATE condicionado al estado previo: si otra
+# caja o worker ya la hizo, no se toca ninguna fila.
+TRANSICIONES = {
+    # nuevo estado: (estado previo requerido, columna de fecha)
+    'pendiente': ('borrador', 'updated_at'),
+    'servida': ('pendiente', 'updated_at'),
+    'cerrada': ('servida', 'closed_at'),
+}
+CANCELABLES = ('borrador', 'pendiente')
+
+def _order_db(codigo):
+    """get_order_db sin caer en la global: con shards hace falta la cocina"""
+    if SHARD_DIR and not codigo:
+        raise LookupError('Con shards hace falta el código de cocina')
+    return get_order_db(codigo)
+
 class Order:
     @staticmethod
-    def get_by_mesero(user_id):
-        db = get_db()
+    def transicion(db, order_id, nuevo, mesero_id=None, sumar_total=None, recalcular_total=False):
+        """Cambia el estado; devuelve la orden actualizada o None si no estaba en el estado previo"""
+        previo, columna = TRANSICIONES[nuevo]
+        sets = f'status = ?, {columna} = ?'
+        params = [nuevo, datetime.now().isoformat()]
+        if sumar_total is not None:
+            sets += ', total = total + ?'
+            params.append(sumar_total)
+        elif recalcular_total:
+            sets += ', total = (SELECT COALESCE(SUM(qty * unit_price), 0) FROM order_items WHERE order_id = orders.id)'
+        where = 'id = ? AND status = ?'
+        params += [order_id, previo]
+        if mesero_id is not None:
+            where += ' AND mesero_id = ?'
+            params.append(mesero_id)
+        return db.execute(
+            f'UPDATE orders SET {sets} WHERE {where} RETURNING id, codigo_cocina, status, total',
+            params
+        ).fetchone()
+
+    @staticmethod
+    def cancelar(db, order_id, mesero_id):
+        """Borra la orden si aún es cancelable; los items se van por ON DELETE CASCADE"""
+        placeholders = ', '.join('?' * len(CANCELABLES))
+        return db.execute(
+            f'DELETE FROM orders WHERE id = ? AND mesero_id = ? AND status IN ({placeholders}) '
+            'RETURNING id, codigo_cocina, status',
+            (order_id, mesero_id, *CANCELABLES)
+        ).fetchone()
+
+    @staticmethod
+    def get_by_mesero(user_id, codigo):
+        db = _order_db(codigo)
         return db.execute('''
-            SELECT o.*, COUNT(oi.id) as items_count
+            SELECT o.*,
+                   (SELECT COUNT(*) FROM order_items oi WHERE oi.order_id = o.id) as items_count
             FROM orders o
-            LEFT JOIN order_items oi ON oi.order_id = o.id
             WHERE o.mesero_id = ? AND o.status != 'cerrada'
-            GROUP BY o.id
             ORDER BY o.created_at DESC
         ''', (user_id,)).fetchall()
 
     @staticmethod
     def get_pendientes_by_cocina(codigo):
-        db = get_db()
+        db = _order_db(codigo)
         return db.execute('''
             SELECT o.id, t.name as mesa, o.created_at, u.username as mesero
             FROM orders o
@@ -58,8 +459,8 @@ class Order:
         ''', (codigo,)).fetchall()
 
     @staticmethod
-    def get_items(order_id):
-        db = get_db()
+    def get_items(order_id, codigo):
+        db = _order_db(codigo)
         return db.execute('''
             SELECT oi.qty, p.name as producto, oi.notes
             FROM order_items oi
@@ -68,19 +469,23 @@ class Order:
         ''', (order_id,)).fetchall()
 
     @staticmethod
-    def marcar_servida(order_id):
-        db = get_db()
-        db.execute('UPDATE orders SET status = ? WHERE id = ?', ('servida', order_id))
-        db.commit()
+    def marcar_servida(order_id, codigo):
+        with write_transaction(_order_db(codigo)) as db:
+            return Order.transicion(db, order_id, 'servida')
 
 class Product:
     @staticmethod
     def all():
-        db = get_db()
-        return db.execute('SELECT * FROM products ORDER BY category, name').fetchall()
+        from catalog import catalog
+        return catalog.get().productos
+
+    @staticmethod
+    def get(product_id):
+        from catalog import catalog
+        return catalog.get().get(product_id)
 
 class Table:
     @staticmethod
     def all():
         db = get_db()
-        return db.execute('SELECT * FROM tables ORDER BY id').fetchall()
\ No newline at end of file
+        return db.execute('SELECT * FROM tables ORDER BY id').fetchall()
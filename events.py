@@ -0,0 +1,152 @@
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from database import connect_orders, order_db_path
+
+# Cada stream abierto ocupa un thread del worker (gthread) hasta max_lifetime;
+# el tope por worker debe quedar debajo de --threads para que siempre haya
+# threads para los requests normales. Los clientes rechazados sondean con ETag
+SSE_MAX_SUBSCRIBERS = int(os.getenv('SSE_MAX_SUBSCRIBERS', 2))
+
+class Subscriber:
+    """Cola acotada de un cliente SSE"""
+
+    def __init__(self, topic, max_queue):
+        self.topic = topic
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.closed = False
+
+class EventHub:
+    """Broadcast en memoria de eventos por código de cocina.
+
+    Cada suscriptor tiene una cola acotada; si un cliente lento la llena se
+    le desconecta en lugar de bloquear a quien publica.
+
+    Con varios workers, los eventos de otros procesos llegan por la tabla
+    order_events: un thread relay por proceso la lee cuando PRAGMA
+    data_version indica escrituras ajenas y hay suscriptores locales (una
+    fuente por archivo de órdenes: la BD global o el shard de cada cocina).
+    """
+
+    def __init__(self, max_queue=100, heartbeat=15, max_lifetime=300, max_subscribers=SSE_MAX_SUBSCRIBERS):
+        self.max_queue = max_queue
+        self.heartbeat = heartbeat
+        self.max_lifetime = max_lifetime
+        self.max_subscribers = max_subscribers
+        self._topics = {}
+        self._lock = threading.Lock()
+        self.dropped = 0
+        self.rejected = 0
+        self.relayed = 0
+        self.poll_interval = 0.25
+        self._loader = None
+        self._relay_pid = None
+
+    def start_relay(self, loader, poll_interval=0.25):
+        """loader(conn, evento, order_id, codigo) -> datos del evento o None"""
+        self._loader = loader
+        self.poll_interval = poll_interval
+
+    def has_subscribers(self, topic):
+        return bool(self._topics.get(topic))
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subs) for subs in self._topics.values())
+
+    def subscribe(self, topic):
+        """Registra un suscriptor; devuelve None si se alcanzó el límite"""
+        with self._lock:
+            if sum(len(subs) for subs in self._topics.values()) >= self.max_subscribers:
+                self.rejected += 1
+                return None
+            sub = Subscriber(topic, self.max_queue)
+            self._topics.setdefault(topic, set()).add(sub)
+            if self._loader is not None and self._relay_pid != os.getpid():
+                self._relay_pid = os.getpid()
+                threading.Thread(target=self._relay, name='event-relay', daemon=True).start()
+            return sub
+
+    def unsubscribe(self, sub):
+        sub.closed = True
+        with self._lock:
+            subs = self._topics.get(sub.topic)
+            if subs:
+                subs.discard(sub)
+                if not subs:
+                    del self._topics[sub.topic]
+
+    def publish(self, topic, event, data):
+        with self._lock:
+            subs = list(self._topics.get(topic, ()))
+        if not subs:
+            return
+        message = f'event: {event}\ndata: {json.dumps(data, default=str)}\n\n'
+        for sub in subs:
+            try:
+                sub.queue.put_nowait(message)
+            except queue.Full:
+                self.dropped += 1
+                self.unsubscribe(sub)
+
+    def _relay(self):
+        pid = os.getpid()
+        fuentes = {}    # archivo de órdenes -> [conexión, data_version, último id]
+        while True:
+            time.sleep(self.poll_interval)
+            with self._lock:
+                topics = list(self._topics)
+            rutas = {}
+            for codigo in topics:
+                try:
+                    rutas.setdefault(order_db_path(codigo), codigo)
+                except LookupError:
+                    continue
+            for ruta in set(fuentes) - set(rutas):
+                fuentes.pop(ruta)[0].close()
+            for ruta, codigo in rutas.items():
+                try:
+                    if ruta not in fuentes:
+                        fuentes[ruta] = [connect_orders(codigo), None, None]
+                    self._relay_fuente(fuentes[ruta], pid)
+                except (sqlite3.Error, LookupError):
+                    # BD ocupada o en migración: se reintenta en la siguiente vuelta
+                    continue
+
+    def _relay_fuente(self, fuente, pid):
+        conn, data_version, ultimo = fuente
+        actual = conn.execute('PRAGMA data_version').fetchone()[0]
+        if ultimo is None:
+            ultimo = conn.execute('SELECT COALESCE(MAX(id), 0) FROM order_events').fetchone()[0]
+        elif actual != data_version:
+            eventos = conn.execute(
+                'SELECT id, codigo_cocina, event, order_id, pid FROM order_events WHERE id > ? ORDER BY id',
+                (ultimo,)).fetchall()
+            for row in eventos:
+                ultimo = row['id']
+                # Los eventos propios ya se publicaron en memoria
+                if row['pid'] == pid or not self.has_subscribers(row['codigo_cocina']):
+                    continue
+                data = self._loader(conn, row['event'], row['order_id'], row['codigo_cocina'])
+                if data is not None:
+                    self.publish(row['codigo_cocina'], row['event'], data)
+                    self.relayed += 1
+        fuente[1:] = [actual, ultimo]
+
+    def stream(self, sub):
+        """Generador SSE con heartbeats y tiempo de vida máximo"""
+        deadline = time.monotonic() + self.max_lifetime
+        try:
+            yield 'retry: 3000\n\n'
+            while not sub.closed and time.monotonic() < deadline:
+                try:
+                    yield sub.queue.get(timeout=self.heartbeat)
+                except queue.Empty:
+                    yield ': ping\n\n'
+        finally:
+            self.unsubscribe(sub)
+
+hub = EventHub()
@@ -0,0 +1,204 @@
+"""Exportación de órdenes cerradas con sus items, en CSV o JSONL.
+
+Para el corte de turno y contabilidad. Nada se arma completo en memoria:
+cada BD de órdenes (la global, cada shard y sus archivos históricos) se lee
+con un cursor en orden de cierre, de `LOTE` filas en `LOTE` con fetchmany,
+y las fuentes se mezclan en Python con heapq.merge. Cada trozo de texto se
+entrega en cuanto se escribe y, si se pide, se comprime al vuelo con gzip.
+La memoria depende del lote y del número de fuentes, no del rango de fechas.
+"""
+import csv
+import heapq
+import io
+import json
+import zlib
+from datetime import date, timedelta
+from itertools import groupby, islice
+from archive import con_archivo
+from database import DB_NAME, SHARD_DIR, get_db, get_order_db, order_db_path, shard_codes
+from rollups import rango
+
+LOTE = 500
+
+COLUMNAS_CSV = ('order_id', 'cocina', 'mesero_id', 'mesero', 'mesa', 'creada', 'cerrada', 'total_orden',
+                'item_id', 'product_id', 'producto', 'qty', 'unit_price', 'subtotal', 'notas')
+
+class Filtros:
+    def __init__(self, desde=None, hasta=None, codigo=None, mesero=None):
+        # Por omisión solo hoy: el corte del día
+        self.desde, self.hasta = rango(desde, hasta, dias=1)
+        self.codigo = codigo or None
+        self.mesero = mesero
+
+    def where(self):
+        """Condiciones y parámetros sobre `o`, con los límites de closed_at como texto ISO"""
+        fin = (date.fromisoformat(self.hasta) + timedelta(days=1)).isoformat()
+        condiciones = ["o.status = 'cerrada'", 'o.closed_at >= ?', 'o.closed_at < ?']
+        params = [self.desde, fin]
+        # `+` descarta los índices de cocina y mesero: el orden de salida lo da
+        # el índice de closed_at y así nunca hay un ordenamiento temporal
+        if self.codigo:
+            condiciones.append('+o.codigo_cocina = ?')
+            params.append(self.codigo)
+        if self.mesero is not None:
+            condiciones.append('+o.mesero_id = ?')
+            params.append(self.mesero)
+        return condiciones, params
+
+    def nombre(self, formato):
+        partes = ['ordenes', self.desde] + ([self.hasta] if self.hasta != self.desde else [])
+        partes += [p for p in (self.codigo, self.mesero and f'mesero{self.mesero}') if p]
+        return f'{"_".join(partes)}.{formato}'
+
+def _consulta(db, s, filtros, archivo_de=None):
+    """Cursor sobre las cerradas de `s` con sus items, en (closed_at, id, item) ascendente.
+
+    Para un archivo (`archivo_de` es el esquema vivo) se omiten las órdenes
+    que siguen vivas, igual que historial().
+    """
+    condiciones, params = filtros.where()
+    if archivo_de:
+        condiciones.append(f'NOT EXISTS (SELECT 1 FROM {archivo_de}.orders v WHERE v.id = o.id)')
+    return db.execute(f'''
+        SELECT o.id as order_id, o.codigo_cocina, o.mesero_id, o.total, o.created_at, o.closed_at,
+               t.table_id, oi.id as item_id, oi.product_id, oi.qty, oi.unit_price, oi.subtotal, oi.notes
+        FROM {s}.orders o
+        LEFT JOIN {s}.table_orders t ON t.order_id = o.id
+        LEFT JOIN {s}.order_items oi ON oi.order_id = o.id
+        WHERE {" AND ".join(condiciones)}
+        ORDER BY o.closed_at, o.id, oi.id
+    ''', params)
+
+def _leer(cursor):
+    while True:
+        filas = cursor.fetchmany(LOTE)
+        if not filas:
+            return
+        yield from filas
+
+def _clave(fila):
+    return fila['closed_at'], fila['order_id'], fila['item_id'] or 0
+
+def _filas_fuente(db, path, filtros):
+    """Filas de una BD de órdenes y de su archivo, mezcladas en orden de cierre"""
+    with con_archivo(db, path) as archivo:
+        cursores = [_consulta(db, 'main', filtros)]
+        if archivo:
+            cursores.append(_consulta(db, archivo, filtros, archivo_de='main'))
+        try:
+            yield from heapq.merge(*map(_leer, cursores), key=_clave)
+        finally:
+            # El archivo no se puede separar con sentencias abiertas
+            for cursor in cursores:
+                cursor.close()
+
+def _fuentes(filtros):
+    """(fuente, conexión, ruta) de cada BD con órdenes que pueden pasar el filtro.
+
+    Con cocina solo su BD; LookupError si la cocina no existe (con shards).
+    """
+    if filtros.codigo:
+        yield filtros.codigo, get_order_db(filtros.codigo), order_db_path(filtros.codigo)
+        return
+    yield '', get_db(), DB_NAME
+    for codigo in shard_codes() if SHARD_DIR else ():
+        yield codigo, get_order_db(codigo), order_db_path(codigo)
+
+def _etiquetar(fuente, filas):
+    for fila in filas:
+        yield fuente, fila
+
+def filas(filtros):
+    """(fuente, fila) de todas las fuentes en orden (closed_at, fuente, orden, item).
+
+    Las conexiones se piden antes de empezar, así una cocina inválida falla
+    antes de enviar la respuesta.
+    """
+    generadores = [_etiquetar(fuente, _filas_fuente(db, path, filtros))
+                   for fuente, db, path in _fuentes(filtros)]
+
+    def mezcla():
+        try:
+            yield from heapq.merge(
+                *generadores,
+                key=lambda par: (par[1]['closed_at'], par[0], par[1]['order_id'], par[1]['item_id'] or 0)
+            )
+        finally:
+            for generador in generadores:
+                generador.close()
+    return mezcla()
+
+class Nombres:
+    """Nombres de meseros, productos y mesas; son tablas chicas y se leen una vez"""
+    def __init__(self):
+        from catalog import catalog
+        db = get_db()
+        self.meseros = dict(db.execute('SELECT id, username FROM users').fetchall())
+        self.mesas = dict(db.execute('SELECT id, name FROM tables').fetchall())
+        self.productos = catalog.get()
+
+    def producto(self, product_id):
+        producto = self.productos.get(product_id)
+        return producto['name'] if producto else f'Producto #{product_id}'
+
+def _trozos(lineas):
+    """Junta las líneas en trozos de LOTE para no entregar una por una"""
+    while True:
+        trozo = ''.join(islice(lineas, LOTE))
+        if not trozo:
+            return
+        yield trozo
+
+def csv_trozos(filas, nombres):
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    escritor.writerow(COLUMNAS_CSV)
+    yield buffer.getvalue()
+    while True:
+        lote = list(islice(filas, LOTE))
+        if not lote:
+            return
+        buffer.seek(0)
+        buffer.truncate()
+        for _, f in lote:
+            escritor.writerow((
+                f['order_id'], f['codigo_cocina'], f['mesero_id'], nombres.meseros.get(f['mesero_id']),
+                nombres.mesas.get(f['table_id']), f['created_at'], f['closed_at'], f['total'],
+                f['item_id'], f['product_id'], nombres.producto(f['product_id']) if f['item_id'] else None,
+                f['qty'], f['unit_price'], f['subtotal'], f['notes'],
+            ))
+        yield buffer.getvalue()
+
+def jsonl_trozos(filas, nombres):
+    """Una línea JSON por orden con sus items; las filas de una orden llegan juntas"""
+    def lineas():
+        for _, grupo in groupby(filas, key=lambda par: (par[0], par[1]['order_id'])):
+            grupo = [f for _, f in grupo]
+            o = grupo[0]
+            orden = {
+                'order_id': o['order_id'], 'cocina': o['codigo_cocina'],
+                'mesero_id': o['mesero_id'], 'mesero': nombres.meseros.get(o['mesero_id']),
+                'mesa': nombres.mesas.get(o['table_id']),
+                'creada': o['created_at'], 'cerrada': o['closed_at'], 'total': o['total'],
+                'items': [{
+                    'item_id': f['item_id'], 'product_id': f['product_id'],
+                    'producto': nombres.producto(f['product_id']), 'qty': f['qty'],
+                    'unit_price': f['unit_price'], 'subtotal': f['subtotal'], 'notas': f['notes'],
+                } for f in grupo if f['item_id']],
+            }
+            yield json.dumps(orden, ensure_ascii=False) + '\n'
+    return _trozos(lineas())
+
+FORMATOS = {
+    'csv': ('text/csv', csv_trozos),
+    'jsonl': ('application/x-ndjson', jsonl_trozos),
+}
+
+def gzip_trozos(trozos, nivel=6):
+    """Comprime al vuelo: cada trozo sale en cuanto zlib tiene bloque completo"""
+    compresor = zlib.compressobj(nivel, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for trozo in trozos:
+        datos = compresor.compress(trozo.encode())
+        if datos:
+            yield datos
+    yield compresor.flush()
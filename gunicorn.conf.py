@@ -0,0 +1,7 @@
+# Configuración leída automáticamente por gunicorn (las opciones de
+# startCommand en render.yaml tienen prioridad)
+
+def worker_exit(server, worker):
+    """Vacía la cola de auditoría antes de que el worker termine"""
+    from utils import audit_writer
+    audit_writer.close()
@@ -1,15 +1,12 @@
-import sqlite3
 from werkzeug.security import generate_password_hash
 from datetime import datetime
 import os
+from database import DB_NAME
 
-DB_PATH = 'taqueria.db'
-
-def init_database():
-    """Inicializa la base de datos con estructura mejorada"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+DB_PATH = DB_NAME
 
+def crear_esquema(cursor):
+    """Esquema base (migración 1)"""
     # Tabla usuarios
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS users (
@@ -107,6 +104,23 @@ def init_database():
         )
     ''')
 
+    # Contador de versión del catálogo (lo usa la caché de productos)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS catalog_version (
+            id INTEGER PRIMARY KEY CHECK(id = 1),
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    cursor.execute('INSERT OR IGNORE INTO catalog_version (id, version) VALUES (1, 0)')
+    for evento in ('INSERT', 'UPDATE', 'DELETE'):
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_products_{evento.lower()}_version
+            AFTER {evento} ON products
+            BEGIN
+                UPDATE catalog_version SET version = version + 1 WHERE id = 1;
+            END
+        ''')
+
     # ===== ÍNDICES PARA PERFORMANCE =====
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_orders_status ON orders(status)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_orders_mesero ON orders(mesero_id)')
@@ -118,6 +132,8 @@ def init_database():
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_cocinas_codigo ON cocinas(codigo)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_role ON users(role)')
 
+def sembrar_datos(cursor):
+    """Datos iniciales: admin, mesas y catálogo (migración 1)"""
     # Usuario admin por defecto
     admin_exists = cursor.execute('SELECT id FROM users WHERE username = ?', ('admin',)).fetchone()
     if not admin_exists:
@@ -158,18 +174,20 @@ def init_database():
         ("Churros (3 pzas)", "postres", 30.00, 30, "Churros con azúcar"),
     ]
     
-    for nombre, categoria, precio, stock, descripcion in productos:
-        cursor.execute('''
-            INSERT OR IGNORE INTO products (name, category, price, stock, description) 
+    # Solo si el catálogo está vacío (products no tiene UNIQUE en name)
+    if not cursor.execute('SELECT 1 FROM products LIMIT 1').fetchone():
+        cursor.executemany('''
+            INSERT INTO products (name, category, price, stock, description) 
             VALUES (?, ?, ?, ?, ?)
-        ''', (nombre, categoria, precio, stock, descripcion))
+        ''', productos)
 
-    conn.commit()
-    conn.close()
+def init_database():
+    """Crea o actualiza la base de datos aplicando las migraciones pendientes"""
+    from migrations import migrate
+    aplicadas = migrate(DB_PATH)
+    for version, descripcion in aplicadas:
+        print(f'✅ Migración {version}: {descripcion}')
     print('✅ Base de datos inicializada correctamente')
-    print('✅ 15 mesas creadas')
-    print('✅ 19 productos agregados')
-    print('✅ Índices de rendimiento creados')
 
 if __name__ == '__main__':
     if os.getenv('FLASK_ENV') != 'production' and os.path.exists(DB_PATH):
@@ -0,0 +1,179 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from database import connect, get_db, write_transaction
+
+# Con esto o menos unidades el producto aparece como "quedan pocos"
+POCO_STOCK = 5
+
+class SinStock(Exception):
+    """No alcanza el stock para alguno de los productos pedidos"""
+
+    def __init__(self, product_ids):
+        super().__init__(f'Sin stock suficiente: {product_ids}')
+        self.product_ids = product_ids
+
+class Inventory:
+    """Stock de productos: descuento condicional en la BD y vista en memoria.
+
+    Enviar una orden descuenta su stock con un UPDATE condicional por
+    producto dentro de la misma transacción del envío; si alguno no alcanza
+    se deshace todo y el envío se rechaza (SinStock -> 409). Así la BD es la
+    fuente de verdad aunque haya varios workers. Con shards, products vive
+    en la BD global: el descuento va en su propia transacción y se devuelve
+    si el envío falla después.
+
+    La copia en memoria pinta agotados y "quedan pocos" sin consultas y dice
+    qué productos tienen límite: las líneas sin límite no escriben nada. Se
+    relee cuando PRAGMA data_version indica escrituras, como mucho cada
+    `refresco` segundos. stock NULL significa sin límite.
+    """
+
+    def __init__(self, refresco=0.5, poco_stock=POCO_STOCK):
+        self.refresco = refresco
+        self.poco_stock = poco_stock
+        self.version = 0
+        self.stats = {'descuentos': 0, 'rechazos': 0, 'devoluciones': 0, 'recargas': 0}
+        self._lock = threading.Lock()
+        self._pid = None
+        self._conn = None
+        self._data_version = None
+        self._revisado = 0
+        self._stock = {}        # product_id -> stock en la BD (solo productos con límite)
+        self._estado = None
+        self._ultimo = None
+
+    def _vigente(self):
+        """Relee el stock si otro proceso o conexión escribió desde la última vez"""
+        ahora = time.monotonic()
+        if self._pid == os.getpid() and ahora - self._revisado < self.refresco:
+            return
+        with self._lock:
+            # Tras un fork (gunicorn) la conexión del padre no sirve
+            if self._pid != os.getpid():
+                self._conn = connect()
+                self._pid = os.getpid()
+                self._data_version = None
+            self._revisado = ahora
+            data_version = self._conn.execute('PRAGMA data_version').fetchone()[0]
+            if data_version == self._data_version:
+                return
+            rows = self._conn.execute('SELECT id, stock FROM products WHERE stock IS NOT NULL').fetchall()
+            self._data_version = data_version
+            self._stock = {row['id']: row['stock'] for row in rows}
+            self._estado = None
+            self.stats['recargas'] += 1
+
+    def invalidar(self):
+        """Fuerza la relectura en la siguiente consulta (tras escribir stock en este proceso)"""
+        self._revisado = 0
+
+    def _actualizar(self, db, lineas, signo):
+        """Suma signo * qty al stock de cada producto con límite; todo o nada.
+
+        El descuento es condicional (`stock >= qty`) en una sola sentencia:
+        si algún producto no alcanza se deshace lo ya descontado (savepoint)
+        y se lanza SinStock.
+        """
+        pedido = {}
+        for product_id, qty in lineas:
+            pedido[product_id] = pedido.get(product_id, 0) + qty
+        db.execute('SAVEPOINT stock')
+        faltan = []
+        for product_id, qty in sorted(pedido.items()):
+            if signo > 0:
+                db.execute('UPDATE products SET stock = stock + ? WHERE id = ? AND stock IS NOT NULL',
+                           (qty, product_id))
+                continue
+            cursor = db.execute('UPDATE products SET stock = stock - ? WHERE id = ? AND stock >= ?',
+                                (qty, product_id, qty))
+            if cursor.rowcount == 0:
+                # Sin fila: no alcanza, salvo que el límite se haya quitado desde la última lectura
+                row = db.execute('SELECT stock FROM products WHERE id = ?', (product_id,)).fetchone()
+                if row and row['stock'] is not None:
+                    faltan.append(product_id)
+        if faltan:
+            db.execute('ROLLBACK TO stock')
+            db.execute('RELEASE stock')
+            self.stats['rechazos'] += 1
+            raise SinStock(faltan)
+        db.execute('RELEASE stock')
+        self.stats['descuentos' if signo < 0 else 'devoluciones'] += 1
+        self.invalidar()
+
+    @contextmanager
+    def reserva(self, db):
+        """Movimientos de stock ligados a la transacción de `db`.
+
+        Abrirlo por fuera de write_transaction(db): si el bloque o el commit
+        fallan, lo que se escribió aparte en la BD global se devuelve.
+        """
+        reserva = _Reserva(self, db)
+        try:
+            yield reserva
+        except BaseException:
+            reserva.deshacer()
+            raise
+
+    def estado(self):
+        """Agotados y con poco stock, desde memoria"""
+        self._vigente()
+        estado = self._estado
+        if estado is None:
+            with self._lock:
+                disponibles = sorted(self._stock.items())
+                agotados = [product_id for product_id, n in disponibles if n <= 0]
+                pocos = {product_id: n for product_id, n in disponibles if 0 < n <= self.poco_stock}
+                if (agotados, pocos) != self._ultimo:
+                    self._ultimo = (agotados, pocos)
+                    self.version += 1
+                estado = self._estado = {'version': self.version, 'agotados': agotados, 'pocos': pocos}
+        return estado
+
+    def disponibles(self):
+        """Stock por producto con límite, según la última lectura de la BD"""
+        self._vigente()
+        with self._lock:
+            return dict(self._stock)
+
+class _Reserva:
+    def __init__(self, inventory, db):
+        self._inventory = inventory
+        self._db = db
+        self._aparte = []   # (lineas, signo) ya confirmados en la BD global
+
+    def _aplicar(self, lineas, signo):
+        # Solo los productos con límite tocan la BD; sin ellos no se pide
+        # el candado de escritura (de la global, con shards)
+        limitados = self._inventory.disponibles()
+        lineas = [(product_id, qty) for product_id, qty in lineas if product_id in limitados]
+        if not lineas:
+            return
+        global_db = get_db()
+        if self._db is global_db:
+            # products vive en la misma BD: entra en la transacción del envío
+            self._inventory._actualizar(self._db, lineas, signo)
+            return
+        with write_transaction(global_db) as db:
+            self._inventory._actualizar(db, lineas, signo)
+        self._aparte.append((lineas, signo))
+
+    def apartar(self, lineas):
+        """Descuenta (product_id, qty); lanza SinStock sin descontar nada si no alcanza"""
+        self._aplicar(lineas, -1)
+
+    def reponer(self, lineas):
+        """Devuelve al stock (orden cancelada)"""
+        self._aplicar(lineas, 1)
+
+    def deshacer(self):
+        for lineas, signo in reversed(self._aparte):
+            with write_transaction(get_db()) as db:
+                for product_id, qty in lineas:
+                    db.execute('UPDATE products SET stock = stock - ? WHERE id = ? AND stock IS NOT NULL',
+                               (signo * qty, product_id))
+        self._aparte = []
+        self._inventory.invalidar()
+
+inventory = Inventory()
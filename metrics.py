@@ -0,0 +1,110 @@
+import threading
+import time
+from collections import defaultdict
+from flask import request
+import database
+
+# Buckets en segundos para latencias y en número de consultas por request
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50)
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, limite in enumerate(self.buckets):
+            if value <= limite:
+                self.counts[i] += 1
+                break
+
+    def lines(self, name, labels):
+        acumulado = 0
+        for limite, n in zip(self.buckets, self.counts):
+            acumulado += n
+            yield f'{name}_bucket{{{labels},le="{limite}"}} {acumulado}'
+        yield f'{name}_bucket{{{labels},le="+Inf"}} {self.count}'
+        yield f'{name}_sum{{{labels}}} {self.sum:.6f}'
+        yield f'{name}_count{{{labels}}} {self.count}'
+
+class Metrics:
+    """Tiempos por endpoint y consultas SQL por request, en memoria.
+
+    Las consultas se cuentan con database.query_observers y se atribuyen al
+    request del thread actual (un request por thread en gthread).
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.requests = defaultdict(int)
+        self.latency = defaultdict(lambda: Histogram(LATENCY_BUCKETS))
+        self.sql_queries = defaultdict(lambda: Histogram(QUERY_BUCKETS))
+        self.sql_seconds = defaultdict(float)
+
+    def init_app(self, app):
+        database.query_observers.append(self.observe_query)
+        app.before_request(self._start)
+        app.after_request(self._finish)
+
+    def observe_query(self, sql, params, elapsed, conn):
+        actual = getattr(self._local, 'actual', None)
+        if actual is not None:
+            actual[0] += 1
+            actual[1] += elapsed
+
+    def _start(self):
+        self._local.actual = [0, 0.0, time.perf_counter()]
+
+    def _finish(self, response):
+        actual = getattr(self._local, 'actual', None)
+        if actual is None:
+            return response
+        self._local.actual = None
+        queries, sql_time, inicio = actual
+        endpoint = request.endpoint or 'desconocido'
+        with self._lock:
+            self.requests[(endpoint, request.method, response.status_code)] += 1
+            self.latency[endpoint].observe(time.perf_counter() - inicio)
+            self.sql_queries[endpoint].observe(queries)
+            self.sql_seconds[endpoint] += sql_time
+        return response
+
+    def render(self, gauges=()):
+        """Formato de texto de Prometheus; gauges: (nombre, ayuda, [(labels, valor)])"""
+        lines = []
+        with self._lock:
+            lines.append('# HELP taqueria_requests_total Requests atendidos')
+            lines.append('# TYPE taqueria_requests_total counter')
+            for (endpoint, method, status), n in sorted(self.requests.items()):
+                lines.append(f'taqueria_requests_total{{endpoint="{endpoint}",method="{method}",status="{status}"}} {n}')
+
+            lines.append('# HELP taqueria_request_duration_seconds Latencia por endpoint')
+            lines.append('# TYPE taqueria_request_duration_seconds histogram')
+            for endpoint, hist in sorted(self.latency.items()):
+                lines.extend(hist.lines('taqueria_request_duration_seconds', f'endpoint="{endpoint}"'))
+
+            lines.append('# HELP taqueria_sql_queries_per_request Consultas SQL por request')
+            lines.append('# TYPE taqueria_sql_queries_per_request histogram')
+            for endpoint, hist in sorted(self.sql_queries.items()):
+                lines.extend(hist.lines('taqueria_sql_queries_per_request', f'endpoint="{endpoint}"'))
+
+            lines.append('# HELP taqueria_sql_seconds_total Tiempo en SQLite (execute y lectura de filas) por endpoint')
+            lines.append('# TYPE taqueria_sql_seconds_total counter')
+            for endpoint, segundos in sorted(self.sql_seconds.items()):
+                lines.append(f'taqueria_sql_seconds_total{{endpoint="{endpoint}"}} {segundos:.6f}')
+
+        for nombre, ayuda, valores in gauges:
+            lines.append(f'# HELP {nombre} {ayuda}')
+            lines.append(f'# TYPE {nombre} gauge')
+            for labels, valor in valores:
+                etiquetas = ','.join(f'{k}="{v}"' for k, v in labels.items())
+                lines.append(f'{nombre}{{{etiquetas}}} {valor}' if etiquetas else f'{nombre} {valor}')
+        return '\n'.join(lines) + '\n'
+
+metrics = Metrics()
@@ -0,0 +1,407 @@
+from database import DB_NAME, connect
+from init_db import crear_esquema, sembrar_datos
+
+# ============ MIGRACIONES ============
+# Cada paso recibe un cursor dentro de la transacción de migración.
+# Agregar pasos siempre al final; nunca renumerar ni editar uno aplicado.
+
+def _esquema_inicial(cursor):
+    crear_esquema(cursor)
+    sembrar_datos(cursor)
+
+def _table_orders(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS table_orders (
+            order_id INTEGER PRIMARY KEY,
+            table_id INTEGER NOT NULL,
+            created_at TIMESTAMP NOT NULL,
+            FOREIGN KEY (order_id) REFERENCES orders(id) ON DELETE CASCADE,
+            FOREIGN KEY (table_id) REFERENCES tables(id) ON DELETE CASCADE
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_table_orders_table ON table_orders(table_id)')
+
+def _indices_llaves_foraneas(cursor):
+    # Con foreign_keys=ON, borrar un producto o usuario busca sus referencias
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_order_items_product ON order_items(product_id)')
+
+def _indices_dashboards(cursor):
+    # cocina/caja: codigo_cocina + status, ordenado por created_at
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_orders_cocina_status_created
+        ON orders(codigo_cocina, status, created_at)
+    ''')
+    # mesero: solo órdenes activas, ya ordenadas por fecha
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_orders_mesero_activas
+        ON orders(mesero_id, created_at) WHERE status != 'cerrada'
+    ''')
+    # Reemplazados por el compuesto (status siempre se filtra junto con
+    # codigo_cocina); solo encarecían las escrituras
+    cursor.execute('DROP INDEX IF EXISTS idx_orders_cocina')
+    cursor.execute('DROP INDEX IF EXISTS idx_orders_status')
+
+def _indice_ordenes_activas(cursor):
+    # Gauges de órdenes abiertas: recorre solo las activas, nunca el histórico
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_orders_activas
+        ON orders(codigo_cocina, status) WHERE status IN ('borrador', 'pendiente', 'servida')
+    ''')
+
+def _order_events(cursor):
+    # Bitácora corta de eventos de órdenes para el relay SSE entre workers
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS order_events (
+            id INTEGER PRIMARY KEY,
+            codigo_cocina TEXT NOT NULL,
+            event TEXT NOT NULL,
+            order_id INTEGER NOT NULL,
+            pid INTEGER NOT NULL,
+            created_at TIMESTAMP NOT NULL
+        )
+    ''')
+
+def _versiones_cocina(cursor):
+    # Versión por cocina para ETags: la suben triggers en cada cambio de
+    # orders u order_items, venga de la ruta que venga
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS kitchen_versions (
+            codigo_cocina TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    ''')
+    subir = '''
+        INSERT INTO kitchen_versions (codigo_cocina, version) {origen}
+        ON CONFLICT(codigo_cocina) DO UPDATE SET version = version + 1;
+    '''
+    for evento, fila in (('INSERT', 'NEW'), ('UPDATE', 'NEW'), ('DELETE', 'OLD')):
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_orders_{evento.lower()}_kitchen_version
+            AFTER {evento} ON orders WHEN {fila}.codigo_cocina IS NOT NULL
+            BEGIN
+                {subir.format(origen=f'VALUES ({fila}.codigo_cocina, 1)')}
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_order_items_{evento.lower()}_kitchen_version
+            AFTER {evento} ON order_items
+            BEGIN
+                {subir.format(origen=f'SELECT codigo_cocina, 1 FROM orders WHERE id = {fila}.order_id AND codigo_cocina IS NOT NULL')}
+            END
+        ''')
+
+def _catalogo_sin_stock(cursor):
+    # El inventario descuenta stock en cada flush; eso no cambia el menú y
+    # no debe invalidar la caché del catálogo ni los ETags que la usan
+    cursor.execute('DROP TRIGGER IF EXISTS trg_products_update_version')
+    cursor.execute('''
+        CREATE TRIGGER trg_products_update_version
+        AFTER UPDATE OF name, category, price, is_active, description ON products
+        BEGIN
+            UPDATE catalog_version SET version = version + 1 WHERE id = 1;
+        END
+    ''')
+
+def _sync_ops(cursor):
+    # Llaves de idempotencia del sync offline del mesero: se escriben en la
+    # misma transacción que la operación, así un reintento nunca la repite
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sync_ops (
+            mesero_id INTEGER NOT NULL,
+            key TEXT NOT NULL,
+            order_id INTEGER,
+            resultado TEXT NOT NULL,
+            created_at TIMESTAMP NOT NULL,
+            PRIMARY KEY (mesero_id, key)
+        ) WITHOUT ROWID
+    ''')
+
+def _ventas_acumuladas(cursor):
+    # Acumulados de ventas para reportes; se llenan con lo ya cerrado. El SQL
+    # queda copiado aquí: rollups.py puede cambiar, este paso no
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sales_daily (
+            dia TEXT NOT NULL, codigo_cocina TEXT NOT NULL,
+            ordenes INTEGER NOT NULL DEFAULT 0, items INTEGER NOT NULL DEFAULT 0, total REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (dia, codigo_cocina)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sales_hourly (
+            dia TEXT NOT NULL, codigo_cocina TEXT NOT NULL, hora INTEGER NOT NULL,
+            ordenes INTEGER NOT NULL DEFAULT 0, total REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (dia, codigo_cocina, hora)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sales_products (
+            dia TEXT NOT NULL, codigo_cocina TEXT NOT NULL, product_id INTEGER NOT NULL,
+            qty INTEGER NOT NULL DEFAULT 0, total REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (dia, codigo_cocina, product_id)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sales_meseros (
+            dia TEXT NOT NULL, codigo_cocina TEXT NOT NULL, mesero_id INTEGER NOT NULL,
+            ordenes INTEGER NOT NULL DEFAULT 0, total REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (dia, codigo_cocina, mesero_id)
+        ) WITHOUT ROWID
+    ''')
+    # Día y hora del cierre (las órdenes viejas pueden no tenerlo). Sin GROUP
+    # BY: dos filas con la misma llave chocan y se suman en el ON CONFLICT
+    dia = "substr(COALESCE(o.closed_at, o.updated_at, o.created_at), 1, 10)"
+    hora = "CAST(substr(COALESCE(o.closed_at, o.updated_at, o.created_at), 12, 2) AS INTEGER)"
+    cocina = "COALESCE(o.codigo_cocina, '')"
+    cursor.execute(f'''
+        INSERT INTO sales_daily (dia, codigo_cocina, ordenes, items, total)
+        SELECT {dia}, {cocina}, 1, (SELECT COALESCE(SUM(qty), 0) FROM order_items WHERE order_id = o.id), o.total
+        FROM orders o WHERE o.status = 'cerrada'
+        ON CONFLICT (dia, codigo_cocina) DO UPDATE SET
+            ordenes = ordenes + excluded.ordenes, items = items + excluded.items, total = total + excluded.total
+    ''')
+    cursor.execute(f'''
+        INSERT INTO sales_hourly (dia, codigo_cocina, hora, ordenes, total)
+        SELECT {dia}, {cocina}, {hora}, 1, o.total
+        FROM orders o WHERE o.status = 'cerrada'
+        ON CONFLICT (dia, codigo_cocina, hora) DO UPDATE SET
+            ordenes = ordenes + excluded.ordenes, total = total + excluded.total
+    ''')
+    cursor.execute(f'''
+        INSERT INTO sales_products (dia, codigo_cocina, product_id, qty, total)
+        SELECT {dia}, {cocina}, oi.product_id, oi.qty, oi.qty * oi.unit_price
+        FROM orders o JOIN order_items oi ON oi.order_id = o.id WHERE o.status = 'cerrada'
+        ON CONFLICT (dia, codigo_cocina, product_id) DO UPDATE SET
+            qty = qty + excluded.qty, total = total + excluded.total
+    ''')
+    cursor.execute(f'''
+        INSERT INTO sales_meseros (dia, codigo_cocina, mesero_id, ordenes, total)
+        SELECT {dia}, {cocina}, o.mesero_id, 1, o.total
+        FROM orders o WHERE o.status = 'cerrada'
+        ON CONFLICT (dia, codigo_cocina, mesero_id) DO UPDATE SET
+            ordenes = ordenes + excluded.ordenes, total = total + excluded.total
+    ''')
+
+def _indice_cerradas(cursor):
+    # El archivado busca las cerradas más viejas sin recorrer las activas
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_orders_cerradas
+        ON orders(closed_at) WHERE status = 'cerrada'
+    ''')
+
+def _auditoria_buscable(cursor):
+    # Texto completo sobre usuario/acción/detalle (contenido externo: el
+    # texto vive solo en audit_log) y triggers que lo mantienen al día
+    cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS audit_fts USING fts5(
+            usuario, accion, detalle,
+            content='audit_log', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_audit_log_insert_fts AFTER INSERT ON audit_log
+        BEGIN
+            INSERT INTO audit_fts (rowid, usuario, accion, detalle)
+            VALUES (NEW.id, NEW.usuario, NEW.accion, NEW.detalle);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_audit_log_delete_fts AFTER DELETE ON audit_log
+        BEGIN
+            INSERT INTO audit_fts (audit_fts, rowid, usuario, accion, detalle)
+            VALUES ('delete', OLD.id, OLD.usuario, OLD.accion, OLD.detalle);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_audit_log_update_fts AFTER UPDATE OF usuario, accion, detalle ON audit_log
+        BEGIN
+            INSERT INTO audit_fts (audit_fts, rowid, usuario, accion, detalle)
+            VALUES ('delete', OLD.id, OLD.usuario, OLD.accion, OLD.detalle);
+            INSERT INTO audit_fts (rowid, usuario, accion, detalle)
+            VALUES (NEW.id, NEW.usuario, NEW.accion, NEW.detalle);
+        END
+    ''')
+    cursor.execute("INSERT INTO audit_fts (audit_fts) VALUES ('rebuild')")
+    # Paginación por (timestamp, id) filtrando por usuario o acción: el
+    # índice ya viene ordenado. El compuesto reemplaza al de solo usuario
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_audit_usuario_timestamp ON audit_log(usuario, timestamp)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_audit_accion_timestamp ON audit_log(accion, timestamp)')
+    cursor.execute('DROP INDEX IF EXISTS idx_audit_usuario')
+
+MIGRATIONS = [
+    (1, 'esquema inicial y datos base', _esquema_inicial),
+    (2, 'tabla table_orders (mesa de cada orden)', _table_orders),
+    (3, 'índices para llaves foráneas', _indices_llaves_foraneas),
+    (4, 'índices compuestos y parciales para dashboards', _indices_dashboards),
+    (5, 'índice parcial de órdenes activas', _indice_ordenes_activas),
+    (6, 'tabla order_events para eventos entre workers', _order_events),
+    (7, 'versión por cocina para ETags', _versiones_cocina),
+    (8, 'el stock ya no sube la versión del catálogo', _catalogo_sin_stock),
+    (9, 'llaves de idempotencia del sync offline', _sync_ops),
+    (10, 'acumulados de ventas por día, hora, producto y mesero', _ventas_acumuladas),
+    (11, 'índice parcial de órdenes cerradas para el archivado', _indice_cerradas),
+    (12, 'búsqueda de texto completo en la auditoría', _auditoria_buscable),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+# ============ MIGRACIONES DE SHARDS ============
+# Archivo por cocina (SHARD_DIR): solo las tablas de órdenes y auditoría.
+# Sin llaves foráneas hacia users/products/tables, que viven en la BD global.
+
+def _esquema_cocina(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS orders (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            mesero_id INTEGER NOT NULL,
+            codigo_cocina TEXT,
+            status TEXT CHECK(status IN ('borrador', 'pendiente', 'en_preparacion', 'servida', 'cerrada', 'cancelada')) DEFAULT 'borrador',
+            total REAL DEFAULT 0,
+            notas_generales TEXT,
+            created_at TIMESTAMP NOT NULL,
+            updated_at TIMESTAMP,
+            closed_at TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS order_items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            order_id INTEGER NOT NULL,
+            product_id INTEGER NOT NULL,
+            qty INTEGER NOT NULL CHECK(qty > 0),
+            unit_price REAL NOT NULL CHECK(unit_price >= 0),
+            subtotal REAL GENERATED ALWAYS AS (qty * unit_price) STORED,
+            notes TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (order_id) REFERENCES orders(id) ON DELETE CASCADE
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS table_orders (
+            order_id INTEGER PRIMARY KEY,
+            table_id INTEGER NOT NULL,
+            created_at TIMESTAMP NOT NULL,
+            FOREIGN KEY (order_id) REFERENCES orders(id) ON DELETE CASCADE
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS audit_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            usuario TEXT NOT NULL,
+            accion TEXT NOT NULL,
+            detalle TEXT,
+            ip_address TEXT,
+            timestamp TIMESTAMP NOT NULL,
+            entity_type TEXT,
+            entity_id INTEGER
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_orders_mesero ON orders(mesero_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_order_items_order ON order_items(order_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_table_orders_table ON table_orders(table_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_audit_usuario ON audit_log(usuario)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_audit_timestamp ON audit_log(timestamp)')
+    _indices_dashboards(cursor)
+    _indice_ordenes_activas(cursor)
+    _order_events(cursor)
+
+SHARD_MIGRATIONS = [
+    (1, 'esquema de órdenes por cocina', _esquema_cocina),
+    (2, 'versión por cocina para ETags', _versiones_cocina),
+    (3, 'llaves de idempotencia del sync offline', _sync_ops),
+    (4, 'acumulados de ventas por día, hora, producto y mesero', _ventas_acumuladas),
+    (5, 'índice parcial de órdenes cerradas para el archivado', _indice_cerradas),
+    (6, 'búsqueda de texto completo en la auditoría', _auditoria_buscable),
+]
+
+# ============ MIGRACIONES DEL ARCHIVO HISTÓRICO ============
+# Mismas columnas y en el mismo orden que en la BD viva (historial() las une
+# con SELECT *), sin AUTOINCREMENT ni llaves foráneas: los ids vienen de la viva.
+
+def _esquema_archivo(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS orders (
+            id INTEGER PRIMARY KEY,
+            mesero_id INTEGER NOT NULL,
+            codigo_cocina TEXT,
+            status TEXT,
+            total REAL DEFAULT 0,
+            notas_generales TEXT,
+            created_at TIMESTAMP NOT NULL,
+            updated_at TIMESTAMP,
+            closed_at TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS order_items (
+            id INTEGER PRIMARY KEY,
+            order_id INTEGER NOT NULL,
+            product_id INTEGER NOT NULL,
+            qty INTEGER NOT NULL,
+            unit_price REAL NOT NULL,
+            subtotal REAL GENERATED ALWAYS AS (qty * unit_price) STORED,
+            notes TEXT,
+            created_at TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS table_orders (
+            order_id INTEGER PRIMARY KEY,
+            table_id INTEGER NOT NULL,
+            created_at TIMESTAMP NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS audit_log (
+            id INTEGER PRIMARY KEY,
+            usuario TEXT NOT NULL,
+            accion TEXT NOT NULL,
+            detalle TEXT,
+            ip_address TEXT,
+            timestamp TIMESTAMP NOT NULL,
+            entity_type TEXT,
+            entity_id INTEGER
+        )
+    ''')
+    # Historial por fecha de cierre, cocina y mesero; items por orden
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_orders_closed ON orders(closed_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_orders_cocina_closed ON orders(codigo_cocina, closed_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_orders_mesero ON orders(mesero_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_order_items_order ON order_items(order_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_audit_usuario ON audit_log(usuario)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_audit_timestamp ON audit_log(timestamp)')
+
+ARCHIVE_MIGRATIONS = [
+    (1, 'esquema del archivo histórico', _esquema_archivo),
+    (2, 'búsqueda de texto completo en la auditoría', _auditoria_buscable),
+]
+
+def migrate(path=None, pasos=MIGRATIONS):
+    """Aplica las migraciones pendientes en una sola transacción.
+
+    BEGIN IMMEDIATE toma el candado de escritura antes de leer
+    user_version, así que si varios workers arrancan a la vez solo uno
+    migra y los demás esperan y no encuentran nada pendiente.
+    """
+    conn = connect(path or DB_NAME)
+    conn.isolation_level = None
+    conn.execute('PRAGMA busy_timeout = 30000')
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        actual = conn.execute('PRAGMA user_version').fetchone()[0]
+        aplicadas = []
+        cursor = conn.cursor()
+        for version, descripcion, paso in pasos:
+            if version > actual:
+                paso(cursor)
+                aplicadas.append((version, descripcion))
+        if aplicadas:
+            conn.execute(f'PRAGMA user_version = {pasos[-1][0]}')
+        conn.execute('COMMIT')
+        return aplicadas
+    except Exception:
+        if conn.in_transaction:
+            conn.execute('ROLLBACK')
+        raise
+    finally:
+        conn.close()
@@ -0,0 +1,135 @@
+import threading
+from datetime import datetime
+from catalog import catalog
+from database import get_order_db
+from versions import versions
+
+# Eventos que sacan una orden del tablero (dejó de estar pendiente)
+SALIDAS = ('order_served', 'order_closed', 'order_cancelled')
+
+# Sin GROUP BY: los items de la misma orden y producto se suman en _sumar
+# (agrupar en SQL obligaría a un B-tree temporal). La espera cuenta desde el
+# envío a cocina: mientras está pendiente, updated_at es el de esa transición
+# (created_at es cuando el mesero abrió el borrador). Nombres y categorías
+# salen del catálogo al armar el snapshot, así un cambio del admin se ve ya
+ITEMS_PENDIENTES_SQL = '''
+    SELECT o.id as order_id, COALESCE(o.updated_at, o.created_at) as enviada_at, oi.product_id, oi.qty
+    FROM orders o
+    JOIN order_items oi ON oi.order_id = o.id
+    WHERE {filtro} AND o.status = 'pendiente'
+'''
+
+class _Tablero:
+    def __init__(self):
+        self.lock = threading.Lock()    # por cocina: un tablero no espera la BD de otro
+        self.version = None
+        self.catalogo = None            # versión del catálogo con la que se armó el snapshot
+        self.ultimo_evento = 0
+        self.ordenes = {}       # order_id -> {'desde': enviada_at, 'items': {product_id: qty}}
+        self.snapshot = None
+
+class ProductionBoard:
+    """Tablero "a cocinar ahora": cantidades por producto de las órdenes pendientes.
+
+    Se arma con una consulta agrupada y luego se mantiene aplicando los
+    eventos nuevos de order_events (de cualquier worker). Mientras no
+    cambien la versión de la cocina ni la del catálogo se devuelve el mismo
+    snapshot (no modificarlo: se comparte entre requests).
+    """
+
+    def __init__(self):
+        self._tableros = {}
+        self._lock = threading.Lock()
+        self.rebuilds = 0
+
+    def get(self, codigo):
+        version = versions.get(codigo)
+        productos = catalog.get()
+        tablero = self._tableros.get(codigo)
+        if tablero is not None and (tablero.version, tablero.catalogo) == (version, productos.version):
+            return tablero.snapshot
+
+        if tablero is None:
+            with self._lock:
+                tablero = self._tableros.setdefault(codigo, _Tablero())
+        with tablero.lock:
+            if (tablero.version, tablero.catalogo) == (version, productos.version):
+                return tablero.snapshot
+            if tablero.version != version:
+                db = get_order_db(codigo)
+                # Una sola transacción de lectura: eventos e items consistentes
+                db.execute('BEGIN')
+                try:
+                    if tablero.version is None or not self._aplicar_eventos(db, codigo, tablero):
+                        self._reconstruir(db, codigo, tablero)
+                finally:
+                    db.commit()
+                tablero.version = version
+            tablero.snapshot = self._snapshot(codigo, tablero, productos)
+            tablero.catalogo = productos.version
+            return tablero.snapshot
+
+    def _reconstruir(self, db, codigo, tablero):
+        tablero.ultimo_evento = db.execute('SELECT COALESCE(MAX(id), 0) FROM order_events').fetchone()[0]
+        rows = db.execute(ITEMS_PENDIENTES_SQL.format(filtro='o.codigo_cocina = ?'), (codigo,)).fetchall()
+        tablero.ordenes = {}
+        for row in rows:
+            self._sumar(tablero, row)
+        self.rebuilds += 1
+
+    def _aplicar_eventos(self, db, codigo, tablero):
+        """Aplica los eventos nuevos; False si se podaron y hay que reconstruir"""
+        primero = db.execute('SELECT MIN(id) FROM order_events').fetchone()[0]
+        if primero is not None and primero > tablero.ultimo_evento + 1:
+            return False
+        eventos = db.execute(
+            'SELECT id, event, order_id FROM order_events WHERE id > ? AND codigo_cocina = ? ORDER BY id',
+            (tablero.ultimo_evento, codigo)
+        ).fetchall()
+        for evento in eventos:
+            if evento['event'] in SALIDAS:
+                tablero.ordenes.pop(evento['order_id'], None)
+            elif evento['event'] == 'order_created':
+                tablero.ordenes.pop(evento['order_id'], None)
+                # Solo si sigue pendiente; si ya se sirvió, su evento de salida viene después
+                rows = db.execute(ITEMS_PENDIENTES_SQL.format(filtro='o.id = ?'), (evento['order_id'],)).fetchall()
+                for row in rows:
+                    self._sumar(tablero, row)
+        if eventos:
+            tablero.ultimo_evento = eventos[-1]['id']
+        return True
+
+    def _sumar(self, tablero, row):
+        orden = tablero.ordenes.setdefault(row['order_id'], {'desde': row['enviada_at'], 'items': {}})
+        orden['items'][row['product_id']] = orden['items'].get(row['product_id'], 0) + row['qty']
+
+    def _snapshot(self, codigo, tablero, productos):
+        por_producto = {}
+        for orden in tablero.ordenes.values():
+            for product_id, qty in orden['items'].items():
+                actual = por_producto.get(product_id)
+                if actual is None:
+                    producto = productos.get(product_id)
+                    actual = por_producto[product_id] = {
+                        'product_id': product_id,
+                        'producto': producto['name'] if producto else f'Producto #{product_id}',
+                        'category': producto and producto['category'],
+                        'qty': 0, 'ordenes': 0, 'desde': orden['desde'],
+                    }
+                actual['qty'] += qty
+                actual['ordenes'] += 1
+                actual['desde'] = min(actual['desde'], orden['desde'])
+        # Lo que más lleva esperando primero
+        productos = sorted(por_producto.values(), key=lambda p: (p['desde'], -p['qty']))
+        for producto in productos:
+            # enviada_at es hora local del servidor; en epoch el navegador calcula la espera
+            # sin depender de su zona horaria y el snapshot no cambia con el reloj
+            producto['desde_ts'] = int(datetime.fromisoformat(producto['desde']).timestamp())
+        return {
+            'codigo': codigo,
+            'version': tablero.version,
+            'ordenes': len(tablero.ordenes),
+            'productos': productos,
+        }
+
+board = ProductionBoard()
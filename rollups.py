@@ -0,0 +1,135 @@
+"""Acumulados de ventas para los reportes del admin.
+
+Cada orden cerrada suma a tablas por día (y cocina), hora, producto y
+mesero en la misma transacción que la cierra. Los reportes leen solo esas
+tablas: su costo depende de los días consultados, nunca del histórico de
+órdenes. `python rollups.py` los recalcula desde las órdenes, vivas y
+archivadas (backfill).
+"""
+from datetime import date, timedelta
+from archive import con_archivo, historial
+from database import DB_NAME, connect, connect_orders, order_db_path, query_orders_all, shard_codes, write_transaction
+
+# Fecha de la venta: el cierre (pago); las órdenes viejas pueden no tenerlo
+FECHA = 'COALESCE(o.closed_at, o.updated_at, o.created_at)'
+DIA = f'substr({FECHA}, 1, 10)'
+HORA = f'CAST(substr({FECHA}, 12, 2) AS INTEGER)'
+COCINA = "COALESCE(o.codigo_cocina, '')"
+
+# tabla: (columnas de la llave, métricas)
+TABLAS = {
+    'sales_daily': (('dia', 'codigo_cocina'), ('ordenes', 'items', 'total')),
+    'sales_hourly': (('dia', 'codigo_cocina', 'hora'), ('ordenes', 'total')),
+    'sales_products': (('dia', 'codigo_cocina', 'product_id'), ('qty', 'total')),
+    'sales_meseros': (('dia', 'codigo_cocina', 'mesero_id'), ('ordenes', 'total')),
+}
+
+# Valores de cada tabla a partir de orders o (y order_items oi para productos)
+_VALORES = {
+    'sales_daily': (f'{DIA}, {COCINA}, 1, '
+                    '(SELECT COALESCE(SUM(qty), 0) FROM {items} WHERE order_id = o.id), o.total'),
+    'sales_hourly': f'{DIA}, {COCINA}, {HORA}, 1, o.total',
+    'sales_products': f'{DIA}, {COCINA}, oi.product_id, oi.qty, oi.qty * oi.unit_price',
+    'sales_meseros': f'{DIA}, {COCINA}, o.mesero_id, 1, o.total',
+}
+
+def crear_tablas(cursor):
+    """Tablas de acumulados (migración); la llave empieza por día"""
+    for tabla, (llave, metricas) in TABLAS.items():
+        columnas = [f'{c} TEXT NOT NULL' if c in ('dia', 'codigo_cocina') else f'{c} INTEGER NOT NULL'
+                    for c in llave]
+        columnas += [f'{m} REAL NOT NULL DEFAULT 0' if m == 'total' else f'{m} INTEGER NOT NULL DEFAULT 0'
+                     for m in metricas]
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {tabla} (
+                {', '.join(columnas)},
+                PRIMARY KEY ({', '.join(llave)})
+            ) WITHOUT ROWID
+        ''')
+
+def _upsert(tabla, filtro, archivo=None):
+    """INSERT de los acumulados de las órdenes que cumplen `filtro`; con `archivo` lee también las archivadas"""
+    llave, metricas = TABLAS[tabla]
+    orders, items = historial('orders', archivo), historial('order_items', archivo)
+    if tabla == 'sales_products':
+        origen = f'FROM {orders} o JOIN {items} oi ON oi.order_id = o.id WHERE {filtro}'
+    else:
+        origen = f'FROM {orders} o WHERE {filtro}'
+    # Sin GROUP BY: dos filas con la misma llave chocan y se suman en el ON CONFLICT
+    return f'''
+        INSERT INTO {tabla} ({', '.join(llave + metricas)})
+        SELECT {_VALORES[tabla].replace('{items}', items)} {origen}
+        ON CONFLICT ({', '.join(llave)}) DO UPDATE SET
+            {', '.join(f'{m} = {m} + excluded.{m}' for m in metricas)}
+    '''
+
+_POR_ORDEN = {tabla: _upsert(tabla, 'o.id = ?') for tabla in TABLAS}
+
+def registrar_cierre(db, order_id):
+    """Suma la orden cerrada a los acumulados; llamar dentro de la transacción del cierre"""
+    for sql in _POR_ORDEN.values():
+        db.execute(sql, (order_id,))
+
+def llenar(cursor, archivo=None):
+    """Borra y vuelve a sumar todas las órdenes cerradas (dentro de una transacción)"""
+    for tabla in TABLAS:
+        cursor.execute(f'DELETE FROM main.{tabla}')
+        cursor.execute(_upsert(tabla, "o.status = 'cerrada'", archivo))
+
+def reconstruir(db, path=DB_NAME):
+    """Recalcula los acumulados de la BD de órdenes `path` y su archivo; bloquea sus escrituras mientras tanto"""
+    with con_archivo(db, path) as archivo, write_transaction(db):
+        llenar(db, archivo)
+        return db.execute('SELECT COALESCE(SUM(ordenes), 0) FROM main.sales_daily').fetchone()[0]
+
+# ============ REPORTES ============
+# dimensión: (tabla, columna por la que se suma)
+DIMENSIONES = {
+    'dia': ('sales_daily', 'dia'),
+    'hora': ('sales_hourly', 'hora'),
+    'producto': ('sales_products', 'product_id'),
+    'mesero': ('sales_meseros', 'mesero_id'),
+    'cocina': ('sales_daily', 'codigo_cocina'),
+}
+
+def rango(desde=None, hasta=None, dias=30):
+    """(desde, hasta) como YYYY-MM-DD; por omisión los últimos `dias` días. ValueError si no son fechas"""
+    hasta = date.fromisoformat(hasta) if hasta else date.today()
+    desde = date.fromisoformat(desde) if desde else hasta - timedelta(days=dias - 1)
+    if desde > hasta:
+        raise ValueError('desde es posterior a hasta')
+    return desde.isoformat(), hasta.isoformat()
+
+def reporte(dimension, desde, hasta, codigo=None):
+    """Filas sumadas por la dimensión pedida, de la BD global y de cada shard"""
+    tabla, columna = DIMENSIONES[dimension]
+    _, metricas = TABLAS[tabla]
+    sql = f'SELECT {columna} as clave, codigo_cocina, {", ".join(metricas)} FROM {{s}}.{tabla} WHERE dia BETWEEN ? AND ?'
+    # Cada cocina vive en un solo archivo: se suma en Python, sin GROUP BY
+    acumulado = {}
+    for row in query_orders_all(sql, (desde, hasta)):
+        if codigo and row['codigo_cocina'] != codigo:
+            continue
+        fila = acumulado.setdefault(row['clave'], dict.fromkeys(metricas, 0))
+        for m in metricas:
+            fila[m] += row[m]
+    filas = [{dimension: clave, **valores} for clave, valores in acumulado.items()]
+    if dimension in ('dia', 'hora'):
+        filas.sort(key=lambda f: f[dimension])
+    else:
+        filas.sort(key=lambda f: -f['total'])
+    for fila in filas:
+        fila['total'] = round(fila['total'], 2)
+    return filas
+
+def main():
+    bds = [(DB_NAME, None)] + [(order_db_path(codigo), codigo) for codigo in shard_codes()]
+    for path, codigo in bds:
+        db = connect_orders(codigo) if codigo else connect()
+        try:
+            print(f'✅ {path}: {reconstruir(db, path)} órdenes cerradas')
+        finally:
+            db.close()
+
+if __name__ == '__main__':
+    main()
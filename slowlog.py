@@ -0,0 +1,123 @@
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+from flask import has_request_context, request
+import database
+
+# Sentencias más lentas que esto (ms) se registran; sin la variable el
+# profiler no se instala y execute() no paga nada extra
+SLOW_QUERY_MS = os.getenv('SLOW_QUERY_MS')
+SLOW_QUERY_LOG = os.getenv('SLOW_QUERY_LOG')
+SLOW_QUERY_LOG_BYTES = int(os.getenv('SLOW_QUERY_LOG_BYTES', 5 * 1024 * 1024))
+
+EXPLICABLES = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE', 'WITH')
+
+def normalizar(sql):
+    """Quita literales y espacios para agrupar sentencias iguales"""
+    sql = re.sub(r"'(?:[^']|'')*'", '?', sql)
+    sql = re.sub(r'\b\d+(?:\.\d+)?\b', '?', sql)
+    return ' '.join(sql.split())
+
+def forma_parametros(params):
+    """Tipos de los parámetros, sin los valores (pueden ser datos de clientes)"""
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {k: type(v).__name__ for k, v in params.items()}
+    return [type(v).__name__ for v in params]
+
+class SlowQueryLog:
+    """Agrupa las sentencias lentas por SQL normalizado con su plan.
+
+    El plan se captura con EXPLAIN QUERY PLAN en la misma conexión que la
+    ejecutó (su BD, shard o archivo adjunto), la primera vez que aparece
+    cada sentencia.
+    """
+
+    def __init__(self, threshold_ms=100, path=None, max_bytes=SLOW_QUERY_LOG_BYTES, backups=3, max_groups=500):
+        self.threshold = threshold_ms / 1000
+        self.max_groups = max_groups
+        self.groups = {}
+        self._lock = threading.Lock()
+        self._logger = None
+        if path:
+            self._logger = logging.getLogger('taqueria.slow_queries')
+            self._logger.propagate = False
+            self._logger.setLevel(logging.INFO)
+            handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups)
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            self._logger.addHandler(handler)
+
+    def init_app(self, app):
+        database.query_observers.append(self.observe_query)
+
+    def _explain(self, conn, sql, params):
+        # executemany (params None): no hay un juego de parámetros que explicar
+        if params is None or not sql.lstrip().upper().startswith(EXPLICABLES):
+            return None
+        try:
+            # Sin pasar por TimedConnection.execute: el EXPLAIN no se observa
+            filas = sqlite3.Connection.execute(conn, f'EXPLAIN QUERY PLAN {sql}', params)
+            return [row[3] for row in filas]
+        except sqlite3.Error as e:
+            return [f'sin plan: {e}']
+
+    def observe_query(self, sql, params, elapsed, conn):
+        if elapsed < self.threshold:
+            return
+        clave = normalizar(sql)
+        endpoint = request.endpoint if has_request_context() else None
+        ms = round(elapsed * 1000, 3)
+
+        with self._lock:
+            grupo = self.groups.get(clave)
+            nuevo = grupo is None
+            if nuevo:
+                if len(self.groups) >= self.max_groups:
+                    return
+                grupo = self.groups[clave] = {
+                    'sql': clave,
+                    'count': 0,
+                    'total_ms': 0.0,
+                    'max_ms': 0.0,
+                    'params': forma_parametros(params),
+                    'endpoints': {},
+                    'plan': None,
+                }
+            grupo['count'] += 1
+            grupo['total_ms'] = round(grupo['total_ms'] + ms, 3)
+            grupo['max_ms'] = max(grupo['max_ms'], ms)
+            grupo['last_seen'] = datetime.now().isoformat()
+            if endpoint:
+                grupo['endpoints'][endpoint] = grupo['endpoints'].get(endpoint, 0) + 1
+
+        if nuevo:
+            grupo['plan'] = self._explain(conn, sql, params)
+
+        if self._logger:
+            self._logger.info(json.dumps({
+                'ts': grupo['last_seen'],
+                'ms': ms,
+                'endpoint': endpoint,
+                'sql': clave,
+                'params': forma_parametros(params),
+                'plan': grupo['plan'],
+            }, ensure_ascii=False))
+
+    def report(self, limit=50):
+        """Grupos ordenados por tiempo total, los más costosos primero"""
+        with self._lock:
+            grupos = [dict(g, endpoints=dict(g['endpoints'])) for g in self.groups.values()]
+        grupos.sort(key=lambda g: g['total_ms'], reverse=True)
+        return grupos[:limit]
+
+    def reset(self):
+        with self._lock:
+            self.groups.clear()
+
+slowlog = SlowQueryLog(float(SLOW_QUERY_MS), SLOW_QUERY_LOG) if SLOW_QUERY_MS else None
@@ -29,13 +29,76 @@ function showToast(message, type = 'info', duration = 3000) {
     }, duration);
 }
 
-// Cargar todos los items de órdenes
+// GET condicional: reenvía el último ETag de cada URL; con 304 devuelve null
+// y quien llama no vuelve a pintar
+const etagsPorUrl = {};
+function fetchCondicional(url) {
+    const headers = etagsPorUrl[url] ? { 'If-None-Match': etagsPorUrl[url] } : {};
+    return fetch(url, { headers, cache: 'no-store' }).then(r => {
+        if (r.status === 304) return null;
+        const etag = r.headers.get('ETag');
+        if (etag) etagsPorUrl[url] = etag;
+        return r.json();
+    });
+}
+
+// Canal SSE de la cocina. Si el worker ya no tiene lugar para otro stream
+// (503) el navegador no reintenta: se sondea `sondear` (GET con ETag) cada
+// `intervalo` ms y se vuelve a intentar el canal cada minuto
+function canalCocina(manejadores, sondear, intervalo = 5000) {
+    let sondeo = null;
+    function abrir() {
+        const stream = new EventSource('/cocina/stream');
+        Object.entries(manejadores).forEach(([evento, fn]) => stream.addEventListener(evento, fn));
+        stream.addEventListener('open', () => {
+            clearInterval(sondeo);
+            sondeo = null;
+        });
+        stream.addEventListener('error', () => {
+            if (stream.readyState !== EventSource.CLOSED) return;  // reconecta solo
+            if (!sondeo) sondeo = setInterval(sondear, intervalo);
+            sondear();
+            setTimeout(abrir, 60000);
+        });
+    }
+    abrir();
+}
+
+// Cargar todos los items de órdenes en una sola petición
 function cargarTodosItems() {
-    document.querySelectorAll('[id^="items-"]').forEach(el => {
-        const orderId = el.id.split('-')[1];
-        if (orderId) {
-            cargarItems(orderId);
+    const ids = [...document.querySelectorAll('[id^="items-"]')]
+        .map(el => el.id.split('-')[1])
+        .filter(Boolean);
+    if (ids.length === 0) return;
+    
+    fetchCondicional(`/api/ordenes/items?ids=${ids.join(',')}`)
+        .then(porOrden => {
+            if (!porOrden) return;
+            Object.entries(porOrden).forEach(([orderId, items]) => {
+                const container = document.getElementById(`items-${orderId}`);
+                if (container) renderItems(container, items);
+            });
+        });
+}
+
+// Pide al servidor el HTML de una sola pieza (tarjeta u fila) y la pone en
+// lugar de la actual, sin recargar la página; si ya no existe (404) la quita
+function refrescarFragmento(url, elementoId, contenedor) {
+    return fetch(url, { cache: 'no-store' }).then(r => {
+        const actual = document.getElementById(elementoId);
+        if (r.status === 404) {
+            actual?.remove();
+            return null;
         }
+        if (!r.ok) throw new Error(`HTTP ${r.status}`);
+        return r.text().then(html => {
+            const plantilla = document.createElement('template');
+            plantilla.innerHTML = html.trim();
+            const nuevo = plantilla.content.firstElementChild;
+            if (actual) actual.replaceWith(nuevo);
+            else contenedor?.prepend(nuevo);
+            return nuevo;
+        });
     });
 }
 
@@ -61,7 +124,7 @@ function deleteEntity(entityType, entityId) {
     .then(data => {
         if (data.success) {
             showToast('Eliminado correctamente', 'success');
-            location.reload();
+            document.getElementById(`fila-${entityType}-${entityId}`)?.remove();
         } else {
             showToast(data.error || 'Error', 'error');
         }
@@ -109,87 +172,247 @@ function desenlazarCocina() {
     .catch(err => showToast('Error: ' + err, 'error'));
 }
 
-function crearNuevaOrden() {
-    fetch('/mesero/crear-orden', {
-        method: 'POST'
+// ============ Sync offline (mesero) ============
+// Las acciones del mesero se encolan en localStorage con una llave única y
+// se mandan en lotes a /mesero/sync. La pantalla se actualiza sin esperar
+// a la red; reenviar un lote nunca duplica órdenes ni items.
+const SYNC_LOTE = 50;
+const alSincronizar = {};   // llave -> callback(resultado) mientras la página siga abierta
+let syncEnCurso = false;
+let syncTimer = null;
+let syncEspera = 1000;
+const idsPorLlave = {};     // llave de crear_orden -> id que le dio el servidor
+
+function nuevaLlave() {
+    return window.crypto?.randomUUID?.() || `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+}
+
+function colaSyncKey() {
+    return `sync-mesero-${document.body.dataset.usuario}`;
+}
+
+function leerColaSync() {
+    try {
+        return JSON.parse(localStorage.getItem(colaSyncKey())) || [];
+    } catch (e) {
+        return [];
+    }
+}
+
+function guardarColaSync(cola) {
+    localStorage.setItem(colaSyncKey(), JSON.stringify(cola));
+    const indicador = document.getElementById('sync-estado');
+    if (indicador) {
+        indicador.textContent = cola.length ? `${cola.length} sin sincronizar` : '';
+        indicador.style.display = cola.length ? '' : 'none';
+    }
+}
+
+function encolarOperacion(op, callback) {
+    op.key = op.key || nuevaLlave();
+    if (callback) alSincronizar[op.key] = callback;
+    const cola = leerColaSync();
+    cola.push(op);
+    guardarColaSync(cola);
+    programarSync(200);
+    return op.key;
+}
+
+function programarSync(ms) {
+    clearTimeout(syncTimer);
+    syncTimer = setTimeout(flushSync, ms);
+}
+
+function flushSync() {
+    const cola = leerColaSync();
+    // Sin red se espera al evento 'online'
+    if (syncEnCurso || cola.length === 0 || !navigator.onLine) return;
+    syncEnCurso = true;
+    const lote = cola.slice(0, SYNC_LOTE);
+    const porLlave = Object.fromEntries(lote.map(op => [op.key, op]));
+
+    fetch('/mesero/sync', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ ops: lote })
     })
-    .then(r => r.json())
+    .then(r => r.json().then(data => {
+        if (!r.ok) throw new Error(data.error || `HTTP ${r.status}`);
+        return data;
+    }))
     .then(data => {
-        if (data.success) {
-            showToast(`✓ Orden #${data.order_id} creada`, 'success');
-            setTimeout(() => location.reload(), 800);
-        } else {
-            showToast(data.error || 'Error', 'error');
-        }
+        const resueltas = new Set();
+        data.results.forEach(res => {
+            resueltas.add(res.key);
+            const manejado = alSincronizar[res.key]?.(res);
+            delete alSincronizar[res.key];
+            if (!res.ok && !manejado) {
+                showToast(res.error || 'Operación rechazada', 'error', 5000);
+                // La tarjeta mostró algo que el servidor rechazó: volver a la verdad
+                if (porLlave[res.key]) refrescarTarjetaMesero(porLlave[res.key], res);
+            }
+        });
+        guardarColaSync(leerColaSync().filter(op => !resueltas.has(op.key)));
+        syncEspera = 1000;
+        syncEnCurso = false;
+        if (leerColaSync().length) programarSync(0);
     })
-    .catch(err => showToast('Error: ' + err, 'error'));
+    .catch(() => {
+        // Red caída, sesión vencida o error del servidor: reintento con backoff
+        syncEnCurso = false;
+        programarSync(syncEspera);
+        syncEspera = Math.min(syncEspera * 2, 30000);
+    });
 }
 
-function enviarOrden(orderId) {
+window.addEventListener('online', () => programarSync(0));
+
+// Referencia a una orden: id del servidor o llave del crear_orden aún sin id
+function refOrden(orden) {
+    return typeof orden === 'number' ? { order_id: orden } : { order_ref: orden };
+}
+
+// Vuelve a pintar la tarjeta de la orden de una operación con lo que tiene el
+// servidor; si la orden nunca se creó o ya no está en el panel, se quita
+function refrescarTarjetaMesero(op, res) {
+    const grid = document.getElementById('ordenes-mesero');
+    if (!grid) return;
+    const ref = op.order_id ?? op.order_ref ?? op.key;
+    const orderId = op.order_id ?? idsPorLlave[ref] ?? res.order_id;
+    const quitar = () => {
+        document.getElementById(`orden-${ref}`)?.remove();
+        recontarOrdenesMesero();
+    };
+    if (!orderId) return quitar();
+    // La tarjeta puede tener la llave como id mientras el servidor usa el número
+    const actual = document.getElementById(`orden-${ref}`);
+    if (actual) actual.id = `orden-${orderId}`;
+    refrescarFragmento(`/mesero/orden/${orderId}/tarjeta`, `orden-${orderId}`, grid)
+        .then(recontarOrdenesMesero)
+        .catch(() => {});
+}
+
+function recontarOrdenesMesero() {
+    ['borrador', 'pendiente', 'servida'].forEach(status => {
+        const contador = document.getElementById(`contador-${status}`);
+        if (contador) contador.textContent = document.querySelectorAll(`#ordenes-mesero > [data-status="${status}"]`).length;
+    });
+    const vacio = document.getElementById('ordenes-vacio');
+    if (vacio) vacio.style.display = document.querySelector('#ordenes-mesero > .card') ? 'none' : '';
+}
+
+function tarjetaBorrador(ref) {
+    const card = document.createElement('div');
+    card.className = 'card';
+    card.id = `orden-${ref}`;
+    card.dataset.status = 'borrador';
+    card.innerHTML = `
+        <div style="display: flex; justify-content: space-between; align-items: start; margin-bottom: 1rem; padding-bottom: 1rem; border-bottom: 1px solid #ecf0f1;">
+            <div>
+                <p class="orden-numero" style="font-weight: 900; font-size: 1.25rem; color: #e74c3c; margin: 0;">Nueva</p>
+                <p style="color: #95a5a6; margin: 0.25rem 0 0 0; font-size: 0.9rem;">${new Date().toLocaleString().slice(0, 16)}</p>
+            </div>
+            <span class="badge orden-status" style="background: #fff3cd; color: #856404;">BORRADOR</span>
+        </div>
+        <p style="color: #2c3e50; font-weight: 600; margin-bottom: 1rem;">
+            <i class="fas fa-box"></i> 0 items
+        </p>
+        <div class="orden-acciones" style="display: flex; gap: 0.5rem; flex-direction: column;">
+            <button onclick="enviarOrden('${ref}')" class="btn btn-success" style="width: 100%;">
+                <i class="fas fa-paper-plane"></i> Enviar
+            </button>
+            <button onclick="cancelarOrden('${ref}')" class="btn btn-danger" style="width: 100%; background: #e67e7e;">
+                <i class="fas fa-trash"></i> Cancelar
+            </button>
+        </div>
+    `;
+    return card;
+}
+
+function crearNuevaOrden() {
+    const grid = document.getElementById('ordenes-mesero');
+    const key = nuevaLlave();
+    grid?.prepend(tarjetaBorrador(key));
+    recontarOrdenesMesero();
+    encolarOperacion({ key, op: 'crear_orden' }, res => {
+        const numero = document.querySelector(`#orden-${CSS.escape(key)} .orden-numero`);
+        if (res.ok) idsPorLlave[key] = res.order_id;
+        if (res.ok && numero) numero.textContent = `#${res.order_id}`;
+    });
+}
+
+function enviarOrden(orden) {
     if (!confirm('¿Enviar orden a cocina?')) return;
-    
-    fetch(`/mesero/enviar-orden/${orderId}`, {
-        method: 'POST'
-    })
-    .then(r => r.json())
-    .then(data => {
-        if (data.success) {
-            showToast(`✓ Orden #${orderId} enviada`, 'success');
-            setTimeout(() => location.reload(), 800);
-        } else {
-            showToast('Error', 'error');
-        }
-    })
-    .catch(err => showToast('Error: ' + err, 'error'));
+
+    const card = document.getElementById(`orden-${orden}`);
+    if (card) {
+        card.dataset.status = 'pendiente';
+        const badge = card.querySelector('.orden-status');
+        badge.textContent = 'PENDIENTE';
+        badge.style.background = '#d1ecf1';
+        badge.style.color = '#0c5460';
+        card.querySelector('.orden-acciones').outerHTML = `
+            <div style="padding: 1rem; background: #f8f9fa; border-radius: 6px; text-align: center; color: #95a5a6;">
+                <i class="fas fa-check-circle"></i> En proceso...
+            </div>`;
+        recontarOrdenesMesero();
+    }
+    const op = { op: 'enviar_orden', ...refOrden(orden) };
+    encolarOperacion(op, res => {
+        if (!res.ok) return false;
+        showToast(`✓ Orden #${res.order_id} enviada`, 'success');
+        // Total e items según el servidor
+        refrescarTarjetaMesero(op, res);
+    });
 }
 
-function cancelarOrden(orderId) {
+function cancelarOrden(orden) {
     if (!confirm('¿CANCELAR la orden? No se puede deshacer.')) return;
-    
-    fetch(`/mesero/cancelar-orden/${orderId}`, {
-        method: 'POST'
-    })
-    .then(r => r.json())
-    .then(data => {
-        if (data.success) {
-            showToast(`✓ Orden #${orderId} cancelada`, 'warning');
-            setTimeout(() => location.reload(), 800);
-        } else {
-            showToast(data.error || 'Error', 'error');
-        }
-    })
-    .catch(err => showToast('Error: ' + err, 'error'));
+
+    document.getElementById(`orden-${orden}`)?.remove();
+    recontarOrdenesMesero();
+    encolarOperacion({ op: 'cancelar_orden', ...refOrden(orden) }, res => {
+        if (res.ok) showToast(`✓ Orden #${res.order_id} cancelada`, 'warning');
+    });
 }
 
 // Cocina functions
+function escapeHtml(text) {
+    const div = document.createElement('div');
+    div.textContent = text ?? '';
+    return div.innerHTML;
+}
+
+function renderItems(container, items) {
+    if (items.length === 0) {
+        container.innerHTML = '<p>Sin items</p>';
+        return;
+    }
+    
+    let html = '<ul style="list-style: none; padding: 0;">';
+    let total = 0;
+    items.forEach(item => {
+        const subtotal = item.qty * item.unit_price;
+        html += `
+            <li style="padding: 0.5rem 0; border-bottom: 1px solid #eee;">
+                <strong>${item.qty}x ${escapeHtml(item.producto)}</strong>
+                ${item.notes ? `<br><em style="color: #999;">${escapeHtml(item.notes)}</em>` : ''}
+                <br><span style="color: #27ae60; font-weight: 600;">$${subtotal.toFixed(2)}</span>
+            </li>
+        `;
+        total += subtotal;
+    });
+    html += `<li style="padding: 0.75rem 0; border-top: 2px solid #333; margin-top: 0.5rem; font-weight: 700;">Total: $${total.toFixed(2)}</li>`;
+    html += '</ul>';
+    container.innerHTML = html;
+}
+
 function cargarItems(orderId) {
-    fetch(`/api/orden/${orderId}/items`)
-        .then(r => r.json())
+    fetchCondicional(`/api/orden/${orderId}/items`)
         .then(items => {
             const container = document.getElementById(`items-${orderId}`);
-            if (!container) return;
-            
-            if (items.length === 0) {
-                container.innerHTML = '<p>Sin items</p>';
-                return;
-            }
-            
-            let html = '<ul style="list-style: none; padding: 0;">';
-            let total = 0;
-            items.forEach(item => {
-                const subtotal = item.qty * item.unit_price;
-                html += `
-                    <li style="padding: 0.5rem 0; border-bottom: 1px solid #eee;">
-                        <strong>${item.qty}x ${item.producto}</strong>
-                        ${item.notes ? `<br><em style="color: #999;">${item.notes}</em>` : ''}
-                        <br><span style="color: #27ae60; font-weight: 600;">$${subtotal.toFixed(2)}</span>
-                    </li>
-                `;
-                total += subtotal;
-            });
-            html += `<li style="padding: 0.75rem 0; border-top: 2px solid #333; margin-top: 0.5rem; font-weight: 700;">Total: $${total.toFixed(2)}</li>`;
-            html += '</ul>';
-            container.innerHTML = html;
+            if (!items || !container) return;
+            renderItems(container, items);
         });
 }
 
@@ -203,9 +426,9 @@ function marcarServido(orderId) {
     .then(data => {
         if (data.success) {
             showToast(`✓ Orden #${orderId} servida`, 'success');
-            setTimeout(() => location.reload(), 800);
+            quitarOrdenCocina(data.order);
         } else {
-            showToast('Error', 'error');
+            showToast(data.error || 'Error', 'error');
         }
     })
     .catch(err => showToast('Error: ' + err, 'error'));
@@ -251,6 +474,19 @@ function desenlazarCajaCocina() {
     .catch(err => showToast('Error: ' + err, 'error'));
 }
 
+function quitarOrdenCaja(orderId) {
+    document.getElementById(`orden-${orderId}`)?.remove();
+    actualizarContadorCaja();
+}
+
+function actualizarContadorCaja() {
+    const total = document.querySelectorAll('#ordenes-caja > .card').length;
+    const contador = document.getElementById('contador-caja');
+    if (contador) contador.textContent = total;
+    const vacio = document.getElementById('ordenes-caja-vacio');
+    if (vacio) vacio.style.display = total ? 'none' : '';
+}
+
 function cerrarOrden(orderId) {
     if (!confirm('¿Cerrar orden y confirmar pago?')) return;
     
@@ -261,22 +497,20 @@ function cerrarOrden(orderId) {
     .then(data => {
         if (data.success) {
             showToast(`✓ Orden #${orderId} cerrada`, 'success');
-            setTimeout(() => location.reload(), 800);
+            quitarOrdenCaja(data.order.id);
         } else {
-            showToast('Error', 'error');
+            showToast(data.error || 'Error', 'error');
         }
     })
     .catch(err => showToast('Error: ' + err, 'error'));
 }
 
 // Auto-load items on page load
+document.addEventListener('DOMContentLoaded', cargarTodosItems);
+
+// Lo que quedó en cola (otra página, sin red) se manda al cargar
 document.addEventListener('DOMContentLoaded', () => {
-    document.querySelectorAll('[id^="items-"]').forEach(el => {
-        const orderId = el.id.split('-')[1];
-        if (orderId) {
-            cargarItems(orderId);
-        }
-    });
+    if (document.body.dataset.rol === 'mesero') flushSync();
 });
 
 // Allow Enter key in code input
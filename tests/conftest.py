@@ -0,0 +1,86 @@
+"""Fixtures comunes: la app contra una BD temporal y clientes con sesión.
+
+Los módulos leen DATABASE_PATH, ARCHIVE_DIR, etc. al importarse, así que el
+entorno se arma aquí antes de importar la app; toda la sesión de pruebas
+comparte esa BD y cada prueba usa sus propios usuarios y cocina.
+"""
+import itertools
+import os
+import re
+import sys
+import tempfile
+
+import pytest
+
+_TMP = tempfile.mkdtemp(prefix='taqueria-tests-')
+os.environ['DATABASE_PATH'] = os.path.join(_TMP, 'taqueria.db')
+# TEST_SHARDS=1 corre todo con las órdenes de cada cocina en su shard
+if os.getenv('TEST_SHARDS'):
+    os.environ['SHARD_DIR'] = os.path.join(_TMP, 'shards')
+else:
+    os.environ.pop('SHARD_DIR', None)
+os.environ.pop('ARCHIVE_DIR', None)
+os.environ.pop('BACKUP_DIR', None)
+os.environ['BACKUP_INTERVAL'] = '0'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+
+# Funciones que reciben cada sentencia ejecutada (ver test_query_plans); el
+# hook va antes de importar la app para cubrir todas las conexiones
+trazadores = []
+
+def _trazar(conn):
+    conn.set_trace_callback(lambda sql: [trazar(sql) for trazar in trazadores])
+
+database.connect_hooks.append(_trazar)
+
+from app import app as _app  # noqa: E402
+
+_nombres = itertools.count(1)
+
+@pytest.fixture(scope='session')
+def app():
+    _app.config['TESTING'] = True
+    return _app
+
+@pytest.fixture
+def cliente(app):
+    """Registra un usuario nuevo del rol dado y devuelve su cliente con sesión"""
+    def crear(role, username=None):
+        username = username or f'{role}_{next(_nombres)}'
+        c = app.test_client()
+        c.post('/register', data={'username': username, 'password': 'x', 'role': role})
+        r = c.post('/login', data={'username': username, 'password': 'x'})
+        assert r.status_code == 302, r.data
+        return c
+    return crear
+
+@pytest.fixture
+def admin(app):
+    c = app.test_client()
+    assert c.post('/login', data={'username': 'admin', 'password': 'admin123'}).status_code == 302
+    return c
+
+@pytest.fixture
+def turno(cliente):
+    """Cocina nueva con su mesero y su caja enlazados; `db` lee sus órdenes"""
+    class Turno:
+        pass
+    t = Turno()
+    t.cocina = cliente('cocina')
+    html = t.cocina.get('/cocina').get_data(as_text=True)
+    t.codigo = re.search(r'letter-spacing: 8px;">\s*(\w{6})', html).group(1)
+    t.mesero = cliente('mesero')
+    assert t.mesero.post('/mesero/enlazar-cocina', json={'codigo': t.codigo}).json['success']
+    t.caja = cliente('caja')
+    assert t.caja.post('/caja/enlazar-cocina', json={'codigo': t.codigo}).json['success']
+    # Con shards es la BD de la cocina, con la global adjunta (products, users)
+    with database.conexion(t.codigo) as t.db:
+        yield t
+
+@pytest.fixture
+def db():
+    """Conexión propia a la BD global (products, users, auditoría)"""
+    with database.conexion() as conn:
+        yield conn
@@ -0,0 +1,55 @@
+"""Archivo histórico: mover órdenes cerradas viejas sin perderlas de la vista."""
+import archive
+import rollups
+from database import conexion, order_db_path
+
+def cerrada(turno, product_id=2, qty=2):
+    order_id = turno.mesero.post('/mesero/crear-orden').json['order_id']
+    turno.mesero.post('/mesero/agregar-item', json={'order_id': order_id, 'product_id': product_id, 'qty': qty})
+    assert turno.mesero.post(f'/mesero/enviar-orden/{order_id}').json['success']
+    assert turno.cocina.post(f'/api/orden/{order_id}/servir').json['success']
+    assert turno.caja.post(f'/caja/cerrar/{order_id}').json['success']
+    return order_id
+
+def test_archivar_ordenes_viejas(turno, admin):
+    viejas = [cerrada(turno) for _ in range(3)]
+    reciente = cerrada(turno)
+    marcas = ', '.join('?' * len(viejas))
+    path = order_db_path(turno.codigo)
+    with conexion(turno.codigo) as db, db:
+        db.execute(f"UPDATE orders SET closed_at = '2020-01-01T12:00:00' WHERE id IN ({marcas})", viejas)
+    with conexion(turno.codigo) as db:
+        items = db.execute(f'SELECT COUNT(*) FROM order_items WHERE order_id IN ({marcas})', viejas).fetchone()[0]
+        assert rollups.reconstruir(db, path)
+    reporte = admin.get('/admin/api/reportes/dia?desde=2020-01-01&hasta=2020-01-01').json
+    assert reporte['totales']['ordenes'] == len(viejas)
+
+    with conexion(turno.codigo) as db:
+        movidas = archive.archivar(db, path, audit_dias=10 ** 5, lote=2, pausa=0)
+        assert movidas == {'orders': len(viejas), 'audit_log': 0}
+        vivas = [row[0] for row in db.execute(f'SELECT id FROM orders WHERE id IN ({marcas}, ?)', viejas + [reciente])]
+        assert vivas == [reciente]
+        # Otra corrida no mueve nada
+        assert archive.archivar(db, path, pausa=0)['orders'] == 0
+
+        with archive.con_archivo(db, path) as alias:
+            n = db.execute(f"SELECT COUNT(*) FROM {archive.historial('orders', alias)} WHERE id IN ({marcas})",
+                           viejas).fetchone()[0]
+            ni = db.execute(f"SELECT COUNT(*) FROM {archive.historial('order_items', alias)} WHERE order_id IN ({marcas})",
+                            viejas).fetchone()[0]
+        assert (n, ni) == (len(viejas), items)
+
+    # Los reportes y la exportación siguen viendo lo archivado
+    assert admin.get('/admin/api/reportes/dia?desde=2020-01-01&hasta=2020-01-01').json == reporte
+    with conexion(turno.codigo) as db:
+        assert rollups.reconstruir(db, path)
+    assert admin.get('/admin/api/reportes/dia?desde=2020-01-01&hasta=2020-01-01').json == reporte
+    r = admin.get(f'/admin/api/exportar/ordenes.jsonl?desde=2020-01-01&hasta=2020-01-01&codigo={turno.codigo}')
+    exportadas = [line for line in r.get_data(as_text=True).splitlines() if line]
+    assert len(exportadas) == len(viejas)
+
+def test_selecciones_por_indice(db):
+    plan = [row[3] for row in db.execute('EXPLAIN QUERY PLAN ' + archive.ORDENES_VIEJAS_SQL, ('x', 1))]
+    assert any('idx_orders_cerradas' in paso for paso in plan), plan
+    plan = [row[3] for row in db.execute('EXPLAIN QUERY PLAN ' + archive.AUDITORIA_VIEJA_SQL, ('x', 1))]
+    assert any('idx_audit_timestamp' in paso for paso in plan), plan
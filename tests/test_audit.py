@@ -0,0 +1,41 @@
+"""Búsqueda en la auditoría: paginación por llave (timestamp, fuente, id)."""
+import uuid
+
+def insertar(db, usuario, accion, timestamps):
+    with db:
+        for timestamp in timestamps:
+            db.execute('INSERT INTO audit_log (usuario, accion, detalle, timestamp) VALUES (?, ?, ?, ?)',
+                       (usuario, accion, 'prueba de paginación', timestamp))
+
+def recorrer(admin, consulta, limite):
+    """Todas las páginas siguiendo el cursor; devuelve las entradas en orden"""
+    entradas, cursor = [], ''
+    while True:
+        r = admin.get(f'/admin/api/auditoria?{consulta}&limite={limite}&cursor={cursor}')
+        assert r.status_code == 200, r.data
+        pagina = r.json['entradas']
+        assert len(pagina) <= limite
+        entradas += pagina
+        cursor = r.json['siguiente']
+        if not cursor:
+            return entradas
+
+def clave(entrada):
+    return entrada['timestamp'], entrada['fuente'], entrada['id']
+
+def test_paginas_con_timestamps_repetidos(admin, db):
+    usuario, accion = f'audit_{uuid.uuid4().hex[:8]}', f'Paginación {uuid.uuid4().hex[:8]}'
+    timestamps = ['2021-06-01T09:00:00'] * 2 + ['2021-06-01T10:00:00'] * 4 + ['2021-06-01T11:00:00'] * 5
+    insertar(db, usuario, accion, timestamps)
+    ids = {row[0] for row in db.execute('SELECT id FROM audit_log WHERE usuario = ?', (usuario,))}
+    assert len(ids) == len(timestamps)
+
+    for consulta in (f'usuario={usuario}', f'accion={accion}', f'usuario={usuario}&desde=2021-06-01&hasta=2021-06-01'):
+        for limite in (1, 3, 4, 50):
+            entradas = recorrer(admin, consulta, limite)
+            assert {e['id'] for e in entradas} == ids, (consulta, limite)
+            assert len(entradas) == len(ids), (consulta, limite)
+            assert [clave(e) for e in entradas] == sorted(map(clave, entradas), reverse=True)
+
+def test_cursor_invalido(admin):
+    assert admin.get('/admin/api/auditoria?cursor=basura').status_code == 400
@@ -0,0 +1,55 @@
+"""Respaldos en línea: respaldar, verificar y restaurar."""
+import gzip
+import os
+import sqlite3
+
+import pytest
+
+import backup
+from database import DB_NAME, conexion, order_db_path
+
+def contar_ordenes(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute('SELECT COUNT(*) FROM orders').fetchone()[0]
+    finally:
+        conn.close()
+
+def test_respaldar_verificar_restaurar(turno, tmp_path):
+    order_id = turno.mesero.post('/mesero/crear-orden').json['order_id']
+    directorio = tmp_path / 'respaldos'
+    carpeta = backup.respaldar(str(directorio), keep=2, pausa=0)
+    assert backup.respaldos(str(directorio)) == [os.path.basename(carpeta)]
+    assert backup.verificar(carpeta) == []
+
+    # Lo escrito después del respaldo no aparece al restaurar
+    with conexion(turno.codigo) as db, db:
+        db.execute('DELETE FROM orders WHERE id = ?', (order_id,))
+    viva = order_db_path(turno.codigo)
+    destino = tmp_path / 'restaurado'
+    escritas = backup.restaurar(carpeta, str(destino))
+    restaurada = os.path.join(destino, dict(backup.bases())[viva])
+    assert restaurada in escritas
+    assert contar_ordenes(restaurada) == contar_ordenes(viva) + 1
+    conn = sqlite3.connect(restaurada)
+    try:
+        assert conn.execute('SELECT id FROM orders WHERE id = ?', (order_id,)).fetchone()
+        assert conn.execute('PRAGMA integrity_check').fetchone()[0] == 'ok'
+    finally:
+        conn.close()
+
+def test_respaldo_alterado_no_se_restaura(tmp_path):
+    carpeta = backup.respaldar(str(tmp_path), pausa=0)
+    rel = os.path.basename(DB_NAME) + '.gz'
+    with gzip.open(os.path.join(carpeta, rel), 'wb') as f:
+        f.write(b'no es una base de datos')
+    assert backup.verificar(carpeta) == [f'{rel}: checksum distinto']
+    with pytest.raises(ValueError, match='checksum distinto'):
+        backup.restaurar(carpeta, str(tmp_path / 'destino'))
+
+def test_rotar_conserva_los_ultimos(tmp_path):
+    for nombre in ('20240101-000000', '20240102-000000', '20240103-000000'):
+        (tmp_path / nombre).mkdir()
+    (tmp_path / '.20240104-000000-tmp').mkdir()
+    backup.rotar(str(tmp_path), keep=2)
+    assert backup.respaldos(str(tmp_path)) == ['20240102-000000', '20240103-000000']
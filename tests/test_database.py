@@ -0,0 +1,49 @@
+"""Medición de consultas: execute + lectura de filas, un aviso por sentencia."""
+import time
+
+import pytest
+
+import database
+
+FILAS_LENTAS = '''
+    WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < 10)
+    SELECT lento(i) FROM n
+'''
+
+@pytest.fixture
+def observadas():
+    avisos = []
+
+    def observar(sql, params, elapsed, observada):
+        # Los observadores son globales: solo cuenta la conexión de la prueba
+        if observada is conn:
+            avisos.append((sql, elapsed))
+
+    with database.conexion() as conn:
+        conn.create_function('lento', 1, lambda i: time.sleep(0.01) or i)
+        database.query_observers.append(observar)
+        try:
+            yield conn, avisos
+        finally:
+            database.query_observers.remove(observar)
+
+@pytest.mark.parametrize('leer', [
+    lambda cursor: cursor.fetchall(),
+    lambda cursor: list(cursor),
+    lambda cursor: [cursor.fetchmany(3) for _ in range(4)],
+    lambda cursor: [cursor.fetchone() for _ in range(11)],
+])
+def test_incluye_el_tiempo_de_leer_filas(observadas, leer):
+    conn, avisos = observadas
+    cursor = conn.execute(FILAS_LENTAS)
+    assert not avisos
+    leer(cursor)
+    [(sql, elapsed)] = avisos
+    assert sql == FILAS_LENTAS and elapsed >= 0.1
+
+def test_cursor_descartado_avisa_una_vez(observadas):
+    conn, avisos = observadas
+    assert conn.execute(FILAS_LENTAS).fetchone()[0] == 1
+    conn.execute('SELECT 1').close()
+    conn.execute('CREATE TEMP TABLE t (x)')
+    assert [sql for sql, _ in avisos] == [FILAS_LENTAS, 'SELECT 1', 'CREATE TEMP TABLE t (x)']
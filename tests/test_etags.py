@@ -0,0 +1,84 @@
+"""ETags por versión de cocina: 304 mientras nada cambia, 200 en cuanto cambia."""
+import time
+
+import pytest
+
+from database import SHARD_DIR, conexion
+from versions import versions
+
+# Con shards cada cocina solo alcanza sus órdenes
+otras_cocinas = pytest.mark.skipif(bool(SHARD_DIR), reason='con shards no se leen órdenes de otra cocina')
+
+def test_caja_304(turno):
+    r = turno.caja.get('/caja')
+    etag = r.headers['ETag']
+    assert r.status_code == 200 and r.headers['Cache-Control'] == 'no-cache'
+    r = turno.caja.get('/caja', headers={'If-None-Match': etag})
+    assert r.status_code == 304 and r.headers['ETag'] == etag and not r.data
+
+    # El panel sondea con este ETag: una orden servida lo invalida y ya viene
+    order_id = turno.mesero.post('/mesero/crear-orden').json['order_id']
+    turno.mesero.post('/mesero/agregar-item', json={'order_id': order_id, 'product_id': 2, 'qty': 1})
+    turno.mesero.post(f'/mesero/enviar-orden/{order_id}')
+    assert turno.cocina.post(f'/api/orden/{order_id}/servir').json['success']
+    r = turno.caja.get('/caja', headers={'If-None-Match': etag})
+    assert r.status_code == 200 and f'id="orden-{order_id}"'.encode() in r.data
+
+def test_items_de_cocina_cambian_con_sus_ordenes(turno):
+    url = f'/api/ordenes/items?codigo={turno.codigo}&status=pendiente'
+    etag = turno.cocina.get(url).headers['ETag']
+    assert turno.cocina.get(url, headers={'If-None-Match': etag}).status_code == 304
+
+    order_id = turno.mesero.post('/mesero/crear-orden').json['order_id']
+    turno.mesero.post('/mesero/agregar-item', json={'order_id': order_id, 'product_id': 2, 'qty': 1})
+    r = turno.cocina.get(url, headers={'If-None-Match': etag})
+    assert r.status_code == 200 and r.headers['ETag'] != etag
+
+    # Escritura desde otra conexión (otro worker): se nota al revisar data_version
+    etag = r.headers['ETag']
+    with conexion(turno.codigo) as db, db:
+        db.execute("UPDATE orders SET status = 'pendiente' WHERE id = ?", (order_id,))
+    time.sleep(versions.check_interval + 0.05)
+    r = turno.cocina.get(url, headers={'If-None-Match': etag})
+    assert r.status_code == 200 and str(order_id) in r.json
+
+@otras_cocinas
+def test_items_de_orden_siguen_a_su_cocina(turno, cliente):
+    order_id = turno.mesero.post('/mesero/crear-orden').json['order_id']
+    turno.mesero.post('/mesero/agregar-item', json={'order_id': order_id, 'product_id': 2, 'qty': 1})
+    assert turno.mesero.post(f'/mesero/enviar-orden/{order_id}').json['success']
+
+    # Otra cocina consulta la orden: el ETag es el de la cocina dueña
+    otra = cliente('cocina')
+    otra.get('/cocina')
+    url = f'/api/orden/{order_id}/items'
+    etag = otra.get(url).headers['ETag']
+    assert etag.strip('"').startswith(turno.codigo)
+    assert otra.get(url, headers={'If-None-Match': etag}).status_code == 304
+
+    assert turno.cocina.post(f'/api/orden/{order_id}/servir').json['success']
+    r = otra.get(url, headers={'If-None-Match': etag})
+    assert r.status_code == 200 and r.headers['ETag'] != etag
+    assert r.json[0]['qty'] == 1
+
+def test_pagina_de_cocina_304(turno):
+    etag = turno.cocina.get('/cocina').headers['ETag']
+    assert turno.cocina.get('/cocina', headers={'If-None-Match': etag}).status_code == 304
+
+@otras_cocinas
+def test_items_por_ids_siguen_a_sus_cocinas(turno, cliente):
+    order_id = turno.mesero.post('/mesero/crear-orden').json['order_id']
+    turno.mesero.post('/mesero/agregar-item', json={'order_id': order_id, 'product_id': 2, 'qty': 1})
+    assert turno.mesero.post(f'/mesero/enviar-orden/{order_id}').json['success']
+
+    otra = cliente('cocina')
+    otra.get('/cocina')
+    url = f'/api/ordenes/items?ids={order_id}'
+    etag = otra.get(url).headers['ETag']
+    assert otra.get(url, headers={'If-None-Match': etag}).status_code == 304
+
+    # Cambia la cocina dueña, no la de la sesión
+    assert turno.cocina.post(f'/api/orden/{order_id}/servir').json['success']
+    r = otra.get(url, headers={'If-None-Match': etag})
+    assert r.status_code == 200 and r.headers['ETag'] != etag
+    assert r.json[str(order_id)][0]['qty'] == 1
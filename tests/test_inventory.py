@@ -0,0 +1,55 @@
+"""Stock: descuento condicional al enviar, devolución al cancelar."""
+from conftest import trazadores
+from inventory import inventory
+
+def stock(db, product_id):
+    return db.execute('SELECT stock FROM products WHERE id = ?', (product_id,)).fetchone()[0]
+
+def fijar(db, stocks):
+    with db:
+        for product_id, n in stocks.items():
+            db.execute('UPDATE products SET stock = ? WHERE id = ?', (n, product_id))
+    inventory.invalidar()
+
+def borrador(turno, *lineas):
+    order_id = turno.mesero.post('/mesero/crear-orden').json['order_id']
+    for product_id, qty in lineas:
+        r = turno.mesero.post('/mesero/agregar-item', json={'order_id': order_id, 'product_id': product_id, 'qty': qty})
+        assert r.json['success']
+    return order_id
+
+def test_sin_stock_no_descuenta_nada(turno, db):
+    fijar(db, {10: 5, 11: 1})
+    order_id = borrador(turno, (10, 3), (11, 2))
+    r = turno.mesero.post(f'/mesero/enviar-orden/{order_id}')
+    assert r.status_code == 409 and r.json['product_ids'] == [11]
+    assert (stock(db, 10), stock(db, 11)) == (5, 1)
+
+    fijar(db, {11: 2})
+    assert turno.mesero.post(f'/mesero/enviar-orden/{order_id}').json['success']
+    assert (stock(db, 10), stock(db, 11)) == (2, 0)
+    assert 11 in inventory.estado()['agotados']
+
+def test_cancelar_devuelve(turno, db):
+    fijar(db, {10: 4})
+    order_id = borrador(turno, (10, 4))
+    assert turno.mesero.post(f'/mesero/enviar-orden/{order_id}').json['success']
+    assert stock(db, 10) == 0
+    assert turno.mesero.post(f'/mesero/cancelar-orden/{order_id}').json['success']
+    assert stock(db, 10) == 4
+
+def test_sin_limite_no_escribe_products(turno):
+    order_id = borrador(turno, (13, 2), (14, 1))
+    sentencias = []
+    trazadores.append(sentencias.append)
+    try:
+        assert turno.mesero.post(f'/mesero/enviar-orden/{order_id}').json['success']
+        assert turno.mesero.post(f'/mesero/cancelar-orden/{order_id}').json['success']
+    finally:
+        trazadores.remove(sentencias.append)
+    assert not [sql for sql in sentencias if 'UPDATE products' in sql]
+
+def test_borrar_producto_lo_quita_del_stock(admin):
+    assert 19 in inventory.disponibles()
+    assert admin.post('/admin/products/delete/19').json['success']
+    assert 19 not in inventory.disponibles()
@@ -0,0 +1,34 @@
+"""Tablero de producción: cantidades por producto de las órdenes pendientes."""
+
+def producto(tablero, product_id):
+    return next(p for p in tablero['productos'] if p['product_id'] == product_id)
+
+def test_suma_y_saca_ordenes(turno):
+    ordenes = []
+    for qty in (2, 3):
+        order_id = turno.mesero.post('/mesero/crear-orden').json['order_id']
+        turno.mesero.post('/mesero/agregar-item', json={'order_id': order_id, 'product_id': 5, 'qty': qty})
+        assert turno.mesero.post(f'/mesero/enviar-orden/{order_id}').json['success']
+        ordenes.append(order_id)
+    tablero = turno.cocina.get('/api/cocina/produccion').json
+    assert tablero['ordenes'] == 2
+    assert (producto(tablero, 5)['qty'], producto(tablero, 5)['ordenes']) == (5, 2)
+
+    assert turno.cocina.post(f'/api/orden/{ordenes[0]}/servir').json['success']
+    tablero = turno.cocina.get('/api/cocina/produccion').json
+    assert tablero['ordenes'] == 1 and producto(tablero, 5)['qty'] == 3
+
+def test_nombres_siguen_al_catalogo(turno, admin):
+    order_id = turno.mesero.post('/mesero/crear-orden').json['order_id']
+    turno.mesero.post('/mesero/agregar-item', json={'order_id': order_id, 'product_id': 4, 'qty': 1})
+    assert turno.mesero.post(f'/mesero/enviar-orden/{order_id}').json['success']
+    assert producto(turno.cocina.get('/api/cocina/produccion').json, 4)['producto'] == 'Taco de Suadero'
+
+    original = admin.get('/admin/api/products/4').json
+    try:
+        cambio = dict(original, name='Taco de Suadero Especial', category='extras')
+        assert admin.post('/admin/api/products/4', json=cambio).json['success']
+        renombrado = producto(turno.cocina.get('/api/cocina/produccion').json, 4)
+        assert (renombrado['producto'], renombrado['category']) == ('Taco de Suadero Especial', 'extras')
+    finally:
+        admin.post('/admin/api/products/4', json=original)
@@ -0,0 +1,256 @@
+"""Regresión de planes de consulta.
+
+Recorre un turno completo con el cliente de pruebas de Flask, captura cada
+sentencia ejecutada con set_trace_callback y corre EXPLAIN QUERY PLAN sobre
+cada una. Falla si alguna hace SCAN de una tabla o usa un B-tree temporal,
+salvo las lecturas completas justificadas abajo.
+
+    python -m pytest tests/test_query_plans.py
+"""
+import contextlib
+import os
+import re
+import sqlite3
+
+import pytest
+
+import audit_search
+import database
+from archive import archive_path, con_archivo
+from conftest import trazadores
+from database import Order, Table, User
+from events import hub
+from slowlog import normalizar
+from utils import audit_writer
+
+# Un SCAN de tabla virtual con restricción MATCH (M en idxStr de FTS5) es una búsqueda en su índice
+PROHIBIDO = re.compile(r'\bSCAN\b(?! CONSTANT ROW)(?!.* VIRTUAL TABLE INDEX \d+:\S*M)|USE TEMP B-TREE')
+
+# Lecturas completas intencionales (sentencia normalizada -> justificación).
+# Agregar una entrada aquí en vez de arreglar el plan requiere explicar por
+# qué la lectura está acotada; las que dejan de usarse hacen fallar la prueba.
+PERMITIDAS = {
+    'SELECT * FROM products ORDER BY category, name':
+        'catalog.get() carga el menú completo a memoria y solo se repite cuando cambia la versión '
+        'del catálogo; son decenas de filas y ordenarlas cuesta menos que mantener otro índice',
+    'SELECT * FROM users ORDER BY id':
+        'el panel admin lista todos los usuarios; ORDER BY id va por el rowid, sin ordenamiento aparte',
+    'SELECT * FROM tables ORDER BY id':
+        'el panel admin y el mesero listan todas las mesas; son 15 filas en orden de rowid',
+    'SELECT codigo_cocina, version FROM kitchen_versions':
+        'versions lee una fila por cocina y solo cuando PRAGMA data_version indica escrituras '
+        'de otro proceso; es la tabla completa por diseño',
+    'SELECT id, stock FROM products WHERE stock IS NOT NULL':
+        'inventory refresca su copia en memoria solo cuando cambia PRAGMA data_version; la tabla '
+        'es el menú (decenas de filas) y un índice sobre stock se reescribiría en cada envío',
+    'SELECT id, username FROM users':
+        'exports.Nombres arma el mapa id -> nombre una vez por descarga, en vez de un JOIN por fila',
+    'SELECT id, name FROM tables':
+        'exports.Nombres arma el mapa id -> mesa una vez por descarga (15 filas)',
+    'SELECT k, v FROM ?.?':
+        'sentencia interna de FTS5 sobre audit_fts_config (unas pocas filas de configuración)',
+}
+
+# Sentencias de audit_search: columnas, filtros opcionales (Filtros.where) y orden
+_AUDITORIA = r'SELECT ' + re.escape(', '.join(f'a.{columna}' for columna in audit_search.COLUMNAS))
+_FILTROS_AUDITORIA = (r'( AND (a\.usuario = \?|a\.accion = \?|a\.timestamp >= \?|a\.timestamp < \?'
+                      r'|a\.timestamp <= \? AND \(a\.timestamp < \? OR a\.id < \?\)))*')
+_ORDEN_AUDITORIA = r' ORDER BY a\.timestamp DESC, a\.id DESC LIMIT \?'
+
+# Familias de sentencias armadas con filtros opcionales (patrón -> justificación)
+PERMITIDAS_PATRONES = {
+    r'SELECT codigo_cocina, status, COUNT\(\*\) as n FROM (main|k\d+)\.orders WHERE status IN \(\?, \?, \?\) GROUP BY codigo_cocina, status':
+        'el resumen de cocinas agrupa las órdenes abiertas de la global y de cada shard; el SCAN '
+        'recorre el índice parcial idx_orders_activas, que solo contiene órdenes sin cerrar',
+    r'SELECT COUNT\(\*\) FROM \(SELECT \? FROM \w+\.audit_fts WHERE audit_fts MATCH \? LIMIT \?\)':
+        'audit_search decide la estrategia contando coincidencias del FTS solo hasta el umbral; '
+        'el LIMIT corta el recorrido',
+    _AUDITORIA + r' FROM \w+\.audit_fts f JOIN \w+\.audit_log a ON a\.id = f\.rowid '
+    r'WHERE f\.audit_fts MATCH \?' + _FILTROS_AUDITORIA + _ORDEN_AUDITORIA:
+        'solo se usa cuando el conteo anterior dio menos coincidencias que el umbral, así que '
+        'el B-tree temporal ordena a lo más ese número de filas',
+    _AUDITORIA + r' FROM \w+\.audit_log a'
+    r'( WHERE EXISTS \(SELECT 1 FROM \w+\.audit_fts WHERE audit_fts MATCH \? AND rowid = a\.id\))?'
+    + _ORDEN_AUDITORIA:
+        'sin filtros de columna el SCAN va por idx_audit_timestamp en el orden pedido y se detiene '
+        'al llenar la página (LIMIT); con texto de muchas coincidencias cada fila se prueba contra el FTS',
+}
+
+# Solo aparecen con shards: el shard de una cocina nueva se migra durante el turno
+PERMITIDAS_SHARDS = {
+    r'INSERT INTO sales_\w+ \(.*\) SELECT .* FROM orders o (JOIN order_items oi ON oi\.order_id = o\.id )?'
+    r'WHERE o\.status = \? ON CONFLICT .*':
+        'llenado inicial de los acumulados de ventas en la migración; corre una sola vez por BD '
+        'y al crear un shard este todavía no tiene órdenes',
+}
+
+IGNORAR = ('PRAGMA', 'BEGIN', 'COMMIT', 'ROLLBACK', 'CREATE', 'DROP', 'ANALYZE', '--')
+
+def recorrer_turno(app):
+    """Ejecuta cada ruta de producción al menos una vez"""
+    def cliente(username, role):
+        c = app.test_client()
+        c.post('/register', data={'username': username, 'password': 'x', 'role': role})
+        c.post('/login', data={'username': username, 'password': 'x'})
+        return c
+
+    admin = app.test_client()
+    admin.post('/login', data={'username': 'admin', 'password': 'admin123'})
+    cocina = cliente('plan_cocina', 'cocina')
+    html = cocina.get('/cocina').get_data(as_text=True)
+    codigo = re.search(r'letter-spacing: 8px;">\s*(\w{6})', html).group(1)
+    stream = cocina.get('/cocina/stream', buffered=False)
+
+    mesero = cliente('plan_mesero', 'mesero')
+    mesero.post('/mesero/enlazar-cocina', json={'codigo': codigo})
+    mesero.get('/mesero')
+    mesero.get('/mesero/mesas')
+
+    order_id = mesero.post('/mesero/crear-orden').get_json()['order_id']
+    mesero.post('/mesero/agregar-item', json={'order_id': order_id, 'product_id': 1, 'qty': 2})
+    mesero.post(f'/mesero/enviar-orden/{order_id}')
+    mesero.get(f'/mesero/orden/{order_id}/tarjeta')
+
+    lote_id = mesero.post('/mesero/mesa/2/orden').get_json()['order_id']
+    mesero.get(f'/mesero/orden/{lote_id}')
+    mesero.get('/api/menu/disponibilidad')
+    mesero.post(f'/mesero/orden/{lote_id}/enviar-lote',
+                json={'items': [{'product_id': 2, 'qty': 3}, {'product_id': 7, 'qty': 1}]})
+
+    cocina.get(f'/api/orden/{order_id}/items')
+    cocina.get(f'/api/ordenes/items?ids={order_id},{lote_id}')
+    cocina.get(f'/api/ordenes/items?codigo={codigo}&status=pendiente')
+    cocina.get('/cocina/produccion')
+    cocina.get('/api/cocina/produccion')
+    cocina.post(f'/api/orden/{order_id}/servir')
+
+    caja = cliente('plan_caja', 'caja')
+    caja.post('/caja/enlazar-cocina', json={'codigo': codigo})
+    caja.get('/caja')
+    caja.post(f'/caja/cerrar/{order_id}')
+
+    mesero.post('/mesero/sync', json={'ops': [
+        {'key': 'plan-1', 'op': 'crear_orden', 'mesa': 3},
+        {'key': 'plan-2', 'op': 'agregar_item', 'order_ref': 'plan-1', 'product_id': 1, 'qty': 1},
+        {'key': 'plan-3', 'op': 'enviar_orden', 'order_ref': 'plan-1'},
+        {'key': 'plan-4', 'op': 'crear_orden'},
+        {'key': 'plan-5', 'op': 'enviar_orden', 'order_ref': 'plan-4', 'items': [{'product_id': 2, 'qty': 1}]},
+        {'key': 'plan-6', 'op': 'cancelar_orden', 'order_ref': 'plan-4'},
+    ]})
+    cancelada = mesero.post('/mesero/crear-orden').get_json()['order_id']
+    mesero.post(f'/mesero/cancelar-orden/{cancelada}')
+
+    admin.get('/admin')
+    admin.get('/admin/api/products/1')
+    admin.post('/admin/api/products/1', json={'name': 'Taco al Pastor', 'category': 'tacos', 'price': 15, 'stock': 100})
+    admin.get('/admin/fragmento/products/1')
+    admin.get('/admin/fragmento/users/1')
+    admin.get('/admin/api/tables/15')
+    admin.post('/admin/api/tables/15', json={'name': 'Mesa 15'})
+    admin.get('/admin/fragmento/tables/15')
+    admin.post('/admin/tables/delete/15')
+    admin.get('/admin/api/db-pool')
+    admin.get('/admin/api/audit-writer')
+    admin.get('/admin/metrics')
+    admin.get('/admin/api/cocinas/resumen')
+    for dimension in ('dia', 'hora', 'producto', 'mesero', 'cocina'):
+        admin.get(f'/admin/api/reportes/{dimension}')
+    admin.get('/admin/api/slow-queries')
+    siguiente = admin.get('/admin/api/auditoria?limite=2').json['siguiente']
+    admin.get(f'/admin/api/auditoria?limite=2&cursor={siguiente}')
+    for filtro in ('usuario=admin', 'accion=Login', 'desde=2024-01-01&hasta=2030-12-31', 'q=orden', 'q=orden&usuario=admin'):
+        admin.get(f'/admin/api/auditoria?{filtro}')
+    admin.get('/admin/api/auditoria.csv?accion=Login').get_data()
+    admin.get('/admin/api/exportar/ordenes.csv?desde=2024-01-01&hasta=2030-12-31').get_data()
+    admin.get('/admin/api/exportar/ordenes.jsonl?codigo=ZZZZZZ&mesero=1&gzip=1').get_data()
+
+    with app.app_context():
+        User.get_by_username('admin')
+        User.get_cocina_code(1)
+        Order.get_by_mesero(1, codigo)
+        Order.get_pendientes_by_cocina(codigo)
+        Order.get_items(order_id, codigo)
+        Order.marcar_servida(lote_id, codigo)
+        Table.all()
+
+    stream.close()
+    mesero.get('/logout')
+    audit_writer.wait_idle()
+    assert hub.subscriber_count() == 0
+
+def patrones():
+    return {**PERMITIDAS_PATRONES, **(PERMITIDAS_SHARDS if database.SHARD_DIR else {})}
+
+def permiso(clave):
+    """Justificación de una sentencia con lectura completa, o None"""
+    return PERMITIDAS.get(clave) or next(
+        (motivo for patron, motivo in patrones().items() if re.fullmatch(patron, clave)), None)
+
+@pytest.fixture(scope='module')
+def planes(app):
+    """{sentencia normalizada: plan} de todo lo que se ejecutó durante un turno"""
+    sentencias = {}
+
+    def capturar(sql):
+        if not sql.lstrip().upper().startswith(IGNORAR):
+            sentencias.setdefault(normalizar(sql), sql)
+
+    trazadores.append(capturar)
+    try:
+        recorrer_turno(app)
+    finally:
+        trazadores.remove(capturar)
+
+    with contextlib.ExitStack() as pila:
+        explicar = _conexiones_explain(pila, sentencias.values())
+        return {
+            clave: [row[3] for row in explicar(sql).execute(f'EXPLAIN QUERY PLAN {sql}')]
+            for clave, sql in sentencias.items()
+            if not (clave.upper().startswith('INSERT') and 'SELECT' not in clave.upper())
+        }
+
+def _conexiones_explain(pila, sentencias):
+    """Función sql -> conexión con el esquema de la que la ejecutó.
+
+    Sin shards todo va a la global. Con shards las órdenes se leen en un
+    shard con la global adjunta, y los reportes en la global con los shards
+    adjuntos como k0, k1... (query_orders_all); todos los shards tienen el
+    mismo esquema, así que basta uno. Si otra prueba ya archivó, las
+    consultas de historial leen también el archivo.
+    """
+    def abrir(path):
+        conn = sqlite3.connect(path)
+        pila.callback(conn.close)
+        pila.enter_context(con_archivo(conn, path))
+        return conn
+
+    global_ = abrir(database.DB_NAME)
+    if not database.SHARD_DIR:
+        return lambda sql: global_
+    codigos = database.shard_codes()
+    # De preferencia uno con archivo, por las consultas de historial
+    codigo = next((c for c in codigos if os.path.exists(archive_path(database.order_db_path(c)))), codigos[0])
+    path = database.order_db_path(codigo)
+    shard = abrir(path)
+    shard.execute('ATTACH DATABASE ? AS global', (database.DB_NAME,))
+    adjuntos = {int(n) for sql in sentencias for n in re.findall(r'\bk(\d+)\.', sql)}
+    for n in range(max(adjuntos, default=-1) + 1):
+        global_.execute('ATTACH DATABASE ? AS ?', (path, f'k{n}'))
+    return lambda sql: global_ if re.search(r'\bk\d+\.', sql) else shard
+
+def test_sin_scan_ni_btree_temporal(planes):
+    assert len(planes) > 50
+    fallas = {
+        clave: plan for clave, plan in planes.items()
+        if any(PROHIBIDO.search(paso) for paso in plan) and not permiso(clave)
+    }
+    assert not fallas, '\n'.join(f'{clave}\n    ' + '\n    '.join(plan) for clave, plan in fallas.items())
+
+def test_permitidas_justificadas_y_en_uso(planes):
+    for motivo in [*PERMITIDAS.values(), *PERMITIDAS_PATRONES.values(), *PERMITIDAS_SHARDS.values()]:
+        assert len(motivo.split()) >= 8, motivo
+    usadas = {clave for clave, plan in planes.items() if any(PROHIBIDO.search(paso) for paso in plan)}
+    sobran = [clave for clave in PERMITIDAS if clave not in usadas]
+    sobran += [patron for patron in patrones()
+               if not any(re.fullmatch(patron, clave) for clave in usadas)]
+    assert not sobran, f'Entradas permitidas que ya no hacen falta: {sobran}'
@@ -0,0 +1,72 @@
+"""Órdenes de cada cocina en su propio shard (SHARD_DIR).
+
+Corre con TEST_SHARDS=1 (así lo hace CI); sin esa variable el caso
+principal se repite en un proceso aparte con shards activos.
+"""
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from database import DB_NAME, SHARD_DIR, Order, conexion, order_db_path
+from test_audit import clave, insertar, recorrer
+from utils import audit_writer
+
+con_shards = pytest.mark.skipif(not SHARD_DIR, reason='requiere TEST_SHARDS=1')
+
+@pytest.mark.skipif(bool(SHARD_DIR), reason='ya corre con shards')
+def test_en_proceso_con_shards():
+    r = subprocess.run([sys.executable, '-m', 'pytest', '-q', __file__], env={**os.environ, 'TEST_SHARDS': '1'},
+                       capture_output=True, text=True, timeout=300)
+    assert r.returncode == 0, r.stdout + r.stderr
+
+@con_shards
+def test_turno_en_el_shard(turno, admin):
+    order_id = turno.mesero.post('/mesero/crear-orden').json['order_id']
+    turno.mesero.post('/mesero/agregar-item', json={'order_id': order_id, 'product_id': 2, 'qty': 2})
+    assert turno.mesero.post(f'/mesero/enviar-orden/{order_id}').json['success']
+    assert turno.cocina.post(f'/api/orden/{order_id}/servir').json['success']
+    assert turno.caja.post(f'/caja/cerrar/{order_id}').json['success']
+
+    # La orden vive en el shard de la cocina, no en la global
+    assert order_db_path(turno.codigo) != DB_NAME
+    orden = turno.db.execute('SELECT codigo_cocina, status, total FROM main.orders WHERE id = ?',
+                             (order_id,)).fetchone()
+    assert tuple(orden) == (turno.codigo, 'cerrada', 36)
+    with conexion() as db:
+        assert not db.execute('SELECT 1 FROM orders WHERE codigo_cocina = ?', (turno.codigo,)).fetchone()
+
+    resumen = admin.get('/admin/api/cocinas/resumen').json
+    assert resumen['sharded'] and turno.codigo in resumen['shards']
+    reporte = admin.get(f'/admin/api/reportes/cocina?codigo={turno.codigo}').json
+    assert reporte['totales'] == {'ordenes': 1, 'items': 2, 'total': 36}
+
+    audit_writer.wait_idle()
+    entradas = admin.get(f'/admin/api/auditoria?accion=Orden cerrada&q={order_id}').json['entradas']
+    assert any(e['detalle'] == f'#{order_id}' for e in entradas)
+
+    r = admin.get(f'/admin/api/exportar/ordenes.jsonl?codigo={turno.codigo}')
+    [exportada] = [json.loads(linea) for linea in r.get_data(as_text=True).splitlines()]
+    assert exportada['order_id'] == order_id and exportada['items'][0]['qty'] == 2
+
+@con_shards
+def test_sin_codigo_no_cae_en_la_global(app):
+    with app.app_context():
+        with pytest.raises(LookupError):
+            Order.get_items(1, None)
+        with pytest.raises(LookupError):
+            Order.get_by_mesero(1, None)
+
+@con_shards
+def test_auditoria_pagina_entre_fuentes(turno, admin, db):
+    usuario = f'audit_{turno.codigo}'
+    # Mismo timestamp en la global y en el shard: el desempate es (fuente, id)
+    insertar(db, usuario, 'Paginación', ['2021-07-01T10:00:00'] * 3 + ['2021-07-01T11:00:00'] * 2)
+    insertar(turno.db, usuario, 'Paginación', ['2021-07-01T10:00:00'] * 4 + ['2021-07-01T11:00:00'] * 2)
+    for limite in (1, 2, 3, 5, 50):
+        entradas = recorrer(admin, f'usuario={usuario}', limite)
+        assert len(entradas) == 11 and len({(e['fuente'], e['id']) for e in entradas}) == 11
+        assert {e['fuente'] for e in entradas} == {'', turno.codigo}
+        assert [clave(e) for e in entradas] == sorted(map(clave, entradas), reverse=True)
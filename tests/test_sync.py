@@ -0,0 +1,75 @@
+"""Sincronización de operaciones encoladas sin conexión (/mesero/sync)."""
+import uuid
+
+def llaves(n):
+    return [str(uuid.uuid4()) for _ in range(n)]
+
+def contar(db, sql, *params):
+    return db.execute(sql, params).fetchone()[0]
+
+def test_reenviar_lote_no_duplica(turno):
+    k = llaves(7)
+    ops = [
+        {'key': k[0], 'op': 'crear_orden'},
+        {'key': k[1], 'op': 'agregar_item', 'order_ref': k[0], 'product_id': 2, 'qty': 2},
+        {'key': k[2], 'op': 'agregar_item', 'order_ref': k[0], 'product_id': 9999, 'qty': 1},
+        {'key': k[3], 'op': 'enviar_orden', 'order_ref': k[0]},
+        {'key': k[4], 'op': 'crear_orden', 'mesa': 7},
+        {'key': k[5], 'op': 'enviar_orden', 'order_ref': k[4], 'items': [{'product_id': 3, 'qty': 3}]},
+        {'key': k[6], 'op': 'crear_orden', 'mesa': 999},
+    ]
+    ordenes = contar(turno.db, 'SELECT COUNT(*) FROM orders WHERE codigo_cocina = ?', turno.codigo)
+    r = turno.mesero.post('/mesero/sync', json={'ops': ops})
+    assert r.status_code == 200, r.data
+    primera = r.json['results']
+    assert [x['ok'] for x in primera] == [True, True, False, True, True, True, False]
+    assert primera[2]['status_code'] == 404 and primera[6]['status_code'] == 404
+    a, b = primera[0]['order_id'], primera[4]['order_id']
+    items = contar(turno.db, 'SELECT COUNT(*) FROM order_items WHERE order_id IN (?, ?)', a, b)
+    assert items == 2
+
+    segunda = turno.mesero.post('/mesero/sync', json={'ops': ops}).json['results']
+    assert all(x.get('repetida') for x in segunda)
+    assert [x['ok'] for x in segunda] == [x['ok'] for x in primera]
+    assert segunda[0]['order_id'] == a and segunda[4]['order_id'] == b
+    assert contar(turno.db, 'SELECT COUNT(*) FROM orders WHERE codigo_cocina = ?', turno.codigo) == ordenes + 2
+    assert contar(turno.db, 'SELECT COUNT(*) FROM order_items WHERE order_id IN (?, ?)', a, b) == items
+    assert contar(turno.db, "SELECT COUNT(*) FROM orders WHERE id IN (?, ?) AND status = 'pendiente'", a, b) == 2
+
+def test_reenvio_parcial_aplica_solo_lo_nuevo(turno):
+    k = llaves(3)
+    ops = [
+        {'key': k[0], 'op': 'crear_orden'},
+        {'key': k[1], 'op': 'agregar_item', 'order_ref': k[0], 'product_id': 2, 'qty': 1},
+    ]
+    primera = turno.mesero.post('/mesero/sync', json={'ops': ops}).json['results']
+    ops.append({'key': k[2], 'op': 'agregar_item', 'order_ref': k[0], 'product_id': 2, 'qty': 1})
+    segunda = turno.mesero.post('/mesero/sync', json={'ops': ops}).json['results']
+    assert [bool(x.get('repetida')) for x in segunda] == [True, True, False]
+    order_id = primera[0]['order_id']
+    assert contar(turno.db, 'SELECT COUNT(*) FROM order_items WHERE order_id = ?', order_id) == 2
+
+def test_borrador_de_mesa_se_reutiliza(turno):
+    k = llaves(2)
+    r = turno.mesero.post('/mesero/sync', json={'ops': [
+        {'key': k[0], 'op': 'crear_orden', 'mesa': 8},
+        {'key': k[1], 'op': 'crear_orden', 'mesa': 8},
+    ]}).json['results']
+    assert r[0]['order_id'] == r[1]['order_id']
+
+def test_sin_stock_se_rechaza_sin_enviar(turno):
+    k = llaves(2)
+    r = turno.mesero.post('/mesero/sync', json={'ops': [
+        {'key': k[0], 'op': 'crear_orden'},
+        {'key': k[1], 'op': 'enviar_orden', 'order_ref': k[0], 'items': [{'product_id': 18, 'qty': 10 ** 6}]},
+    ]}).json['results']
+    assert r[1]['status_code'] == 409 and r[1]['product_ids'] == [18]
+    estado = turno.db.execute('SELECT status FROM orders WHERE id = ?', (r[0]['order_id'],)).fetchone()[0]
+    assert estado == 'borrador'
+    assert contar(turno.db, 'SELECT COUNT(*) FROM order_items WHERE order_id = ?', r[0]['order_id']) == 0
+
+def test_lotes_invalidos(turno):
+    assert turno.mesero.post('/mesero/sync', json={'ops': [{'op': 'crear_orden'}]}).status_code == 400
+    ops = [{'key': str(i), 'op': 'crear_orden'} for i in range(101)]
+    assert turno.mesero.post('/mesero/sync', json={'ops': ops}).status_code == 413
+    assert turno.cocina.post('/mesero/sync', json={'ops': []}).status_code == 302
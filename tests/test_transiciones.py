@@ -0,0 +1,43 @@
+"""Máquina de estados de las órdenes: borrador -> pendiente -> servida -> cerrada."""
+
+def enviada(turno, product_id=2, qty=2):
+    order_id = turno.mesero.post('/mesero/crear-orden').json['order_id']
+    r = turno.mesero.post('/mesero/agregar-item', json={'order_id': order_id, 'product_id': product_id, 'qty': qty})
+    assert r.json['success']
+    assert turno.mesero.post(f'/mesero/enviar-orden/{order_id}').json['success']
+    return order_id
+
+def test_pendiente_no_acepta_cambios_del_mesero(turno):
+    order_id = enviada(turno)
+    r = turno.mesero.post('/mesero/agregar-item', json={'order_id': order_id, 'product_id': 2, 'qty': 1})
+    assert r.status_code == 409
+    r = turno.mesero.post(f'/mesero/enviar-orden/{order_id}')
+    assert r.status_code == 409 and r.json['status'] == 'pendiente'
+
+def test_servir_y_cerrar_una_sola_vez(turno):
+    order_id = enviada(turno)
+    assert turno.caja.post(f'/caja/cerrar/{order_id}').status_code == 409
+    assert turno.cocina.post(f'/api/orden/{order_id}/servir').json['success']
+    assert turno.cocina.post(f'/api/orden/{order_id}/servir').status_code == 409
+    assert turno.mesero.post(f'/mesero/cancelar-orden/{order_id}').status_code == 409
+    assert turno.caja.post(f'/caja/cerrar/{order_id}').json['success']
+    assert turno.caja.post(f'/caja/cerrar/{order_id}').status_code == 409
+
+    total, status, closed_at = turno.db.execute(
+        'SELECT total, status, closed_at FROM orders WHERE id = ?', (order_id,)).fetchone()
+    suma = turno.db.execute('SELECT SUM(qty * unit_price) FROM order_items WHERE order_id = ?', (order_id,)).fetchone()[0]
+    assert (total, status) == (suma, 'cerrada') and closed_at
+
+def test_orden_inexistente(turno):
+    assert turno.caja.post('/caja/cerrar/999999').status_code == 404
+
+def test_solo_el_mesero_dueno_modifica(turno, cliente):
+    order_id = turno.mesero.post('/mesero/crear-orden').json['order_id']
+    turno.mesero.post('/mesero/agregar-item', json={'order_id': order_id, 'product_id': 2, 'qty': 1})
+    otro = cliente('mesero')
+    otro.post('/mesero/enlazar-cocina', json={'codigo': turno.codigo})
+    assert otro.post(f'/mesero/cancelar-orden/{order_id}').status_code == 403
+    assert otro.post('/mesero/agregar-item', json={'order_id': order_id, 'product_id': 2, 'qty': 1}).status_code == 403
+
+    assert turno.mesero.post(f'/mesero/cancelar-orden/{order_id}').json['success']
+    assert turno.db.execute('SELECT COUNT(*) FROM order_items WHERE order_id = ?', (order_id,)).fetchone()[0] == 0
@@ -1,15 +1,14 @@
-import sqlite3
+import atexit
+import os
+import queue
 import random
 import string
+import threading
+import time
 from datetime import datetime
 from functools import wraps
-from flask import session, request, jsonify, redirect, url_for
-
-def get_db():
-    """Obtiene conexión a la base de datos"""
-    db = sqlite3.connect('taqueria.db')
-    db.row_factory = sqlite3.Row
-    return db
+from flask import session, request, jsonify, redirect, url_for, has_request_context
+from database import SHARD_DIR, connect, connect_orders
 
 def login_required(f):
     """Decorador para requerir login"""
@@ -35,15 +34,122 @@ def generar_codigo():
     """Genera un código único de 6 caracteres"""
     return ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
 
+# ============ AUDITORÍA ASÍNCRONA ============
+_STOP = object()
+
+class AuditWriter:
+    """Escribe el log de auditoría en segundo plano.
+
+    El request solo encola; un thread agrupa las entradas y las inserta con
+    executemany en una transacción cada `batch_size` entradas o cada
+    `flush_interval` segundos. Con SHARD_DIR las entradas de usuarios
+    enlazados a una cocina van al archivo de esa cocina.
+    """
+
+    def __init__(self, batch_size=100, flush_interval=0.25, max_queue=10000):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.dropped = 0
+        self.written = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._pid = None
+        self._queue = None
+        self._thread = None
+
+    def _ensure_started(self):
+        # Tras un fork (gunicorn) el thread del padre no existe en el hijo
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(maxsize=self.max_queue)
+            self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def enqueue(self, entry):
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        conns = {None: connect()}
+        q = self._queue
+        stop = False
+        while not stop:
+            item = q.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = q.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+            self._flush(conns, batch)
+        for conn in conns.values():
+            conn.close()
+
+    def _flush(self, conns, batch):
+        destinos = {}
+        for usuario, accion, detalle, timestamp, codigo in batch:
+            destinos.setdefault(codigo, []).append((usuario, accion, detalle, timestamp))
+        for codigo, filas in destinos.items():
+            try:
+                if codigo not in conns:
+                    conns[codigo] = connect_orders(codigo)
+                with conns[codigo] as conn:
+                    conn.executemany(
+                        'INSERT INTO audit_log (usuario, accion, detalle, timestamp) VALUES (?, ?, ?, ?)',
+                        filas
+                    )
+                self.written += len(filas)
+            except Exception as e:
+                self.errors += len(filas)
+                print(f"Error en audit_log: {e}")
+        for _ in batch:
+            self._queue.task_done()
+
+    def wait_idle(self):
+        """Bloquea hasta que todo lo encolado esté escrito"""
+        if self._pid == os.getpid():
+            self._queue.join()
+
+    def close(self, timeout=5):
+        """Vacía la cola y detiene el thread (atexit / worker_exit)"""
+        if self._pid != os.getpid() or not self._thread.is_alive():
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+
+    def stats(self):
+        return {
+            'queue_depth': self._queue.qsize() if self._pid == os.getpid() else 0,
+            'dropped': self.dropped,
+            'written': self.written,
+            'errors': self.errors,
+        }
+
+audit_writer = AuditWriter()
+atexit.register(audit_writer.close)
+
 def audit_log(usuario, accion, detalle=""):
-    """Registra una acción en el log de auditoría"""
-    try:
-        db = get_db()
-        db.execute(
-            'INSERT INTO audit_log (usuario, accion, detalle, timestamp) VALUES (?, ?, ?, ?)',
-            (usuario, accion, detalle, datetime.utcnow().isoformat())
-        )
-        db.commit()
-        db.close()
-    except Exception as e:
-        print(f"Error en audit_log: {e}")
+    """Registra una acción en el log de auditoría (solo encola)"""
+    codigo = session.get('codigo_cocina') if SHARD_DIR and has_request_context() else None
+    audit_writer.enqueue((usuario, accion, detalle, datetime.now().isoformat(), codigo))
@@ -0,0 +1,68 @@
+import os
+import threading
+import time
+import database
+from database import connect_orders, order_db_path
+
+class KitchenVersions:
+    """Versión por código de cocina para ETags, en memoria.
+
+    La tabla kitchen_versions la mantienen triggers en orders/order_items.
+    Se relee solo cuando PRAGMA data_version indica escrituras, revisándolo
+    como máximo una vez cada `check_interval` segundos o justo después de un
+    commit propio; un poll sin cambios cuesta una búsqueda en un dict.
+    """
+
+    def __init__(self, check_interval=0.2):
+        self.check_interval = check_interval
+        self.reloads = 0
+        self._fuentes = {}      # archivo de órdenes -> _Fuente
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def init_app(self, app):
+        database.commit_hooks.append(lambda db: self.invalidate())
+
+    def get(self, codigo):
+        fuente = self._fuente(codigo)
+        if time.monotonic() - fuente.checked >= self.check_interval:
+            with self._lock:
+                if time.monotonic() - fuente.checked >= self.check_interval:
+                    self._refrescar(fuente)
+        return fuente.versions.get(codigo, 0)
+
+    def _fuente(self, codigo):
+        if self._pid != os.getpid():
+            # Tras un fork las conexiones del padre no sirven
+            self._fuentes = {}
+            self._pid = os.getpid()
+        path = order_db_path(codigo)
+        fuente = self._fuentes.get(path)
+        if fuente is None:
+            with self._lock:
+                fuente = self._fuentes.get(path)
+                if fuente is None:
+                    fuente = self._fuentes[path] = _Fuente(connect_orders(codigo))
+        return fuente
+
+    def _refrescar(self, fuente):
+        data_version = fuente.conn.execute('PRAGMA data_version').fetchone()[0]
+        if data_version != fuente.data_version:
+            rows = fuente.conn.execute('SELECT codigo_cocina, version FROM kitchen_versions').fetchall()
+            fuente.versions = {row['codigo_cocina']: row['version'] for row in rows}
+            fuente.data_version = data_version
+            self.reloads += 1
+        fuente.checked = time.monotonic()
+
+    def invalidate(self):
+        for fuente in list(self._fuentes.values()):
+            fuente.checked = 0.0
+
+class _Fuente:
+    def __init__(self, conn):
+        self.conn = conn
+        self.data_version = None
+        self.checked = 0.0
+        self.versions = {}
+
+versions = KitchenVersions()